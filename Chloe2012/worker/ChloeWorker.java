@@ -0,0 +1,47 @@
+/*
+ * Chloe - landscape metrics
+ *
+ * Long-lived Chloe process used by the QGIS plugin (ChloeWorker.py).
+ *
+ * Reads one properties file path per line on stdin and runs it through the
+ * regular Chloe batch entry point, so the JVM start-up and class loading are
+ * paid once per session instead of once per run. The Chloe console output
+ * (including the "## n/total" progress lines) is forwarded unchanged, and
+ * every job is terminated by a "##worker done <status>" line.
+ *
+ * Launched in source-file mode (Java 11+), no compilation step is needed :
+ *   java -cp bin/chloe-4.0.jar worker/ChloeWorker.java
+ */
+
+import java.io.BufferedReader;
+import java.io.InputStreamReader;
+
+public class ChloeWorker {
+
+    public static void main(String[] args) throws Exception {
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        System.out.println("##worker ready");
+        System.out.flush();
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            line = line.trim();
+            if (line.isEmpty()) {
+                continue;
+            }
+            if (line.equals("##quit")) {
+                break;
+            }
+            int status = 0;
+            try {
+                fr.inra.sad.bagap.chloe.Main.main(new String[] { line });
+            } catch (Throwable t) {
+                t.printStackTrace(System.out);
+                status = 1;
+            }
+            System.err.flush();
+            System.out.println("##worker done " + status);
+            System.out.flush();
+        }
+    }
+}
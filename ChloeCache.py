@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import glob
+import time
+import json
+import shutil
+import hashlib
+import tempfile
+
+from qgis.core import QgsApplication
+from processing.core.ProcessingConfig import ProcessingConfig
+
+from .ChloeUtils import ChloeUtils
+
+
+class ChloeCache:
+  """Content addressed cache of Chloe results
+
+  The key of a run is the hash of its properties (timestamp comment and output paths
+  excluded), of the size, mtime and content of its input files and of the Chloe jar.
+  Each entry is a folder of the cache directory holding the outputs of the run and a
+  manifest; the least recently used entries are removed to stay in the disk budget.
+
+  Usage in processAlgorithm:
+
+      cache = ChloeCache(self.f_path)
+      if not cache.fetch(progress):     # copy the outputs of an identical run
+          ChloeUtils.runChole(commands, progress, lambda status: cache.store(progress, status))
+  """
+
+  CACHE_SIZE = 'CHLOE_CACHE_SIZE'  # Disk budget of the results cache in MB, 0 to disable
+
+  MANIFEST = 'manifest.json'
+
+  # Properties holding the path of an input file
+  INPUT_KEYS = ['input_ascii', 'input_csv', 'input_shapefile', 'friction', 'cluster_friction',
+                'pixels', 'points', 'overlaying_matrix', 'ascii_filter', 'lookup_table']
+
+  # Properties holding the path of an output, they are not part of the key
+  OUTPUT_FILE_KEYS = ['output_csv', 'output_asc']
+  OUTPUT_FOLDER_KEY = 'output_folder'
+
+  _hashes = {}  # content hash by (path, size, mtime), avoid reading big rasters at each run
+
+  def __init__(self, f_properties):
+    self.f_properties = f_properties
+    self.started      = time.time()   # outputs of a folder are the files written after this
+    self.budget       = ChloeCache.getCacheSize() * 1024 * 1024
+    self.key          = None
+    if self.budget > 0:
+      try:
+        self.properties = ChloeUtils.readProperties(f_properties)
+        self.key = ChloeCache.getKey(self.properties)
+      except (IOError, OSError, ValueError):
+        self.key = None   # missing input or unreadable property, let Chloe report the error
+
+  @staticmethod
+  def getCacheSize():
+    try:
+      return max(0, int(ProcessingConfig.getSetting(ChloeCache.CACHE_SIZE) or 0))
+    except ValueError:
+      return 0
+
+  @staticmethod
+  def getCacheDir():
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), 'chloe_cache')
+
+  @staticmethod
+  def getFileHash(f_path):
+    """Content hash of a file, memorized for the session by size and mtime"""
+    stat = os.stat(f_path)
+    memo = (f_path, stat.st_size, stat.st_mtime)
+    if memo not in ChloeCache._hashes:
+      sha = hashlib.sha1()
+      with open(f_path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(1024 * 1024), b''):
+          sha.update(chunk)
+      ChloeCache._hashes[memo] = sha.hexdigest()
+    return '{}:{}:{}'.format(stat.st_size, stat.st_mtime, ChloeCache._hashes[memo])
+
+  @staticmethod
+  def getInputFiles(key, value):
+    """Files read by Chloe for an input property"""
+    files = [path.strip() for path in value.strip('{}').split(';') if path.strip()]
+    if key == 'input_shapefile':
+      # the attributes are read in the side files (.dbf, .shx, ...)
+      files = sorted(glob.glob(os.path.splitext(files[0])[0] + '.*')) if files else []
+    return files
+
+  @staticmethod
+  def toBytes(text):
+    """Bytes of a property or path for the hash: read from the properties they are already
+    bytes (possibly not ASCII, like an accented path), only unicode is encoded"""
+    return text.encode('utf-8') if isinstance(text, unicode) else text
+
+  @staticmethod
+  def getKey(properties, ignored_keys=()):
+    """Hash of a run: properties without outputs, inputs fingerprints and Chloe jar
+
+    ignored_keys are other properties left out of the hash.
+    """
+    sha = hashlib.sha1()
+    for key in sorted(properties):
+      if (key in ChloeCache.OUTPUT_FILE_KEYS or key == ChloeCache.OUTPUT_FOLDER_KEY
+          or key in ignored_keys):
+        continue
+      sha.update(ChloeCache.toBytes(key) + b'=' + ChloeCache.toBytes(properties[key]) + b'\n')
+      if key in ChloeCache.INPUT_KEYS:
+        for f_input in ChloeCache.getInputFiles(key, properties[key]):
+          sha.update(ChloeCache.toBytes(f_input) + b'=' + ChloeCache.getFileHash(f_input).encode('utf-8') + b'\n')
+
+    f_jar = os.path.join(os.path.dirname(__file__), 'Chloe2012', 'bin', 'chloe-4.0.jar')
+    if os.path.isfile(f_jar):
+      stat = os.stat(f_jar)
+      sha.update('chloe={}:{}\n'.format(stat.st_size, stat.st_mtime).encode('utf-8'))
+    return sha.hexdigest()
+
+  def getEntryDir(self):
+    return os.path.join(ChloeCache.getCacheDir(), self.key)
+
+  def getOutputs(self):
+    """Outputs of the run, list of (name in the cache entry, path)"""
+    outputs = []
+    for key in ChloeCache.OUTPUT_FILE_KEYS:
+      if self.properties.get(key):
+        outputs.append((key, self.properties[key]))
+
+    folder = self.properties.get(ChloeCache.OUTPUT_FOLDER_KEY)
+    if folder and os.path.isdir(folder):
+      for name in sorted(os.listdir(folder)):
+        f_out = os.path.join(folder, name)
+        if (os.path.isfile(f_out)
+            and os.path.abspath(f_out) != os.path.abspath(self.f_properties)
+            and os.path.getmtime(f_out) >= self.started):
+          outputs.append(('folder' + os.sep + name, f_out))
+    return outputs
+
+  def fetch(self, progress):
+    """Copy the outputs of a cached identical run, return False on a cache miss"""
+    if self.key is None:
+      return False
+
+    entry_dir = self.getEntryDir()
+    f_manifest = os.path.join(entry_dir, ChloeCache.MANIFEST)
+    if not os.path.isfile(f_manifest):
+      return False
+
+    with open(f_manifest) as fd:
+      names = json.load(fd)
+
+    folder = self.properties.get(ChloeCache.OUTPUT_FOLDER_KEY)
+    try:
+      for name in names:
+        if name.startswith('folder' + os.sep):
+          if not folder:
+            return False
+          f_out = os.path.join(folder, name[len('folder' + os.sep):])
+        elif self.properties.get(name):
+          f_out = self.properties[name]
+        else:
+          continue   # output not requested by this run
+        if os.path.dirname(f_out) and not os.path.isdir(os.path.dirname(f_out)):
+          os.makedirs(os.path.dirname(f_out))
+        # copied, a hardlink would let a later run overwrite the cached file
+        shutil.copyfile(os.path.join(entry_dir, name), f_out)
+    except (IOError, OSError) as e:
+      progress.setInfo(u'Chloe cache entry {} is unusable ({}), running Chloe'.format(self.key, e))
+      shutil.rmtree(entry_dir, ignore_errors=True)
+      return False
+
+    os.utime(entry_dir, None)   # most recently used
+    progress.setInfo(u'Outputs copied from the Chloe cache ({})'.format(self.key))
+    progress.setPercentage(100)
+    return True
+
+  def store(self, progress=None, status=0):
+    """Save the outputs of the run in the cache, then apply the disk budget
+
+    status is the exit status of the run, the outputs of a failed run are not cached.
+    """
+    if self.key is None or status != 0 or ChloeUtils.isBatchStarted():
+      return   # disabled, failed, or the job is only queued in a batch
+
+    outputs = self.getOutputs()
+    for name, f_out in outputs:
+      # a missing or old output means that Chloe failed, nothing to cache
+      if not os.path.isfile(f_out) or os.path.getmtime(f_out) < self.started:
+        return
+    if not outputs:
+      return
+
+    cache_dir = ChloeCache.getCacheDir()
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+
+    # The entry is written aside then renamed, an interrupted store leaves no partial entry
+    tmp_dir = tempfile.mkdtemp(prefix='tmp_', dir=cache_dir)
+    try:
+      os.makedirs(os.path.join(tmp_dir, 'folder'))
+      for name, f_out in outputs:
+        shutil.copyfile(f_out, os.path.join(tmp_dir, name))
+      with open(os.path.join(tmp_dir, ChloeCache.MANIFEST), 'w') as fd:
+        json.dump([name for name, f_out in outputs], fd)
+      shutil.rmtree(self.getEntryDir(), ignore_errors=True)
+      os.rename(tmp_dir, self.getEntryDir())
+    except (IOError, OSError) as e:
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+      if progress is not None:
+        progress.setInfo(u'Unable to store the outputs in the Chloe cache: {}'.format(e))
+      return
+
+    ChloeCache.evict(self.budget)
+
+  @staticmethod
+  def getDirSize(directory):
+    size = 0
+    for root, dirs, files in os.walk(directory):
+      for name in files:
+        size += os.path.getsize(os.path.join(root, name))
+    return size
+
+  @staticmethod
+  def evict(budget):
+    """Remove the least recently used entries until the cache fits in budget bytes"""
+    cache_dir = ChloeCache.getCacheDir()
+    entries = []
+    for name in os.listdir(cache_dir):
+      entry_dir = os.path.join(cache_dir, name)
+      if os.path.isdir(entry_dir) and not name.startswith('tmp_'):
+        entries.append((os.path.getmtime(entry_dir), ChloeCache.getDirSize(entry_dir), entry_dir))
+
+    total = sum(size for used, size, entry_dir in entries)
+    for used, size, entry_dir in sorted(entries):
+      if total <= budget:
+        break
+      shutil.rmtree(entry_dir, ignore_errors=True)
+      total -= size
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+
+from processing.core.ProcessingConfig import ProcessingConfig
+
+from .ChloeUtils import ChloeUtils
+from .engine.sliding_engine import SlidingEngine
+from .engine.grid_engine import GridEngine
+from .engine.map_engine import MapEngine
+from .engine.cluster_engine import ClusterEngine
+from .engine.distance_engine import DistanceEngine
+from .engine.search_and_replace_engine import SearchAndReplaceEngine
+from .engine.classification_engine import ClassificationEngine
+from .engine.overlay_engine import OverlayEngine
+from .engine.filter_engine import FilterEngine
+from .engine.from_csv_engine import FromCsvEngine
+from .engine.from_shapefile_engine import FromShapefileEngine
+from .engine.selected_engine import SelectedEngine
+
+
+class ChloeEngine:
+  """Native (NumPy) computation of the properties files, without starting Chloe
+
+  Each engine of the engine package computes a treatment for the options and metrics
+  it supports and writes the same outputs as Chloe; anything else is run by Chloe.
+
+  Usage in processAlgorithm:
+
+      if not ChloeEngine.run(self.f_path, progress):   # computed natively if supported
+          ChloeUtils.runChole(commands, progress)
+  """
+
+  NATIVE_ENGINE = 'CHLOE_NATIVE_ENGINE'  # Compute the supported treatments without the JVM
+
+  # Engine by treatment
+  ENGINES = {
+    'sliding':            SlidingEngine,
+    'grid':               GridEngine,
+    'map':                MapEngine,
+    'cluster':            ClusterEngine,
+    'distance':           DistanceEngine,
+    'search and replace': SearchAndReplaceEngine,
+    'classification':     ClassificationEngine,
+    'overlay':            OverlayEngine,
+    'filter':             FilterEngine,
+    'from csv':           FromCsvEngine,
+    'from shapefile':     FromShapefileEngine,
+    'selected':           SelectedEngine,
+  }
+
+  # Properties holding an output path, or the folder of the outputs
+  OUTPUT_KEYS = ['output_csv', 'output_asc', 'output_folder']
+
+  @staticmethod
+  def isEnabled():
+    return bool(ProcessingConfig.getSetting(ChloeEngine.NATIVE_ENGINE))
+
+  @staticmethod
+  def getOutputFiles(properties):
+    """Files of the output folders of a run, by path: (size, mtime)"""
+    folders = set()
+    for key in ChloeEngine.OUTPUT_KEYS:
+      if properties.get(key):
+        path = os.path.abspath(properties[key])
+        folders.add(path if key == 'output_folder' else os.path.dirname(path))
+
+    files = {}
+    for folder in folders:
+      if os.path.isdir(folder):
+        for name in os.listdir(folder):
+          f_out = os.path.join(folder, name)
+          if os.path.isfile(f_out):
+            stat = os.stat(f_out)
+            files[f_out] = (stat.st_size, stat.st_mtime)
+    return files
+
+  @staticmethod
+  def removeOutputs(properties, previous):
+    """Remove the files written in the output folders since the previous getOutputFiles"""
+    for f_out, stat in ChloeEngine.getOutputFiles(properties).items():
+      if previous.get(f_out) != stat:
+        try:
+          os.remove(f_out)
+        except OSError:
+          pass
+
+  @staticmethod
+  def run(f_properties, progress):
+    """Run a properties file with the native engine of its treatment
+
+    Return False when the engine is disabled or does not support the properties,
+    the caller then runs Chloe as usual.
+    """
+    if not ChloeEngine.isEnabled():
+      return False
+
+    properties = ChloeUtils.readProperties(f_properties)
+    engine = ChloeEngine.ENGINES.get(properties.get('treatment'))
+    if engine is None:
+      return False
+
+    try:
+      reason = engine.check(properties)
+    except (IOError, OSError, ValueError, KeyError) as e:
+      reason = u'unreadable properties or input ({})'.format(e)
+    if reason is not None:
+      progress.setInfo(u'Native engine: {}, running Chloe'.format(reason))
+      return False
+
+    progress.setInfo(u'Running the {} treatment with the native engine'.format(properties['treatment']))
+    previous = ChloeEngine.getOutputFiles(properties)
+    try:
+      engine.run(properties, progress)
+    except MemoryError:
+      ChloeEngine.removeOutputs(properties, previous)
+      progress.setInfo(u'Native engine: not enough memory, running Chloe')
+      return False
+    except (IOError, OSError, ValueError, KeyError) as e:
+      # invalid data found after check (a bad record of a csv), unreadable input...
+      # Chloe rewrites every output, the partial ones are removed
+      ChloeEngine.removeOutputs(properties, previous)
+      progress.setInfo(u'Native engine: {}, running Chloe'.format(e))
+      return False
+    return True
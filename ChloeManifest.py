@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import re
+import json
+
+from processing.core.ProcessingConfig import ProcessingConfig
+
+from .ChloeUtils import ChloeUtils
+from .ChloeCache import ChloeCache
+
+
+class ChloeManifest:
+  """Run manifest of the output folder of a multi sizes algorithm
+
+  The manifest records, for every window/grid size, the metrics computed and the
+  output files written (with their size and mtime), under the hash of the run
+  properties (sizes and metrics excluded) and of its inputs. A rerun of the same
+  configuration only submits the sizes and metrics whose outputs are missing.
+  """
+
+  INCREMENTAL = 'CHLOE_INCREMENTAL'  # Skip the sizes/metrics already produced in the output folder
+
+  FILENAME = 'chloe_manifest.json'
+
+  OUTPUT_EXTENSIONS = ('.asc', '.csv')   # outputs of Chloe, the .prj files are written by the plugin
+
+  # Keys of the job, they do not change the outputs of a given size and metric
+  JOB_KEYS = ['window_sizes', 'grid_sizes', 'metrics']
+
+  def __init__(self, f_properties):
+    properties  = ChloeUtils.readProperties(f_properties)
+    self.folder = properties[ChloeCache.OUTPUT_FOLDER_KEY]
+    self.key    = ChloeCache.getKey(properties, ChloeManifest.JOB_KEYS)
+    self.sizes  = {}
+
+    f_manifest = os.path.join(self.folder, ChloeManifest.FILENAME)
+    if os.path.isfile(f_manifest):
+      try:
+        with open(f_manifest) as fd:
+          manifest = json.load(fd)
+        if manifest.get('key') == self.key:
+          self.sizes = manifest.get('sizes', {})
+      except ValueError:
+        pass    # corrupted manifest, everything is recomputed
+
+  @staticmethod
+  def isEnabled():
+    return bool(ProcessingConfig.getSetting(ChloeManifest.INCREMENTAL))
+
+  @staticmethod
+  def splitMetrics(metrics):
+    return [metric.strip() for metric in metrics.split(';') if metric.strip()]
+
+  def isValid(self, size):
+    """Check that the recorded outputs of a size are still the ones written by Chloe"""
+    for name, (length, mtime) in self.sizes[size]['files'].items():
+      f_out = os.path.join(self.folder, name)
+      if not os.path.isfile(f_out) or os.path.getsize(f_out) != length or os.path.getmtime(f_out) != mtime:
+        return False
+    return True
+
+  def getMissingMetrics(self, size, metrics):
+    """Metrics (list) of a size which have no valid output yet"""
+    if size in self.sizes and self.isValid(size):
+      done = self.sizes[size]['metrics']
+      return [metric for metric in metrics if metric not in done]
+    return list(metrics)
+
+  def getSizeFiles(self, size):
+    """Outputs of a size in the folder, Chloe suffixes them with _w<size> or _g<size>
+
+    Only the .asc and .csv files written by Chloe are returned: the .prj sidecars are
+    rewritten by the plugin after every run and would invalidate the size.
+    """
+    regex = re.compile(r'_[wg]' + re.escape(size) + r'(_|\.)')
+    return [name for name in os.listdir(self.folder)
+            if regex.search(name) and name.lower().endswith(ChloeManifest.OUTPUT_EXTENSIONS)
+            and os.path.isfile(os.path.join(self.folder, name))]
+
+  def getCsv(self, size):
+    """Csv output of a recorded size (None if there is none)"""
+    if size in self.sizes:
+      for name in self.sizes[size]['files']:
+        if name.lower().endswith('.csv'):
+          return os.path.join(self.folder, name)
+    return None
+
+  def setDone(self, size, metrics):
+    """Record the metrics of a size as computed and save the manifest"""
+    files = {}
+    for name in self.getSizeFiles(size):
+      f_out = os.path.join(self.folder, name)
+      files[name] = [os.path.getsize(f_out), os.path.getmtime(f_out)]
+
+    self.sizes[size] = {'metrics': metrics, 'files': files}
+    self.save()
+
+  def save(self):
+    f_manifest = os.path.join(self.folder, ChloeManifest.FILENAME)
+    f_tmp = f_manifest + '.tmp'
+    with open(f_tmp, 'w') as fd:
+      json.dump({'key': self.key, 'sizes': self.sizes}, fd, indent=1, sort_keys=True)
+    if os.path.isfile(f_manifest):
+      os.remove(f_manifest)   # os.rename does not replace a file on Windows
+    os.rename(f_tmp, f_manifest)
+
+  @staticmethod
+  def mergeCsv(f_previous, f_csv):
+    """Add to f_csv the metrics columns of f_previous it does not have
+
+    Both files are written by Chloe for the same grid, so their lines share the same X;Y.
+    Return False (f_csv left unchanged) if they do not match.
+    """
+    with open(f_previous) as fd:
+      previous = fd.read().splitlines()
+    with open(f_csv) as fd:
+      current = fd.read().splitlines()
+    if len(previous) != len(current) or not previous:
+      return False
+
+    titles = previous[0].split(';')
+    kept = [i for i, title in enumerate(titles) if title not in current[0].split(';')]
+    lines = []
+    for line_previous, line in zip(previous, current):
+      values = line_previous.split(';')
+      if values[:2] != line.split(';')[:2]:
+        return False    # not the same X;Y
+      lines.append(';'.join([line] + [values[i] for i in kept]))
+
+    with open(f_csv, 'w') as fd:
+      fd.write('\n'.join(lines) + '\n')
+    return True
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import math
+import itertools
+import shutil
+import tempfile
+
+from processing.core.ProcessingConfig import ProcessingConfig
+from processing.tools.system import isWindows
+
+from .ChloeUtils import ChloeUtils
+
+
+class ChloeTiling:
+  """Tiled execution of the sliding treatment for rasters too large for the JVM heap
+
+  The input ascii grid is cut in strips of rows, every strip is extended by a halo of
+  max(window_sizes) // 2 rows on each side so that the windows of its own rows are complete.
+  Each strip is run as an independent Chloe job, then the halos are cropped and the
+  ascii/csv outputs are mosaicked back in the final outputs.
+  """
+
+  TILE_ROWS = 'CHLOE_TILE_ROWS'  # Rows per tile for the sliding treatment, 0 for no tiling
+
+  OUTPUT_KEYS = ['output_csv', 'output_asc', 'output_folder']
+
+  @staticmethod
+  def getTileRows():
+    try:
+      return max(0, int(ProcessingConfig.getSetting(ChloeTiling.TILE_ROWS) or 0))
+    except ValueError:
+      return 0
+
+  @staticmethod
+  def getTiles(nrows, tile_rows, halo):
+    """Split nrows in tiles, return a list of (halo start, start, end, halo end) row indexes"""
+    tiles = []
+    for start in range(0, nrows, tile_rows):
+      end = min(start + tile_rows, nrows)
+      tiles.append((max(0, start - halo), start, end, min(nrows, end + halo)))
+    return tiles
+
+  @staticmethod
+  def readAsciiHeader(fd):
+    """Read the header of an opened ascii grid
+
+    Return (header, header_lines, first): header values by lower case key,
+    the raw header lines and the first line of data.
+    """
+    header = {}
+    header_lines = []
+    first = ''
+    for line in fd:
+      tokens = line.split()
+      if len(tokens) == 2 and tokens[0][0].isalpha():
+        header[tokens[0].lower()] = tokens[1]
+        header_lines.append(line.rstrip('\r\n'))
+      else:
+        first = line
+        break
+    return header, header_lines, first
+
+  @staticmethod
+  def getAsciiHeader(f_asc):
+    with open(f_asc) as fd:
+      header, header_lines, first = ChloeTiling.readAsciiHeader(fd)
+    return header, header_lines
+
+  @staticmethod
+  def readAscii(f_asc):
+    """Read an ascii grid
+
+    Return (header, header_lines, rows), rows is a generator of the grid rows
+    (one text line per row, whatever the line wrapping of the file).
+    """
+    fd = open(f_asc)
+    header, header_lines, first = ChloeTiling.readAsciiHeader(fd)
+    ncols = int(header['ncols'])
+
+    def rows():
+      tokens = []
+      try:
+        for line in itertools.chain([first], fd):
+          if not tokens:
+            values = line.split()
+            if len(values) == ncols:          # usual case, one row per line
+              yield line.rstrip('\r\n')
+              continue
+            tokens = values
+          else:
+            tokens.extend(line.split())
+          while len(tokens) >= ncols:
+            yield ' '.join(tokens[:ncols])
+            tokens = tokens[ncols:]
+      finally:
+        fd.close()
+
+    return header, header_lines, rows()
+
+  @staticmethod
+  def getTop(header):
+    """Y coordinate of the top edge of a grid"""
+    cellsize = float(header['cellsize'])
+    if 'yllcorner' in header:
+      bottom = float(header['yllcorner'])
+    else:
+      bottom = float(header['yllcenter']) - cellsize / 2
+    return bottom + int(header['nrows']) * cellsize
+
+  @staticmethod
+  def replaceHeader(header_lines, key, value):
+    """Return the header lines with the value of key (ignoring case) replaced"""
+    result = []
+    for line in header_lines:
+      if line.split()[0].lower() == key:
+        result.append(line.split()[0] + ' ' + value)
+      else:
+        result.append(line)
+    return result
+
+  @staticmethod
+  def splitAscii(f_asc, tiles, f_tiles):
+    """Write every tile (halo included) of an ascii grid in a single streaming pass"""
+    header, header_lines, rows = ChloeTiling.readAscii(f_asc)
+    nrows    = int(header['nrows'])
+    cellsize = float(header['cellsize'])
+    yll_key  = 'yllcorner' if 'yllcorner' in header else 'yllcenter'
+    yll      = float(header[yll_key])
+
+    opened = {}
+    for r, row in enumerate(rows):
+      for i, (ext_start, start, end, ext_end) in enumerate(tiles):
+        if ext_start <= r < ext_end:
+          if i not in opened:
+            lines = ChloeTiling.replaceHeader(header_lines, 'nrows', str(ext_end - ext_start))
+            lines = ChloeTiling.replaceHeader(lines, yll_key, repr(yll + (nrows - ext_end) * cellsize))
+            opened[i] = open(f_tiles[i], 'w')
+            opened[i].write('\n'.join(lines) + '\n')
+          opened[i].write(row + '\n')
+          if r == ext_end - 1:
+            opened.pop(i).close()
+
+    for fd in opened.values():
+      fd.close()
+
+  @staticmethod
+  def mergeAscii(f_tiles, tiles, f_out):
+    """Crop the halo of every tile output and write the mosaic"""
+    # The last tile shares the bottom edge (yllcorner) of the whole grid
+    header, header_lines = ChloeTiling.getAsciiHeader(f_tiles[-1])
+    header_lines = ChloeTiling.replaceHeader(header_lines, 'nrows', str(tiles[-1][2]))
+
+    with open(f_out, 'w') as out:
+      out.write('\n'.join(header_lines) + '\n')
+      for i, f_tile in enumerate(f_tiles):
+        header, tile_header_lines, rows = ChloeTiling.readAscii(f_tile)
+        ext_start, start, end, ext_end = tiles[i]
+        for r, row in enumerate(rows):
+          if start - ext_start <= r < end - ext_start:
+            out.write(row + '\n')
+
+  @staticmethod
+  def mergeCsv(f_tiles, tiles, top, cellsize, f_out):
+    """Keep the csv lines of every tile whose Y falls in the tile own rows"""
+    with open(f_out, 'w') as out:
+      for i, f_tile in enumerate(f_tiles):
+        ext_start, start, end, ext_end = tiles[i]
+        with open(f_tile) as fd:
+          title = fd.readline()
+          if i == 0:
+            out.write(title)
+          iy = [column.strip().strip('"') for column in title.split(';')].index('Y')
+          for line in fd:
+            y = float(line.split(';')[iy].strip('"'))
+            r = int(math.floor((top - y) / cellsize))
+            if start <= r < end:
+              out.write(line)
+
+  @staticmethod
+  def writeTileProperties(f_properties, f_tile_properties, replacements):
+    """Copy a properties file replacing some keys"""
+    with open(f_properties) as fd, open(f_tile_properties, 'w') as out:
+      for line in fd:
+        key = line.split('=', 1)[0].strip()
+        if key in replacements:
+          out.write(ChloeUtils.formatString(key + '=' + replacements.pop(key) + "\n", isWindows()))
+        else:
+          out.write(line)
+      for key, value in replacements.items():
+        out.write(ChloeUtils.formatString(key + '=' + value + "\n", isWindows()))
+
+  @staticmethod
+  def runTiled(f_properties, progress):
+    """Run a sliding properties file tile by tile
+
+    Return False when tiling is disabled or does not apply, or when a tile failed:
+    the caller then runs Chloe as usual on the whole grid.
+    """
+    tile_rows = ChloeTiling.getTileRows()
+    if tile_rows <= 0:
+      return False
+
+    # In a batch the tiles could not be mosaicked, the whole job is queued by runChole
+    if ChloeUtils.isBatchStarted():
+      return False
+
+    properties = ChloeUtils.readProperties(f_properties)
+    if properties.get('treatment') != 'sliding':
+      return False
+
+    # The halo only guarantees identical results for square/circle windows on the input grid
+    if (properties.get('shape', 'SQUARE') == 'FUNCTIONAL'
+        or properties.get('delta_displacement', '1') != '1'
+        or properties.get('interpolation', 'false') == 'true'):
+      progress.setInfo('Tiling is only available for SQUARE/CIRCLE windows without displacement nor interpolation')
+      return False
+
+    f_input = properties['input_ascii']
+    header, header_lines = ChloeTiling.getAsciiHeader(f_input)
+    nrows = int(header['nrows'])
+    if nrows <= tile_rows:
+      return False
+
+    sizes = [int(size) for size in ChloeUtils.splitSizes(properties['window_sizes'].strip('{}'))]
+    halo  = max(sizes) // 2
+    tiles = ChloeTiling.getTiles(nrows, tile_rows, halo)
+    progress.setInfo('Running {} tiles of {} rows (halo {} rows)'.format(len(tiles), tile_rows, halo))
+
+    tmp_dir = tempfile.mkdtemp(prefix='chloe_tiles')
+    try:
+      # === Tiles inputs and properties
+      f_inputs = []
+      f_jobs = []
+      out_dirs = []
+      for i in range(len(tiles)):
+        tile_dir = os.path.join(tmp_dir, 'tile_{}'.format(i))
+        out_dir  = os.path.join(tile_dir, 'out')
+        os.makedirs(out_dir)
+        # keep the input name, Chloe names its outputs after it
+        f_inputs.append(os.path.join(tile_dir, os.path.basename(f_input)))
+        out_dirs.append(out_dir)
+
+        replacements = {'input_ascii': f_inputs[-1]}
+        for key in ChloeTiling.OUTPUT_KEYS:
+          if properties.get(key):
+            if key == 'output_folder':
+              replacements[key] = out_dir
+            else:
+              replacements[key] = os.path.join(out_dir, os.path.basename(properties[key]))
+        f_jobs.append(os.path.join(tile_dir, 'tile.properties'))
+        ChloeTiling.writeTileProperties(f_properties, f_jobs[-1], replacements)
+
+      ChloeTiling.splitAscii(f_input, tiles, f_inputs)
+
+      # === Tiles execution
+      max_jobs = ChloeUtils.getParallelJobsCount(len(f_jobs))
+      if max_jobs > 1:
+        statuses = ChloeUtils.runCholeParallel(f_jobs, progress, max_jobs)
+      else:
+        statuses = ChloeUtils.runCholeBatch(f_jobs, progress)
+      # a tile which failed or did not write every output would leave a hole or a stale strip
+      outputs = [set(os.listdir(out_dir)) for out_dir in out_dirs]
+      names = set.union(*outputs)
+      failed = [str(i) for i, (status, output) in enumerate(zip(statuses, outputs))
+                if status != 0 or output != names or not output]
+      if failed:
+        progress.setInfo('Chloe failed for tile(s) ' + ', '.join(failed) + ', running Chloe on the whole grid')
+        return False
+
+      # === Mosaic
+      destinations = {}
+      for key in ['output_csv', 'output_asc']:
+        if properties.get(key):
+          destinations[os.path.basename(properties[key])] = properties[key]
+      dest_dir = properties.get('output_folder') or os.path.dirname(properties.get('output_asc') or properties.get('output_csv'))
+
+      top = ChloeTiling.getTop(header)
+      cellsize = float(header['cellsize'])
+      for name in sorted(names):
+        f_out = destinations.get(name, os.path.join(dest_dir, name))
+        f_tiles = [os.path.join(out_dir, name) for out_dir in out_dirs]
+        ext = os.path.splitext(name)[1].lower()
+        if ext == '.asc':
+          ChloeTiling.mergeAscii(f_tiles, tiles, f_out)
+        elif ext == '.csv':
+          ChloeTiling.mergeCsv(f_tiles, tiles, top, cellsize, f_out)
+        else:
+          shutil.copyfile(f_tiles[0], f_out)
+    finally:
+      shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return True
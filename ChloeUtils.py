@@ -31,6 +31,11 @@ import re
 
 import platform
 import copy
+import shutil
+import tempfile
+import threading
+import multiprocessing
+import Queue
 
 from osgeo import gdal
 import numpy as np
@@ -38,25 +43,180 @@ import math
 
 from qgis.PyQt.QtCore import QSettings
 from qgis.PyQt.QtGui import QColor
-from qgis.core import QgsApplication, QgsVectorFileWriter, QgsColorRampShader, QgsSingleBandPseudoColorRenderer, QgsRasterShader, QgsRasterBandStats 
+from qgis.core import QgsApplication, QgsCoordinateTransform, QgsVectorFileWriter, QgsColorRampShader, QgsSingleBandPseudoColorRenderer, QgsRasterShader, QgsRasterBandStats 
 from processing.core.ProcessingLog import ProcessingLog
 from processing.core.ProcessingConfig import ProcessingConfig
 from processing.core.SilentProgress import SilentProgress
 from processing.tools.system import isWindows, isMac
 from processing.core.parameters import ParameterFile
+from processing.tools import dataobjects, vector
 from processing.core.outputs import OutputRaster
 from jinja2 import Template
 
+from .ChloeWorker import ChloeWorker, ChloeWorkerError
+
 
 class ChloeUtils:
   """Generic class to call subprocess"""
 
   JAVA = 'JAVA'  # Path java.exe in windows
-   
+  JAVA_WORKER = 'CHLOE_JAVA_WORKER'  # Keep one Chloe JVM alive for the session
+  JAVA_HEAP = 'CHLOE_JAVA_HEAP'  # Maximum heap (MB) of a Chloe JVM, 0 for java default
+  PARALLEL_JOBS = 'CHLOE_PARALLEL_JOBS'  # Maximum Chloe jobs run together, 0 for automatic
+
+  DEFAULT_JOB_MEMORY = 2048  # MB, heap given to Chloe by chloe.sh
+
+  batchJobs = None  # properties files collected between startBatch and endBatch
+
+  PROGRESS_REGEX = re.compile(r'^\s*##\s*(?P<percentage>\d+)\s*\/\s*\d+\s*$')
+
   @staticmethod
-  def runChole(commands, progress=None):
-    cwd=os.path.dirname(__file__) + os.sep + 'Chloe2012'
-    
+  def handleOutputLine(line, progress, loglines):
+    """Dispatch a Chloe console line to the progress object and the log"""
+    res = ChloeUtils.PROGRESS_REGEX.search(line)
+    if res:
+      percentage = int(res.group('percentage'))
+      progress.setPercentage(percentage)
+    else:
+      progress.setConsoleInfo(line)
+    loglines.append(line)
+
+  @staticmethod
+  def getJavaCommands(f_properties):
+    """Get the one-shot java command running a properties file"""
+    # If JAVA provider parameter in defined use it (Typical Windows Case), else use simple 'java' command (Linux Case)
+    java = ProcessingConfig.getSetting(ChloeUtils.JAVA)
+    if java:
+      arguments = ['"'+java+'"']
+    else:
+      arguments = ['java']
+    heap = ChloeUtils.getJavaHeap()
+    if heap:
+      arguments.append('-Xmx{}m'.format(heap))
+    arguments.append('-jar')
+    arguments.append('bin' + os.sep + 'chloe-4.0.jar')
+    arguments.append('"'+f_properties+'"')
+    return arguments
+
+  @staticmethod
+  def getJavaHeap():
+    """Return the maximum heap (MB) set in the provider settings, 0 if not set"""
+    try:
+      return max(0, int(ProcessingConfig.getSetting(ChloeUtils.JAVA_HEAP) or 0))
+    except ValueError:
+      return 0
+
+  @staticmethod
+  def getAvailableMemory():
+    """Return the available physical memory in MB, None if unknown"""
+    try:
+      import psutil
+      return int(psutil.virtual_memory().available / (1024 * 1024))
+    except ImportError:
+      pass
+
+    if os.path.isfile('/proc/meminfo'):
+      with open('/proc/meminfo') as fd:
+        for line in fd:
+          if line.startswith('MemAvailable:'):
+            return int(line.split()[1]) // 1024
+
+    if isWindows():
+      import ctypes
+
+      class MEMORYSTATUSEX(ctypes.Structure):
+        _fields_ = [
+          ('dwLength', ctypes.c_ulong),
+          ('dwMemoryLoad', ctypes.c_ulong),
+          ('ullTotalPhys', ctypes.c_ulonglong),
+          ('ullAvailPhys', ctypes.c_ulonglong),
+          ('ullTotalPageFile', ctypes.c_ulonglong),
+          ('ullAvailPageFile', ctypes.c_ulonglong),
+          ('ullTotalVirtual', ctypes.c_ulonglong),
+          ('ullAvailVirtual', ctypes.c_ulonglong),
+          ('sullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+      status = MEMORYSTATUSEX()
+      status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+      if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+        return int(status.ullAvailPhys / (1024 * 1024))
+
+    return None
+
+  @staticmethod
+  def getParallelJobsCount(n_jobs):
+    """Number of Chloe processes to run together for n_jobs jobs
+
+    Bounded by the provider setting, or when it is 0 (automatic) by the CPU count
+    and the memory available for one JVM heap per process.
+    """
+    try:
+      max_jobs = int(ProcessingConfig.getSetting(ChloeUtils.PARALLEL_JOBS) or 0)
+    except ValueError:
+      max_jobs = 1
+
+    if max_jobs <= 0:
+      try:
+        max_jobs = multiprocessing.cpu_count()
+      except NotImplementedError:
+        max_jobs = 1
+      memory = ChloeUtils.getAvailableMemory()
+      if memory is not None:
+        job_memory = ChloeUtils.getJavaHeap() or ChloeUtils.DEFAULT_JOB_MEMORY
+        max_jobs = min(max_jobs, memory // job_memory)
+
+    return max(1, min(max_jobs, n_jobs))
+
+  @staticmethod
+  def splitSizes(sizes):
+    """Split a ';' separated list of window/grid sizes"""
+    return [size.strip() for size in str(sizes).split(';') if size.strip()]
+
+  @staticmethod
+  def readProperties(f_properties):
+    """Read a properties file written by createPropertiesTempFile, return a dict"""
+    properties = {}
+    with open(f_properties) as fd:
+      for line in fd:
+        line = line.strip()
+        if not line or line.startswith('#') or '=' not in line:
+          continue
+        key, value = line.split('=', 1)
+        # reverse the escaping done by formatString on Windows paths
+        properties[key.strip()] = re.sub(r'\\(.)', r'\1', value.strip())
+    return properties
+
+  @staticmethod
+  def getPropertiesFromCommands(commands):
+    """Return the properties file of a command built by getConsoleCommands (or None)"""
+    if commands:
+      f_properties = commands[-1].strip('"')
+      if f_properties.endswith('.properties'):
+        return f_properties
+    return None
+
+  @staticmethod
+  def runCholeWorker(f_properties, progress):
+    """Run a properties file in the session worker JVM
+
+    Return the console lines and the exit status, raise ChloeWorkerError when the worker is not usable.
+    """
+    loglines = []
+    loglines.append('Execution console output (worker) :')
+    worker = ChloeWorker.getInstance(ProcessingConfig.getSetting(ChloeUtils.JAVA), ChloeUtils.getJavaHeap())
+    status = worker.run(f_properties, lambda line: ChloeUtils.handleOutputLine(line, progress, loglines))
+    if status != 0:
+      loglines.append('Chloe job exited with status {}'.format(status))
+    return loglines, status
+
+  @staticmethod
+  def runChole(commands, progress=None, jobDone=None):
+    """Run Chloe with the commands of a properties file
+
+    jobDone(status) is called once the job ran, with its exit status (0 on success): it
+    post-processes the outputs. Return False when the job was only queued in the current
+    batch (see startBatch), jobDone is then called by endBatch.
+    """
     if progress is None:
       progress = SilentProgress()
 
@@ -65,9 +225,233 @@ class ChloeUtils:
     progress.setCommand(fused_command)
     progress.setInfo('Output:')
 
+    # Batch collection: the job is run later by endBatch
+    f_properties = ChloeUtils.getPropertiesFromCommands(commands)
+    if f_properties and ChloeUtils.isBatchStarted():
+      f_job = ChloeUtils.queueBatchJob(f_properties, jobDone)
+      progress.setInfo(u'Queued in the current Chloe batch: {}'.format(f_job))
+      return False
+
+    # Execution in the persistent worker JVM, fall back to the one-shot spawn if it is unusable
+    if f_properties and ProcessingConfig.getSetting(ChloeUtils.JAVA_WORKER):
+      try:
+        loglines, status = ChloeUtils.runCholeWorker(f_properties, progress)
+        ProcessingLog.addToLog(ProcessingLog.LOG_INFO, loglines)
+        ChloeUtils.consoleOutput = loglines
+        if jobDone is not None:
+          jobDone(status)
+        return True
+      except ChloeWorkerError as e:
+        progress.setInfo(u'{}\nRunning Chloe in a new process'.format(e))
+
     # Execution Chloe with subprocess command system
+    loglines, rc = ChloeUtils.runCholeProcess(fused_command, progress)
+
+    # Save log
+    ProcessingLog.addToLog(ProcessingLog.LOG_INFO, loglines)
+    ChloeUtils.consoleOutput = loglines
+    if jobDone is not None:
+      jobDone(rc)
+    return True
+
+  @staticmethod
+  def startBatch():
+    """Start collecting the properties files given to runChole instead of running them
+
+    The multi sizes and tiled runners queue their job too, they are run as a whole by endBatch.
+    The batch mode is meant for scripts: the algorithms must be run with processing.runalg,
+    their outputs only exist once endBatch returned.
+
+        ChloeUtils.startBatch()
+        for f_input in inputs:
+            processing.runalg('chloe:sliding', f_input, ...)
+        ChloeUtils.endBatch()
+    """
+    ChloeUtils.batchJobs = []
+
+  @staticmethod
+  def isBatchStarted():
+    return ChloeUtils.batchJobs is not None
+
+  @staticmethod
+  def endBatch(progress=None):
+    """Run the properties files collected since startBatch in one Chloe process
+
+    The jobDone callback given to runChole for a job (projection files, cache...) is called
+    as soon as the job is finished. Return a list of (properties file, exit status).
+    """
+    jobs = ChloeUtils.batchJobs
+    ChloeUtils.batchJobs = None
+    if not jobs:
+      return []
+
+    def jobDone(index, status):
+      if jobs[index][2] is not None:
+        jobs[index][2](status)
+
+    f_jobs = [f_job for f_properties, f_job, done in jobs]
+    try:
+      statuses = ChloeUtils.runCholeBatch(f_jobs, progress, jobDone)
+    finally:
+      for f_job in f_jobs:
+        if os.path.isfile(f_job):
+          os.remove(f_job)
+    return [(f_properties, status) for (f_properties, f_job, done), status in zip(jobs, statuses)]
+
+  @staticmethod
+  def queueBatchJob(f_properties, jobDone=None):
+    """Keep a private copy of a properties file for the current batch, removed by endBatch"""
+    # algorithms reuse their properties path between runs, so the file is copied
+    fd, f_job = tempfile.mkstemp(suffix='.properties', prefix='chloe_batch')
+    os.close(fd)
+    shutil.copyfile(f_properties, f_job)
+    ChloeUtils.batchJobs.append((f_properties, f_job, jobDone))
+    return f_job
+
+  @staticmethod
+  def runCholeBatch(properties_files, progress=None, jobDone=None):
+    """Run several properties files in sequence with a single JVM
+
+    The JVM is the session worker if it is enabled, else a worker dedicated to the batch.
+    Fall back to one process per job if no worker can be used.
+    jobDone(index, status) is called as soon as a job is finished.
+    Return the list of exit status (one per properties file, 0 on success).
+    """
+    if progress is None:
+      progress = SilentProgress()
+
+    session_worker = ProcessingConfig.getSetting(ChloeUtils.JAVA_WORKER)
+    worker = None
+    try:
+      if session_worker:
+        worker = ChloeWorker.getInstance(ProcessingConfig.getSetting(ChloeUtils.JAVA), ChloeUtils.getJavaHeap())
+      else:
+        worker = ChloeWorker(ProcessingConfig.getSetting(ChloeUtils.JAVA), ChloeUtils.getJavaHeap())
+        worker.start()
+    except ChloeWorkerError as e:
+      progress.setInfo(u'{}\nRunning each Chloe job in a new process'.format(e))
+      worker = None
+
+    total = len(properties_files)
+    statuses = []
+    loglines = []
+    try:
+      for index, f_properties in enumerate(properties_files):
+        job_progress = ChloeJobProgress(progress, index, total)
+        progress.setInfo(u'Job {}/{}: {}'.format(index + 1, total, f_properties))
+        loglines.append(u'Job {}/{}: {}'.format(index + 1, total, f_properties))
+        status = None
+        if worker is not None:
+          try:
+            status = worker.run(f_properties, lambda line: ChloeUtils.handleOutputLine(line, job_progress, loglines))
+          except ChloeWorkerError as e:
+            progress.setInfo(u'{}\nRunning the remaining Chloe jobs in new processes'.format(e))
+            worker = None
+        if status is None:
+          fused_command = ' '.join(ChloeUtils.getJavaCommands(f_properties))
+          job_loglines, status = ChloeUtils.runCholeProcess(fused_command, job_progress)
+          loglines.extend(job_loglines)
+        statuses.append(status)
+        progress.setInfo(u'Job {}/{} exit status: {}'.format(index + 1, total, status))
+        if jobDone is not None:
+          jobDone(index, status)
+        progress.setPercentage(int(100 * (index + 1) / total))
+    finally:
+      if worker is not None and not session_worker:
+        worker.stop()
+
+    ProcessingLog.addToLog(ProcessingLog.LOG_INFO, loglines)
+    ChloeUtils.consoleOutput = loglines
+    return statuses
+
+  @staticmethod
+  def runCholeParallel(properties_files, progress=None, max_jobs=None, jobDone=None):
+    """Run several properties files in concurrent Chloe processes
+
+    At most max_jobs processes run together (getParallelJobsCount by default).
+    The progress of the jobs is combined in the given progress object,
+    jobDone(index, status) is called by the calling thread as soon as a job is finished.
+    Return the list of exit status (one per properties file).
+    """
+    if progress is None:
+      progress = SilentProgress()
+
+    total = len(properties_files)
+    if max_jobs is None:
+      max_jobs = ChloeUtils.getParallelJobsCount(total)
+
+    cwd = os.path.dirname(__file__) + os.sep + 'Chloe2012'
+    events = Queue.Queue()
+
+    def runJob(index, fused_command):
+      # Worker thread : only push events, the progress object is updated by the main thread
+      try:
+        process = subprocess.Popen(
+          fused_command,
+          shell=True,
+          stdout=subprocess.PIPE,
+          stdin=open(os.devnull),
+          stderr=subprocess.STDOUT,
+          universal_newlines=True,
+          cwd=cwd,
+        )
+        for output in iter(process.stdout.readline, ''):
+          events.put(('line', index, output.strip()))
+        events.put(('done', index, process.wait()))
+      except (IOError, OSError) as e:
+        events.put(('line', index, u'{}'.format(e)))
+        events.put(('done', index, -1))
+
+    percentages = [0] * total
+    statuses = [None] * total
+    loglines = []
+    loglines.append('Execution console output ({} parallel jobs) :'.format(max_jobs))
+    pending = list(enumerate(properties_files))
+    running = 0
+    finished = 0
+
+    while finished < total:
+      while pending and running < max_jobs:
+        index, f_properties = pending.pop(0)
+        fused_command = ' '.join(ChloeUtils.getJavaCommands(f_properties))
+        progress.setInfo(u'Job {}/{}: {}'.format(index + 1, total, fused_command))
+        thread = threading.Thread(target=runJob, args=(index, fused_command))
+        thread.daemon = True
+        thread.start()
+        running += 1
+
+      event, index, value = events.get()
+      if event == 'line':
+        if value:
+          res = ChloeUtils.PROGRESS_REGEX.search(value)
+          if res:
+            percentages[index] = int(res.group('percentage'))
+            progress.setPercentage(int(sum(percentages) / total))
+          else:
+            progress.setConsoleInfo(u'[{}] {}'.format(index + 1, value))
+          loglines.append(u'[{}] {}'.format(index + 1, value))
+      else:
+        statuses[index] = value
+        percentages[index] = 100
+        running -= 1
+        finished += 1
+        progress.setPercentage(int(sum(percentages) / total))
+        progress.setInfo(u'Job {}/{} exit status: {}'.format(index + 1, total, value))
+        if jobDone is not None:
+          jobDone(index, value)
+
+    ProcessingLog.addToLog(ProcessingLog.LOG_INFO, loglines)
+    ChloeUtils.consoleOutput = loglines
+    return statuses
+
+  @staticmethod
+  def runCholeProcess(fused_command, progress):
+    """Run Chloe in a new process, return the console lines and the exit code"""
+    cwd=os.path.dirname(__file__) + os.sep + 'Chloe2012'
+
     success = False
     retry_count = 0
+    rc = None
     while success == False:
       loglines = []
       loglines.append('Execution console output :')
@@ -82,21 +466,15 @@ class ChloeUtils:
           cwd=cwd,
         )
 
-        regex = re.compile(r'^\s*##\s*(?P<percentage>\d+)\s*\/\s*\d+\s*$')
         while True:
           output = process.stdout.readline()
           if output == '' and process.poll() is not None:
               break
           if output:
               line = output.strip()
-              res = regex.search(line)
-              if res:
-                percentage = int(res.group('percentage'))
-                progress.setPercentage(percentage)
-              else:
-                progress.setConsoleInfo(line)
-              loglines.append(line)
+              ChloeUtils.handleOutputLine(line, progress, loglines)
           rc = process.poll()
+        rc = process.wait()
 
         success = True
       except IOError as e:
@@ -104,10 +482,8 @@ class ChloeUtils:
           retry_count += 1
         else:
           raise IOError(e.message + u'\nTried 5 times without success. Last iteration stopped after reading {} line(s).\nLast line(s):\n{}'.format(len(loglines), u'\n'.join(loglines[-10:])))
-    
-    # Save log
-    ProcessingLog.addToLog(ProcessingLog.LOG_INFO, loglines)
-    ChloeUtils.consoleOutput = loglines
+
+    return loglines, rc
 
   @staticmethod
   def setLayerSymbology(layer, qmlFilename):
@@ -158,6 +534,30 @@ class ChloeUtils:
       return None
 
 
+  @staticmethod
+  def writePointsFile(layer_uri, f_csv, crs=None):
+    """Write the points of a vector layer in a points file of Chloe: id;X;Y, id being the feature id
+
+    Chloe reads the points as coordinates of the raster: they are reprojected from the crs
+    of the layer to crs, the one of the raster (kept as they are if either crs is unknown).
+    """
+    layer = dataobjects.getObjectFromUri(layer_uri)
+    transform = None
+    if crs is not None and crs.isValid() and layer.crs().isValid() and layer.crs() != crs:
+      transform = QgsCoordinateTransform(layer.crs(), crs)
+    with open(f_csv, 'w') as fd:
+      fd.write('id;X;Y\n')
+      for feature in vector.features(layer):
+        geometry = feature.geometry()
+        if geometry is None:
+          continue
+        points = geometry.asMultiPoint() if geometry.isMultipart() else [geometry.asPoint()]
+        for point in points:
+          if transform is not None:
+            point = transform.transform(point)
+          fd.write('{};{};{}\n'.format(feature.id(), repr(point.x()), repr(point.y())))
+    return f_csv
+
   @staticmethod
   def extractValueNotNull(f_input):
         # === Test algorithm
@@ -191,6 +591,27 @@ class ChloeUtils:
               
     return result
 
+class ChloeJobProgress:
+  """Progress of one job among several, forwarded as a share of the global progress"""
+
+  def __init__(self, progress, index, total):
+    self.progress = progress
+    self.index    = index
+    self.total    = total
+
+  def setPercentage(self, percentage):
+    self.progress.setPercentage(int((100 * self.index + percentage) / self.total))
+
+  def setInfo(self, msg):
+    self.progress.setInfo(msg)
+
+  def setCommand(self, cmd):
+    self.progress.setCommand(cmd)
+
+  def setConsoleInfo(self, msg):
+    self.progress.setConsoleInfo(msg)
+
+
 class ASCOutputRaster(OutputRaster):
   def getFileFilter(self, alg):
     """ Force asc output raster extension"""
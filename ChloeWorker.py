@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import re
+import subprocess
+import threading
+
+
+class ChloeWorkerError(Exception):
+  """Raised when the worker JVM can not be started or died during a job"""
+  pass
+
+
+class ChloeWorker:
+  """Long-lived Chloe JVM receiving properties files through its stdin
+
+  The JVM runs Chloe2012/worker/ChloeWorker.java (java source-file mode, Java 11+)
+  and stays alive for the whole QGIS session. Each job is a properties file path
+  written on a line, the worker answers with the usual Chloe console output
+  followed by a '##worker done <status>' line.
+  """
+
+  READY = '##worker ready'
+  DONE  = re.compile(r'^\s*##worker done (?P<status>-?\d+)\s*$')
+  QUIT  = '##quit'
+
+  _instance = None
+  _disabled = False   # Set when the worker can not start, avoid retrying at each run
+
+  def __init__(self, java=None, heap=0):
+    self.java    = java if java else 'java'
+    self.heap    = heap
+    self.cwd     = os.path.dirname(__file__) + os.sep + 'Chloe2012'
+    self.process = None
+    self.lock    = threading.Lock()
+
+  @staticmethod
+  def getInstance(java=None, heap=0):
+    """Return the session worker, starting it if needed"""
+    if ChloeWorker._disabled:
+      raise ChloeWorkerError('Chloe worker disabled for this session')
+
+    if ChloeWorker._instance is None:
+      ChloeWorker._instance = ChloeWorker(java, heap)
+    return ChloeWorker._instance
+
+  @staticmethod
+  def stopInstance():
+    """Stop the session worker (called when the provider is unloaded)"""
+    if ChloeWorker._instance is not None:
+      ChloeWorker._instance.stop()
+      ChloeWorker._instance = None
+
+  def getCommands(self):
+    """Get the command used to start the worker JVM"""
+    commands = [self.java]
+    if self.heap:
+      commands.append('-Xmx{}m'.format(self.heap))
+    commands.extend([
+      '-cp', 'bin' + os.sep + 'chloe-4.0.jar',
+      'worker' + os.sep + 'ChloeWorker.java'
+    ])
+    return commands
+
+  def isAlive(self):
+    return self.process is not None and self.process.poll() is None
+
+  def start(self):
+    """Start the JVM and wait for its ready line"""
+    try:
+      self.process = subprocess.Popen(
+        self.getCommands(),
+        stdout=subprocess.PIPE,
+        stdin=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        bufsize=1,
+        cwd=self.cwd,
+      )
+    except OSError as e:
+      ChloeWorker._disabled = True
+      raise ChloeWorkerError(u'Unable to start the Chloe worker: {}'.format(e))
+
+    loglines = []
+    while True:
+      output = self.process.stdout.readline()
+      if output == '':
+        # The JVM exited before being ready (java < 11, missing jar...)
+        self.process = None
+        ChloeWorker._disabled = True
+        raise ChloeWorkerError(u'Chloe worker exited during start-up:\n{}'.format(u'\n'.join(loglines[-10:])))
+      line = output.strip()
+      if line == self.READY:
+        break
+      loglines.append(line)
+
+  def stop(self):
+    """Ask the JVM to exit, kill it if it does not"""
+    if self.isAlive():
+      try:
+        self.process.stdin.write(self.QUIT + '\n')
+        self.process.stdin.flush()
+        self.process.stdin.close()
+      except (IOError, OSError):
+        pass
+      # Give the JVM a chance to leave cleanly before killing it
+      timer = threading.Timer(5.0, self.process.kill)
+      timer.start()
+      self.process.wait()
+      timer.cancel()
+    self.process = None
+
+  def run(self, f_properties, handleLine):
+    """Run one properties file in the worker
+
+    handleLine is called with every console line of the job (progress lines included).
+    Return the job exit status, raise ChloeWorkerError if the worker died.
+    """
+    with self.lock:
+      if not self.isAlive():
+        self.start()
+
+      try:
+        self.process.stdin.write(f_properties + '\n')
+        self.process.stdin.flush()
+      except (IOError, OSError) as e:
+        self.process = None
+        raise ChloeWorkerError(u'Chloe worker is not reachable: {}'.format(e))
+
+      while True:
+        output = self.process.stdout.readline()
+        if output == '':
+          self.process = None
+          raise ChloeWorkerError(u'Chloe worker died while running {}'.format(f_properties))
+        line = output.strip()
+        res = self.DONE.search(line)
+        if res:
+          return int(res.group('status'))
+        if line:
+          handleLine(line)
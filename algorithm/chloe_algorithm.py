@@ -28,12 +28,15 @@
 
 import os
 import io
+import glob
+import shutil
 import subprocess
 import time
 from PyQt4.QtCore import *
 from qgis.core import *
 
 from processing.core.GeoAlgorithm import GeoAlgorithm
+from processing.core.GeoAlgorithmExecutionException import GeoAlgorithmExecutionException
 from processing.core.parameters import ParameterMultipleInput, ParameterVector, ParameterRaster, ParameterTableField, ParameterNumber, ParameterBoolean, ParameterSelection, ParameterString, ParameterFile
 from processing.core.outputs import OutputVector,OutputRaster, OutputFile, OutputDirectory
 from processing.tools import dataobjects, vector
@@ -50,6 +53,7 @@ from ast import literal_eval
 
 from PyQt4.QtGui import QIcon
 from ..ChloeUtils import ChloeUtils
+from ..ChloeManifest import ChloeManifest
 from ..gui.ChloeAlgorithmDialog import ChloeAlgorithmDialog
 import tempfile
 from processing.tools.system import isWindows
@@ -100,19 +104,7 @@ class CholeAlgorithm(GeoAlgorithm):
         if crs:               # crs given
             crs_output = crs
         elif layer_crs:          # crs from layer
-
-            # Constrution des chemins de sortie des fichiers
-            dir_in   = os.path.dirname(layer_crs)
-            base_in  = os.path.basename(layer_crs)
-            name_in  = os.path.splitext(base_in)[0]
-            path_prj_in = dir_in+os.sep+name_in+'.prj'
-
-
-            if os.path.isfile(path_prj_in) :
-                crs_output = dataobjects.getObjectFromUri(layer_crs).crs()
-
-            else:                 # crs project
-                crs_output = iface.mapCanvas().mapRenderer().destinationCrs()
+            crs_output = self.getLayerCrs(layer_crs)
         else:                 # crs project
             crs_output = iface.mapCanvas().mapRenderer().destinationCrs()
 
@@ -120,6 +112,26 @@ class CholeAlgorithm(GeoAlgorithm):
         os.write(fd,crs_output.toWkt())
         os.close(fd)
 
+    def getLayerCrs(self, layer_crs):
+        """Crs of a layer, the one of the project if the layer has no projection file"""
+
+        # Constrution des chemins de sortie des fichiers
+        dir_in   = os.path.dirname(layer_crs)
+        base_in  = os.path.basename(layer_crs)
+        name_in  = os.path.splitext(base_in)[0]
+        path_prj_in = dir_in+os.sep+name_in+'.prj'
+
+        if os.path.isfile(path_prj_in) :
+            return dataobjects.getObjectFromUri(layer_crs).crs()
+        else:                 # crs project
+            return iface.mapCanvas().mapRenderer().destinationCrs()
+
+    def createFolderProjectionFiles(self, folder):
+        """Create the Projection File of each ascii grid of an output folder"""
+        for file in glob.glob(folder+"/*.asc"):
+            f_prj = os.path.splitext(file)[0]+".prj"
+            self.createProjectionFile(f_prj)
+
     def createPropertiesTempFile(self,f_input,f_output_dir, f_output_name, input_field_name="input_ascii",ouput_field_name='output_name'):
         """Create the first part of de Properties Temp File
         The second part depend of the algorithm used it
@@ -142,6 +154,115 @@ class CholeAlgorithm(GeoAlgorithm):
           fd.write( ChloeUtils.formatString(ouput_field_name+'='+f_output_name+"\n",isWindows()))
 
 
+    def runCholeBySizes(self, sizes, progress, jobDone):
+        """Run a multi sizes algorithm, one Chloe process per size when parallel jobs are enabled
+
+        The algorithm createPropertiesTempFile(f_path, sizes, metrics) writes a properties file
+        restricted to the given sizes (and metrics). Every job writes in the same output folder.
+        jobDone(status, complete) is called once the outputs are written, complete is False
+        when outputs of a previous run were kept (incremental mode). In a Chloe batch it is
+        called by ChloeUtils.endBatch.
+        Raise GeoAlgorithmExecutionException when Chloe failed for some sizes, after
+        jobDone(status) with the first non zero status.
+        """
+        if ChloeUtils.isBatchStarted():
+            # The whole job is queued, the batch runs its sizes in a single JVM
+            commands = self.getConsoleCommands()
+            ChloeUtils.runChole(commands, progress, jobDone)
+            return
+
+        sizes = ChloeUtils.splitSizes(sizes)
+        if ChloeManifest.isEnabled():
+            self.runCholeIncremental(sizes, progress, jobDone)
+            return
+
+        max_jobs = ChloeUtils.getParallelJobsCount(len(sizes))
+
+        if max_jobs > 1:
+            f_jobs = []
+            for size in sizes:
+                f_job = getTempFilename(ext="properties")
+                self.createPropertiesTempFile(f_job, size)
+                f_jobs.append(f_job)
+
+            statuses = ChloeUtils.runCholeParallel(f_jobs, progress, max_jobs)
+            for f_job in f_jobs:
+                os.remove(f_job)
+
+            self.checkSizesStatuses(sizes, statuses, jobDone)
+        else:
+            commands = self.getConsoleCommands()            # Get args command
+            ChloeUtils.runChole(commands, progress, jobDone) # RUN
+
+    def runCholeIncremental(self, sizes, progress, jobDone):
+        """Run the sizes and metrics missing in the output folder, one Chloe job per size
+
+        Each finished size is recorded in the folder manifest, so an interrupted run
+        resumes where it stopped.
+        """
+        manifest = ChloeManifest(self.f_path)
+        metrics  = ChloeManifest.splitMetrics(self.metrics)
+
+        jobs = []
+        for size in sizes:
+            missing = manifest.getMissingMetrics(size, metrics)
+            if missing:
+                jobs.append((size, missing))
+
+        if not jobs:
+            progress.setInfo(self.tr('All the outputs are already in the output directory'))
+            jobDone(0, False)
+            return
+        complete = len(jobs) == len(sizes) and all(len(missing) == len(metrics) for size, missing in jobs)
+        if not complete:
+            progress.setInfo(self.tr('Resuming, size(s) to compute: ') + ';'.join(size for size, missing in jobs))
+
+        f_jobs   = []
+        kept     = {}   # metrics of a size already computed
+        previous = {}   # copy of the csv of a size, its columns are merged after the job
+        for size, missing in jobs:
+            f_job = getTempFilename(ext="properties")
+            self.createPropertiesTempFile(f_job, size, ';'.join(missing))
+            f_jobs.append(f_job)
+
+            kept[size] = [metric for metric in metrics if metric not in missing]
+            f_csv = manifest.getCsv(size)
+            if kept[size] and f_csv:
+                previous[size] = f_csv + '.previous'
+                shutil.copyfile(f_csv, previous[size])
+
+        def sizeDone(index, status):
+            size, missing = jobs[index]
+            if status != 0:
+                return
+            done = kept[size] + missing
+            if size in previous:
+                if not ChloeManifest.mergeCsv(previous[size], manifest.getCsv(size)):
+                    done = missing      # the csv lost the kept metrics, they will be computed again
+                os.remove(previous[size])
+            manifest.setDone(size, done)
+
+        max_jobs = ChloeUtils.getParallelJobsCount(len(f_jobs))
+        if max_jobs > 1:
+            statuses = ChloeUtils.runCholeParallel(f_jobs, progress, max_jobs, sizeDone)
+        else:
+            statuses = ChloeUtils.runCholeBatch(f_jobs, progress, sizeDone)
+        for f_job in f_jobs:
+            os.remove(f_job)
+        for f_previous in previous.values():
+            if os.path.isfile(f_previous):
+                os.remove(f_previous)
+
+        self.checkSizesStatuses([size for size, missing in jobs], statuses, jobDone, complete)
+
+    def checkSizesStatuses(self, sizes, statuses, jobDone, complete=True):
+        """Call jobDone with the status of the jobs of the sizes, raise if one of them failed"""
+        failed = [(size, status) for size, status in zip(sizes, statuses) if status != 0]
+        jobDone(failed[0][1] if failed else 0, complete)
+        if failed:
+            raise GeoAlgorithmExecutionException(
+                self.tr('Chloe failed for size(s) ') + ';'.join(size for size, status in failed))
+
     def removePropertiesTempFile(self):
         """Create Properties Temp File"""
         if os.path.isfile(self.f_path):
@@ -153,29 +274,18 @@ class CholeAlgorithm(GeoAlgorithm):
         Example of return : java -jar bin/chloe-4.0.jar /tmp/distance_paramsrrVtm9.properties
         """
 
-        # If JAVA provider parameter in defined use it (Typical Windows Case), else use simple 'java' command (Linux Case)
-        java = ProcessingConfig.getSetting(ChloeUtils.JAVA)
-        if java:
-            arguments = ['"'+java+'"']
-        else:
-            arguments = ['java']
-        arguments.append('-jar')
-        arguments.append('bin' + os.sep + 'chloe-4.0.jar')
-    
         # Get temp file path if not existe
 
         #if f_properties:
         
 
         if force_properties:    # Force properties path
-            arguments.append('"'+force_properties+'"')
+            return ChloeUtils.getJavaCommands(force_properties)
         else:
             if not self.f_path:
                 #self.f_path = getTempFilename(ext="properties")
                 self.f_path = self.getOutputValue(self.SAVE_PROPERTIES)
-            arguments.append('"'+self.f_path+'"')
-
-        return arguments
+            return ChloeUtils.getJavaCommands(self.f_path)
 
     def tr(self, string, context=''):
         if context == '' or context==None:
@@ -49,6 +49,7 @@ from ast import literal_eval
 
 from PyQt4.QtGui import QIcon
 from ..ChloeUtils import ChloeUtils
+from ..ChloeEngine import ChloeEngine
 import tempfile
 from processing.tools.system import isWindows
 
@@ -151,13 +152,18 @@ class DistanceAlgorithm(CholeAlgorithm):
         # === Temp File
         self.createPropertiesTempFile() # Create Properties file (temp or chosed)
 
-        # === CORE
-        commands = self.getConsoleCommands()            # Get args command
-        ChloeUtils.runChole(commands, progress)         # RUN
-
-        # === Projection file
+        # === Projection file, written once the outputs exist
         f_prj = dir_out+os.sep+name_out+".prj"
-        self.createProjectionFile(f_prj,layer_crs=self.input_asc,param=self.INPUT_ASC)
+        def jobDone(status):
+            if status == 0:
+                self.createProjectionFile(f_prj,layer_crs=self.input_asc,param=self.INPUT_ASC)
+
+        # === CORE
+        if ChloeEngine.run(self.f_path, progress):          # RUN natively if enabled and supported
+            jobDone(0)
+        else:
+            commands = self.getConsoleCommands()            # Get args command
+            ChloeUtils.runChole(commands, progress, jobDone) # RUN (jobDone is called by endBatch in a Chloe batch)
 
 
     def createPropertiesTempFile(self):
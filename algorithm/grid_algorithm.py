@@ -48,6 +48,8 @@ from ast import literal_eval
 # Tooling
 from PyQt4.QtGui import QIcon
 from ..ChloeUtils import ChloeUtils
+from ..ChloeCache import ChloeCache
+from ..ChloeEngine import ChloeEngine
 import tempfile
 from processing.tools.system import isWindows
 
@@ -234,13 +236,22 @@ class GridAlgorithm(CholeAlgorithm):
         self.createPropertiesTempFile() # Create Properties file (temp or chosed)
 
 
-        # === CORE
-        commands = self.getConsoleCommands()            # Get args command
-        ChloeUtils.runChole(commands, progress)         # RUN
-
-        # === Projection file
+        # === Projection file, written once the outputs exist
         f_prj = dir_out_asc+os.sep+name_out_asc+".prj"
-        self.createProjectionFile(f_prj)
+        cache = ChloeCache(self.f_path)
+        def jobDone(status):
+            cache.store(progress, status)                   # Not when Chloe failed
+            if status == 0:
+                self.createProjectionFile(f_prj)
+
+        # === CORE
+        if cache.fetch(progress):                           # Outputs of an identical run if cached
+            self.createProjectionFile(f_prj)
+        elif ChloeEngine.run(self.f_path, progress):        # RUN natively if enabled and supported
+            jobDone(0)
+        else:
+            commands = self.getConsoleCommands()            # Get args command
+            ChloeUtils.runChole(commands, progress, jobDone) # RUN (jobDone is called by endBatch in a Chloe batch)
 
  
     def createPropertiesTempFile(self):
@@ -49,6 +49,8 @@ from ast import literal_eval
 # Tooling
 from PyQt4.QtGui import QIcon
 from ..ChloeUtils import ChloeUtils
+from ..ChloeCache import ChloeCache
+from ..ChloeEngine import ChloeEngine
 import tempfile
 from processing.tools.system import isWindows
 
@@ -238,34 +240,43 @@ class GridMultiAlgorithm(CholeAlgorithm):
         self.createPropertiesTempFile() # Create Properties file (temp or chosed)
 
 
+        # === Projection files, written once the outputs exist
+        cache = ChloeCache(self.f_path)
+        def jobDone(status, complete=True):
+            if complete:                                        # Not when outputs of a previous run were kept
+                cache.store(progress, status)                   # nor when Chloe failed for a size
+            self.createFolderProjectionFiles(self.output_dir)
+
         # === CORE
-        commands = self.getConsoleCommands()            # Get args command
-        ChloeUtils.runChole(commands, progress)         # RUN
-
-        # === Projection file
-        for file in glob.glob(self.output_dir+"/*.asc"):
-            dir_out_asc     = os.path.dirname(file)
-            base_out_asc    = os.path.basename(file)
-            name_out_asc    = os.path.splitext(base_out_asc)[0]
-            #ext_out_asc     = os.path.splitext(base_out_asc)[1] 
-            
-            f_prj = dir_out_asc+os.sep+name_out_asc+".prj"
-            self.createProjectionFile(f_prj)
+        if cache.fetch(progress):                           # Outputs of an identical run if cached
+            self.createFolderProjectionFiles(self.output_dir)
+        elif ChloeEngine.run(self.f_path, progress):        # RUN natively if enabled and supported
+            jobDone(0)
+        else:                                               # or (parallel/incremental) by size
+            self.runCholeBySizes(self.grid_sizes, progress, jobDone)
 
  
-    def createPropertiesTempFile(self):
-        """Create Properties File"""
+    def createPropertiesTempFile(self, f_path=None, grid_sizes=None, metrics=None):
+        """Create Properties File
+        f_path, grid_sizes and metrics allow to write a job restricted to some sizes and metrics"""
+
+        if f_path is None:
+            f_path = self.f_path
+        if grid_sizes is None:
+            grid_sizes = self.grid_sizes
+        if metrics is None:
+            metrics = self.metrics
 
         s_time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
-        with open(self.f_path,"w") as fd:
+        with open(f_path,"w") as fd:
             fd.write("#"+s_time+"\n")
             fd.write("treatment=grid\n")
             fd.write( ChloeUtils.formatString('input_ascii='+self.input_layer_asc+"\n",isWindows()))  
             fd.write( ChloeUtils.formatString('output_folder=' +self.output_dir +"\n",isWindows()))
 
-            fd.write("grid_sizes={"  + self.grid_sizes +"}\n")
+            fd.write("grid_sizes={"  + grid_sizes +"}\n")
             fd.write("maximum_nodata_value_rate="  + str(self.maximum_rate_missing_values) +"\n")
-            fd.write("metrics={"  + self.metrics +"}\n")
+            fd.write("metrics={"  + metrics +"}\n")
             
             fd.write("visualize_ascii=false\n")
 
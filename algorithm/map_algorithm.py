@@ -48,6 +48,7 @@ from ast import literal_eval
 # Tooling
 from PyQt4.QtGui import QIcon
 from ..ChloeUtils import ChloeUtils
+from ..ChloeEngine import ChloeEngine
 import tempfile
 from processing.tools.system import isWindows
 
@@ -218,12 +219,17 @@ class MapAlgorithm(CholeAlgorithm):
         self.createPropertiesTempFile() # Create Properties file (temp or chosed)
 
 
-        # === CORE
-        commands = self.getConsoleCommands()            # Get args command
-        ChloeUtils.runChole(commands, progress)         # RUN
+        # === Projection file, written once the outputs exist
+        def jobDone(status):
+            if status == 0:
+                self.createProjectionFile(f_prj)
 
-        # === Projection file
-        self.createProjectionFile(f_prj)
+        # === CORE
+        if ChloeEngine.run(self.f_path, progress):          # RUN natively if enabled and supported
+            jobDone(0)
+        else:
+            commands = self.getConsoleCommands()            # Get args command
+            ChloeUtils.runChole(commands, progress, jobDone) # RUN (jobDone is called by endBatch in a Chloe batch)
 
 
 
@@ -48,6 +48,7 @@ from ast import literal_eval
 # Tooling
 from PyQt4.QtGui import QIcon
 from ..ChloeUtils import ChloeUtils
+from ..ChloeEngine import ChloeEngine
 import tempfile
 from processing.tools.system import isWindows
 
@@ -68,6 +69,7 @@ class SelectedAlgorithm(CholeAlgorithm):
     PIXELS_POINTS_SELECT        = 'PIXELS_POINTS_SELECT'
     PIXELS_FILE                 = 'PIXELS_FILE'
     POINTS_FILE                 = 'POINTS_FILE'
+    POINTS_LAYER                = 'POINTS_LAYER'
     # NUMBER_GENERATED_PIXEL      = 'NUMBER_GENERATED_PIXEL'
     # MINIMUM_DISTANCE            = 'MINIMUM_DISTANCE'
 
@@ -82,7 +84,7 @@ class SelectedAlgorithm(CholeAlgorithm):
     OUTPUT_ASC        = 'OUTPUT_ASC'
 
 
-    types_of_pixel_point_select = ['pixel(s) file', 'point(s) file']
+    types_of_pixel_point_select = ['pixel(s) file', 'point(s) file', 'point(s) layer']
     types_of_shape =['SQUARE','CIRCLE','FUNCTIONAL']
 
     types_of_metrics = {
@@ -206,6 +208,12 @@ class SelectedAlgorithm(CholeAlgorithm):
             name=self.POINTS_FILE,
             description=self.tr('Points file')))
 
+        self.addParameter(ParameterVector(
+            name=self.POINTS_LAYER,
+            description=self.tr('Points layer'),
+            shapetype=[ParameterVector.VECTOR_TYPE_POINT],
+            optional=True))
+
         self.addParameter(ParameterNumber(
             name=self.MAXIMUM_RATE_MISSING_VALUES,
             description=self.tr('Maximum rate of mising values'),
@@ -245,6 +253,8 @@ class SelectedAlgorithm(CholeAlgorithm):
 
         if window_sizes% 2 == 0:
             return self.tr("window sizes is not odd")
+        elif self.getParameterValue(self.PIXELS_POINTS_SELECT) == 2 and not self.getParameterValue(self.POINTS_LAYER):
+            return self.tr("no points layer")
         else:
             return None
 
@@ -263,6 +273,7 @@ class SelectedAlgorithm(CholeAlgorithm):
         self.pixels_point_selection = self.getParameterValue(self.PIXELS_POINTS_SELECT)
         self.pixels_file            = self.getParameterValue(self.PIXELS_FILE).encode('utf-8')
         self.points_file            = self.getParameterValue(self.POINTS_FILE).encode('utf-8')
+        self.points_layer           = self.getParameterValue(self.POINTS_LAYER)
 
         self.maximum_rate_missing_values = self.getParameterValue(self.MAXIMUM_RATE_MISSING_VALUES)
         self.metrics     = self.getParameterValue(self.METRICS)
@@ -295,13 +306,18 @@ class SelectedAlgorithm(CholeAlgorithm):
         # === Properties file
         self.createPropertiesTempFile() # Create Properties file (temp or chosed)
 
-        # === CORE
-        commands = self.getConsoleCommands()            # Get args command
-        ChloeUtils.runChole(commands, progress)         # RUN
-
-        # === Projection file
+        # === Projection file, written once the outputs exist
         f_prj = dir_out_asc+os.sep+name_out_asc+".prj"
-        self.createProjectionFile(f_prj)
+        def jobDone(status):
+            if status == 0:
+                self.createProjectionFile(f_prj)
+
+        # === CORE
+        if ChloeEngine.run(self.f_path, progress):          # RUN natively if enabled and supported
+            jobDone(0)
+        else:
+            commands = self.getConsoleCommands()            # Get args command
+            ChloeUtils.runChole(commands, progress, jobDone) # RUN (jobDone is called by endBatch in a Chloe batch)
 
 
     def createPropertiesTempFile(self):
@@ -327,6 +343,10 @@ class SelectedAlgorithm(CholeAlgorithm):
                 fd.write("pixels="  + str(self.pixels_file) +"\n")
             elif self.pixels_point_selection == 1: # point(s) file
                 fd.write("points="  + str(self.points_file) +"\n")
+            elif self.pixels_point_selection == 2: # point(s) layer, exported as a point(s) file
+                f_points = ChloeUtils.writePointsFile(self.points_layer, getTempFilename(ext="csv"),
+                                                      self.getLayerCrs(self.input_layer_asc))
+                fd.write( ChloeUtils.formatString('points=' + f_points +"\n",isWindows()))
 
             fd.write("visualize_ascii=false\n")
 
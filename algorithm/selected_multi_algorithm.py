@@ -49,6 +49,7 @@ from ast import literal_eval
 # Tooling
 from PyQt4.QtGui import QIcon
 from ..ChloeUtils import ChloeUtils
+from ..ChloeEngine import ChloeEngine
 import tempfile
 from processing.tools.system import isWindows
 
@@ -69,6 +70,7 @@ class SelectedMultiAlgorithm(CholeAlgorithm):
     PIXELS_POINTS_SELECT        = 'PIXELS_POINTS_SELECT'
     PIXELS_FILE                 = 'PIXELS_FILE'
     POINTS_FILE                 = 'POINTS_FILE'
+    POINTS_LAYER                = 'POINTS_LAYER'
     # NUMBER_GENERATED_PIXEL      = 'NUMBER_GENERATED_PIXEL'
     # MINIMUM_DISTANCE            = 'MINIMUM_DISTANCE'
 
@@ -89,7 +91,7 @@ class SelectedMultiAlgorithm(CholeAlgorithm):
     #VISUALISE_ASC_BOOL = 'VISUALISE_ASC_BOOL'
 
 
-    types_of_pixel_point_select = ['pixel(s) file', 'point(s) file']
+    types_of_pixel_point_select = ['pixel(s) file', 'point(s) file', 'point(s) layer']
     types_of_shape =['SQUARE','CIRCLE','FUNCTIONAL']
 
     types_of_metrics = {
@@ -212,6 +214,12 @@ class SelectedMultiAlgorithm(CholeAlgorithm):
             name=self.POINTS_FILE,
             description=self.tr('Points file')))
 
+        self.addParameter(ParameterVector(
+            name=self.POINTS_LAYER,
+            description=self.tr('Points layer'),
+            shapetype=[ParameterVector.VECTOR_TYPE_POINT],
+            optional=True))
+
         self.addParameter(ParameterNumber(
             name=self.MAXIMUM_RATE_MISSING_VALUES, 
             description=self.tr('Maximum rate of mising values'),
@@ -239,6 +247,21 @@ class SelectedMultiAlgorithm(CholeAlgorithm):
             default=True,
             optional=True))
 
+    def checkParameterValuesBeforeExecuting(self):
+        """If there is any check to do before launching the execution
+        of the algorithm, it should be done here.
+
+        If values are not correct, a message should be returned
+        explaining the problem.
+
+        This check is called from the parameters dialog, and also when
+        calling from the console.
+        """
+        if self.getParameterValue(self.PIXELS_POINTS_SELECT) == 2 and not self.getParameterValue(self.POINTS_LAYER):
+            return self.tr("no points layer")
+        else:
+            return None
+
     def processAlgorithm(self, progress):
         """Here is where the processing itself takes place"""
 
@@ -253,6 +276,7 @@ class SelectedMultiAlgorithm(CholeAlgorithm):
         self.pixels_point_selection = self.getParameterValue(self.PIXELS_POINTS_SELECT)
         self.pixels_file            = self.getParameterValue(self.PIXELS_FILE).encode('utf-8')
         self.points_file            = self.getParameterValue(self.POINTS_FILE).encode('utf-8')
+        self.points_layer           = self.getParameterValue(self.POINTS_LAYER)
 
         self.maximum_rate_missing_values = self.getParameterValue(self.MAXIMUM_RATE_MISSING_VALUES)
         self.metrics     = self.getParameterValue(self.METRICS.encode('utf-8'))
@@ -279,19 +303,16 @@ class SelectedMultiAlgorithm(CholeAlgorithm):
         # === Properties file
         self.createPropertiesTempFile() # Create Properties file (temp or chosed)
 
-        # === CORE
-        commands = self.getConsoleCommands()            # Get args command
-        ChloeUtils.runChole(commands, progress)         # RUN
+        # === Projection files, written once the outputs exist
+        def jobDone(status):
+            self.createFolderProjectionFiles(self.output_dir)
 
-        # === Projection file
-        for file in glob.glob(self.output_dir+"/*.asc"):
-            dir_out_asc     = os.path.dirname(file)
-            base_out_asc    = os.path.basename(file)
-            name_out_asc    = os.path.splitext(base_out_asc)[0]
-            #ext_out_asc     = os.path.splitext(base_out_asc)[1] 
-            
-            f_prj = dir_out_asc+os.sep+name_out_asc+".prj"
-            self.createProjectionFile(f_prj)
+        # === CORE
+        if ChloeEngine.run(self.f_path, progress):          # RUN natively if enabled and supported
+            jobDone(0)
+        else:
+            commands = self.getConsoleCommands()            # Get args command
+            ChloeUtils.runChole(commands, progress, jobDone) # RUN (jobDone is called by endBatch in a Chloe batch)
 
 
     def createPropertiesTempFile(self):
@@ -315,6 +336,10 @@ class SelectedMultiAlgorithm(CholeAlgorithm):
                 fd.write("pixels="  + str(self.pixels_file) +"\n")
             elif self.pixels_point_selection == 1: # point(s) file
                 fd.write("points="  + str(self.points_file) +"\n")
+            elif self.pixels_point_selection == 2: # point(s) layer, exported as a point(s) file
+                f_points = ChloeUtils.writePointsFile(self.points_layer, getTempFilename(ext="csv"),
+                                                      self.getLayerCrs(self.input_layer_asc))
+                fd.write( ChloeUtils.formatString('points=' + f_points +"\n",isWindows()))
 
 
             fd.write("visualize_ascii=false\n")
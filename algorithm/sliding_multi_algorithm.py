@@ -49,6 +49,9 @@ from ast import literal_eval
 # Tooling
 from PyQt4.QtGui import QIcon
 from ..ChloeUtils import ChloeUtils
+from ..ChloeTiling import ChloeTiling
+from ..ChloeCache import ChloeCache
+from ..ChloeEngine import ChloeEngine
 import tempfile
 from processing.tools.system import isWindows
 
@@ -295,26 +298,35 @@ class SlidingMultiAlgorithm(CholeAlgorithm):
         # === Properties file
         self.createPropertiesTempFile() # Create Properties file (temp or chosed)
 
+        # === Projection files, written once the outputs exist
+        cache = ChloeCache(self.f_path)
+        def jobDone(status, complete=True):
+            if complete:                                        # Not when outputs of a previous run were kept
+                cache.store(progress, status)                   # nor when Chloe failed for a size
+            self.createFolderProjectionFiles(self.output_dir)
+
         # === CORE
-        commands = self.getConsoleCommands()            # Get args command
-        ChloeUtils.runChole(commands, progress)         # RUN
+        if cache.fetch(progress):                               # Outputs of an identical run if cached
+            self.createFolderProjectionFiles(self.output_dir)
+        elif ChloeEngine.run(self.f_path, progress) or ChloeTiling.runTiled(self.f_path, progress):
+            jobDone(0)                                          # RUN natively or by tiles if enabled
+        else:                                                   # else by sizes (parallel/incremental if enabled)
+            self.runCholeBySizes(self.window_sizes, progress, jobDone)
 
-        # === Projection file
-        for file in glob.glob(self.output_dir+"/*.asc"):
-            dir_out_asc     = os.path.dirname(file)
-            base_out_asc    = os.path.basename(file)
-            name_out_asc    = os.path.splitext(base_out_asc)[0]
-            #ext_out_asc     = os.path.splitext(base_out_asc)[1] 
-            
-            f_prj = dir_out_asc+os.sep+name_out_asc+".prj"
-            self.createProjectionFile(f_prj)
 
+    def createPropertiesTempFile(self, f_path=None, window_sizes=None, metrics=None):
+        """Create Properties File
+        f_path, window_sizes and metrics allow to write a job restricted to some sizes and metrics"""
 
-    def createPropertiesTempFile(self):
-        """Create Properties File"""
+        if f_path is None:
+            f_path = self.f_path
+        if window_sizes is None:
+            window_sizes = self.window_sizes
+        if metrics is None:
+            metrics = self.metrics
 
         s_time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
-        with open(self.f_path,"w") as fd:
+        with open(f_path,"w") as fd:
             fd.write("#"+s_time+"\n")
 
             fd.write("treatment=sliding\n")
@@ -323,9 +335,9 @@ class SlidingMultiAlgorithm(CholeAlgorithm):
             # fd.write( ChloeUtils.formatString('output_asc=' +self.output_asc +"\n",isWindows()))
             fd.write( ChloeUtils.formatString('output_folder=' +self.output_dir +"\n",isWindows()))
 
-            fd.write("window_sizes={"  + self.window_sizes +"}\n")
+            fd.write("window_sizes={"  + window_sizes +"}\n")
             fd.write("maximum_nodata_value_rate="  + str(self.maximum_rate_missing_values) +"\n")
-            fd.write("metrics={"  + self.metrics +"}\n")
+            fd.write("metrics={"  + metrics +"}\n")
             fd.write("delta_displacement="  + str(self.delta_displacement) +"\n")
             fd.write("shape="  + str(self.window_shape) +"\n")
             if self.window_shape == "FUNCTIONAL":
@@ -53,6 +53,11 @@ from .algorithm.selected_multi_algorithm      import SelectedMultiAlgorithm
 from PyQt4.QtGui import QIcon
 import os
 from .ChloeUtils import ChloeUtils
+from .ChloeWorker import ChloeWorker
+from .ChloeTiling import ChloeTiling
+from .ChloeCache import ChloeCache
+from .ChloeManifest import ChloeManifest
+from .ChloeEngine import ChloeEngine
 
 
 class ChloeProvider(AlgorithmProvider):
@@ -106,6 +111,34 @@ class ChloeProvider(AlgorithmProvider):
             ChloeUtils.JAVA,
             'Path java exe', ''))
 
+        ProcessingConfig.addSetting(Setting(self.getDescription(),
+            ChloeUtils.JAVA_WORKER,
+            'Keep a Chloe worker running between algorithms (Java 11+)', False))
+
+        ProcessingConfig.addSetting(Setting(self.getDescription(),
+            ChloeUtils.JAVA_HEAP,
+            'Java maximum memory per Chloe process in MB (0: java default)', 0))
+
+        ProcessingConfig.addSetting(Setting(self.getDescription(),
+            ChloeUtils.PARALLEL_JOBS,
+            'Maximum parallel Chloe jobs for multi sizes algorithms (0: automatic, 1: disabled)', 1))
+
+        ProcessingConfig.addSetting(Setting(self.getDescription(),
+            ChloeTiling.TILE_ROWS,
+            'Rows per tile for sliding windows on large rasters (0: no tiling)', 0))
+
+        ProcessingConfig.addSetting(Setting(self.getDescription(),
+            ChloeCache.CACHE_SIZE,
+            'Disk budget of the results cache in MB (0: no cache)', 0))
+
+        ProcessingConfig.addSetting(Setting(self.getDescription(),
+            ChloeManifest.INCREMENTAL,
+            'Multi sizes algorithms resume from the outputs already in the output directory', False))
+
+        ProcessingConfig.addSetting(Setting(self.getDescription(),
+            ChloeEngine.NATIVE_ENGINE,
+            'Compute the supported treatments and metrics with the native engine (NumPy) instead of Chloe', False))
+
     def unload(self):
         """Setting should be removed here, so they do not appear anymore
         when the plugin is unloaded.
@@ -113,6 +146,21 @@ class ChloeProvider(AlgorithmProvider):
         AlgorithmProvider.unload(self)
         ProcessingConfig.removeSetting(
             ChloeUtils.JAVA)
+        ProcessingConfig.removeSetting(
+            ChloeUtils.JAVA_WORKER)
+        ProcessingConfig.removeSetting(
+            ChloeUtils.JAVA_HEAP)
+        ProcessingConfig.removeSetting(
+            ChloeUtils.PARALLEL_JOBS)
+        ProcessingConfig.removeSetting(
+            ChloeTiling.TILE_ROWS)
+        ProcessingConfig.removeSetting(
+            ChloeCache.CACHE_SIZE)
+        ProcessingConfig.removeSetting(
+            ChloeManifest.INCREMENTAL)
+        ProcessingConfig.removeSetting(
+            ChloeEngine.NATIVE_ENGINE)
+        ChloeWorker.stopInstance()
 
     def getName(self):
         """This is the name that will appear on the toolbox group.
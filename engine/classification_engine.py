@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import re
+
+import numpy as np
+
+from ..ChloeTiling import ChloeTiling
+from .raster_io import AsciiGrid, MatrixAsciiGridWriter
+from .search_and_replace_engine import SearchAndReplaceEngine
+
+
+class Domains:
+    """Domains of a classification, read as Chloe reads them, and the class of the values
+
+    A domain is an interval [a,b], [a,b[, ]a,b] or ]a,b[ whose bounds may be empty
+    (unbounded). Chloe gives to a value the class of a domain accepting it, nodata if none,
+    in the order of a HashMap: the classes are only known when the domains do not overlap.
+
+    The bounds of the domains cut the values into elementary pieces, the bounds themselves
+    and the open gaps between them, every domain accepts a piece whole: the class of every
+    piece is computed once and the class of a value is the one of its piece, found with
+    searchsorted.
+    """
+
+    NUMBER = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')   # Double.parseDouble
+
+    def __init__(self, value):
+        self.domains = []   # (lower, lower closed, upper, upper closed, class), None if unbounded
+        for domain in SearchAndReplaceEngine.split(value.replace('{', '').replace('}', ''), ';'):
+            words = SearchAndReplaceEngine.split(domain.replace('(', '').replace(')', ''), '-')
+            if len(words) < 2 or not SearchAndReplaceEngine.INTEGER.match(words[1]):
+                raise ValueError('unreadable domain: ' + domain)
+            domain_class = int(words[1])
+            if not -2 ** 31 <= domain_class < 2 ** 31:
+                raise ValueError('unreadable domain: ' + domain)
+            self.domains.append(Domains.getDomain(words[0]) + (domain_class,))
+
+        bounds = set()
+        for lower, lower_closed, upper, upper_closed, domain_class in self.domains:
+            bounds.update(bound for bound in (lower, upper) if bound is not None)
+        self.bounds = np.array(sorted(bounds), dtype=np.float64)
+
+    @staticmethod
+    def getDomain(text):
+        """Interval of a domain as Chloe ClassificationPanel.getDomain reads it"""
+        lower_closed = text.startswith('[')
+        upper_closed = text.endswith(']')
+        if lower_closed and upper_closed:
+            text = text.replace('[', '').replace(']', '').replace(' ', '')
+        elif lower_closed:
+            text = text.replace('[', '')
+        elif upper_closed:
+            text = text.replace(']', '')
+        else:
+            text = text.replace('[', '').replace(']', '')
+        words = text.split(',', 1)
+        if len(words) < 2:
+            raise ValueError('unreadable domain: ' + text)
+        bounds = []
+        for word in words:
+            if word == '':
+                bounds.append(None)
+            elif Domains.NUMBER.match(word.strip()):
+                bounds.append(float(word.strip()))
+            else:
+                raise ValueError('unreadable domain bound: ' + word)
+        return bounds[0], lower_closed, bounds[1], upper_closed
+
+    def getClasses(self, value):
+        """Classes of the domains accepting value"""
+        classes = []
+        for lower, lower_closed, upper, upper_closed, domain_class in self.domains:
+            if lower is not None and (value < lower or value == lower and not lower_closed):
+                continue
+            if upper is not None and (value > upper or value == upper and not upper_closed):
+                continue
+            classes.append(domain_class)
+        return classes
+
+    def getPieces(self):
+        """Representative value of every piece: the gap before bounds[0], bounds[0], the gap
+        before bounds[1]... the gap after the last bound, None for an empty gap
+        """
+        bounds = self.bounds.tolist()
+        if not bounds:
+            return [0.0]
+        pieces = [bounds[0] - 1.0]
+        for i, bound in enumerate(bounds):
+            pieces.append(bound)
+            if i + 1 < len(bounds):
+                middle = (bound + bounds[i + 1]) / 2.0
+                pieces.append(middle if bound < middle < bounds[i + 1] else None)
+        pieces.append(bounds[-1] + 1.0)
+        return pieces
+
+    def getOverlap(self):
+        """A value accepted by domains of different classes, None if there is none"""
+        for piece in self.getPieces():
+            if piece is not None and len(set(self.getClasses(piece))) > 1:
+                return piece
+        return None
+
+    def getTable(self, nodata):
+        """Class of every piece (see getPieces)"""
+        table = []
+        for piece in self.getPieces():
+            classes = self.getClasses(piece) if piece is not None else []
+            table.append(classes[0] if classes else nodata)
+        return np.array(table, dtype=np.float64)
+
+    def classify(self, values, table, nodata):
+        """Classes of the values (float array), nodata for nodata and the values of no domain"""
+        index = np.searchsorted(self.bounds, values)
+        pieces = 2 * index
+        if len(self.bounds):
+            exact = self.bounds[np.minimum(index, len(self.bounds) - 1)] == values
+            pieces += exact
+        return np.where(values == nodata, nodata, table[pieces])
+
+
+class ClassificationEngine:
+    """Classification treatment computed with the domains as a table of classes
+
+    The raster is read by strips of GDAL blocks, the values get the class of their domain
+    (see Domains) and are written as Chloe MatrixManager.exportAsciiGrid does. As in Chloe
+    the nodata cells and the values out of the domains are nodata.
+    """
+
+    STRIP_CELLS = 4 * 1024 * 1024  # Cells of a strip
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this classification properties, else the reason why not"""
+        if 'domains' not in properties:
+            return 'no domains'
+        overlap = Domains(properties['domains']).getOverlap()
+        if overlap is not None:
+            return 'domains overlapping on {}, the class chosen by Chloe is not known'.format(overlap)
+        if not properties.get('output_folder') and not properties.get('output_asc'):
+            return 'no output'
+        if not os.path.isfile(properties.get('input_ascii', '')) or not properties['input_ascii'].lower().endswith('.asc'):
+            return 'the input is not an ascii grid'
+        header, header_lines = ChloeTiling.getAsciiHeader(properties['input_ascii'])
+        if 'nodata_value' not in header:
+            return 'the input has no NODATA_value'
+        return None
+
+    @staticmethod
+    def run(properties, progress):
+        grid    = AsciiGrid(properties['input_ascii'])
+        nodata  = grid.nodata
+        domains = Domains(properties['domains'])
+        table   = domains.getTable(nodata)
+
+        if properties.get('output_folder'):
+            f_asc = properties['output_folder'] + '/' + grid.getName() + '_class.asc'
+        else:
+            f_asc = properties['output_asc']
+        if os.path.dirname(f_asc) and not os.path.isdir(os.path.dirname(f_asc)):
+            os.makedirs(os.path.dirname(f_asc))
+
+        strip_rows = grid.getStripRows(ClassificationEngine.STRIP_CELLS)
+        writer = MatrixAsciiGridWriter(f_asc, grid, nodata)
+        try:
+            for top in range(0, grid.nrows, strip_rows):
+                bottom = min(grid.nrows, top + strip_rows)
+                writer.writeRows(domains.classify(grid.readRows(top, bottom), table, nodata))
+                progress.setPercentage(int(100 * bottom / grid.nrows))
+        finally:
+            writer.close()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import tempfile
+
+import numpy as np
+
+from ..ChloeTiling import ChloeTiling
+from .raster_io import AsciiGrid, MatrixAsciiGridWriter, formatDouble
+from .labelling import PatchLabeller
+from .sliding_engine import SlidingEngine
+
+
+class ClusterEngine:
+    """Cluster treatment (rook and queen neighbourhoods) computed with a streamed labelling
+
+    The clusters are the connected components of the cells of the same class among the
+    classes of cluster. The raster is read by strips of GDAL blocks and labelled with
+    PatchLabeller, the provisional labels of the cells are kept in a temporary file so
+    only the labels stay in memory, then the cluster of every cell is written in a second
+    pass on this file.
+
+    As in Chloe, the class of a cell is the integer part of its value, the clusters are
+    numbered from 1 in the order of their first cell and the csv gives their class, their
+    number of cells and their area.
+    """
+
+    STRIP_CELLS = 4 * 1024 * 1024  # Cells of a strip
+
+    NOT_CLUSTERED = -1   # label of the cells out of the clusters
+    NODATA        = -2   # label of the nodata cells
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this cluster properties, else the reason why not"""
+        if properties.get('cluster_type') not in ('rook', 'queen'):
+            return 'cluster type not supported: ' + properties.get('cluster_type', '')
+        clusters = SlidingEngine.splitList(properties.get('cluster', ''))
+        if not clusters or not all(value.lstrip('-').isdigit() for value in clusters):
+            return 'no cluster class or a class which is not an integer'
+        if not properties.get('output_folder') and not properties.get('output_asc'):
+            return 'no output'
+        if not os.path.isfile(properties.get('input_ascii', '')) or not properties['input_ascii'].lower().endswith('.asc'):
+            return 'the input is not an ascii grid'
+        header, header_lines = ChloeTiling.getAsciiHeader(properties['input_ascii'])
+        if 'nodata_value' not in header:
+            return 'the input has no NODATA_value'
+        return None
+
+    @staticmethod
+    def getOutputs(properties, grid):
+        """Paths (ascii, csv) of the outputs, named as Chloe does"""
+        folder = properties.get('output_folder')
+        if folder:
+            prefix = folder + '/cluster_' + grid.getName()
+            return prefix + '.asc', prefix + '.csv'
+        f_asc = properties['output_asc']
+        return f_asc, f_asc.replace('.asc', '') + '.csv'
+
+    @staticmethod
+    def run(properties, progress):
+        grid     = AsciiGrid(properties['input_ascii'])
+        nodata   = grid.nodata
+        clusters = [int(value) for value in SlidingEngine.splitList(properties['cluster'])]
+
+        f_asc, f_csv = ClusterEngine.getOutputs(properties, grid)
+        for f_out in [f_asc, f_csv]:
+            if os.path.dirname(f_out) and not os.path.isdir(os.path.dirname(f_out)):
+                os.makedirs(os.path.dirname(f_out))
+
+        labeller = PatchLabeller(queen=properties['cluster_type'] == 'queen')
+        strip_rows = grid.getStripRows(ClusterEngine.STRIP_CELLS)
+        handle, f_labels = tempfile.mkstemp(suffix='.labels')
+        os.close(handle)
+        try:
+            with open(f_labels, 'w+b') as fd:
+                # Provisional labels of the cells
+                for top in range(0, grid.nrows, strip_rows):
+                    bottom = min(grid.nrows, top + strip_rows)
+                    values = grid.readRows(top, bottom)
+                    classes = np.trunc(values).astype(np.int64)
+                    valid = values != nodata
+                    labels = labeller.addRows(classes, valid & np.in1d(classes, clusters).reshape(classes.shape))
+                    labels[(labels < 0) & valid] = ClusterEngine.NOT_CLUSTERED
+                    labels[~valid] = ClusterEngine.NODATA
+                    labels.tofile(fd)
+                    progress.setPercentage(int(50 * bottom / grid.nrows))
+
+                # Clusters numbered from 1, a cluster numbered as nodata is not written in the grid
+                classes, counts, components = labeller.getComponents()
+                ids = np.arange(1, len(counts) + 1)
+                cells = np.where(ids == nodata, 0, ids)[components].astype(np.float64)
+
+                fd.seek(0)
+                writer = MatrixAsciiGridWriter(f_asc, grid, nodata)
+                try:
+                    for top in range(0, grid.nrows, strip_rows):
+                        bottom = min(grid.nrows, top + strip_rows)
+                        labels = np.fromfile(fd, dtype=np.int64, count=(bottom - top) * grid.ncols)
+                        values = np.where(labels == ClusterEngine.NODATA, nodata, 0).astype(np.float64)
+                        clustered = labels >= 0
+                        values[clustered] = cells[labels[clustered]]
+                        writer.writeRows(values.reshape(bottom - top, grid.ncols))
+                        progress.setPercentage(50 + int(50 * bottom / grid.nrows))
+                finally:
+                    writer.close()
+        finally:
+            os.remove(f_labels)
+
+        area = grid.cellsize * grid.cellsize
+        with open(f_csv, 'w') as fd:
+            fd.write('id;type;count;area\n')
+            for cluster, (value, count) in enumerate(zip(classes.tolist(), counts.tolist())):
+                fd.write(';'.join([str(cluster + 1), str(value), str(count), formatDouble(count * area)]) + '\n')
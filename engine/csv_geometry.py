@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import sys
+import csv
+import json
+import math
+import itertools
+
+import numpy as np
+
+from ..ChloeCache import ChloeCache
+
+
+class CsvGeometry:
+    """Grid of the X;Y of a csv for the from csv treatment, the X;Y being cell centers
+
+    The extent is the min and max of X and Y over the whole file, read by chunks. The
+    cellsize is the greatest common divisor of the steps between the distinct X and Y of
+    the first records. The geometry of a file is kept by path, size and mtime in memory
+    and, when the Chloe cache is enabled, in its directory, so it is read once.
+
+    Usage:
+
+        geometry = CsvGeometry.getGeometry(f_csv)   # dict ncols, nrows, xllcorner, yllcorner, cellsize
+    """
+
+    CHUNK_RECORDS  = 256 * 1024   # Records read at once
+    SAMPLE_RECORDS = 100000       # Records whose X;Y give the cellsize
+
+    FILE = 'csv_geometry.json'    # geometries in the Chloe cache directory
+
+    _geometries = None   # geometry by 'path|size|mtime'
+
+    @staticmethod
+    def getKey(f_csv):
+        stat = os.stat(f_csv)
+        f_abs = os.path.abspath(f_csv)
+        if isinstance(f_abs, bytes):
+            # a byte path may not be ASCII (accented folder), the key is unicode for json
+            f_abs = f_abs.decode(sys.getfilesystemencoding() or 'utf-8', 'replace')
+        return u'{}|{}|{}'.format(f_abs, stat.st_size, stat.st_mtime)
+
+    @staticmethod
+    def load():
+        if CsvGeometry._geometries is None:
+            CsvGeometry._geometries = {}
+            if ChloeCache.getCacheSize() <= 0:
+                return CsvGeometry._geometries
+            try:
+                with open(os.path.join(ChloeCache.getCacheDir(), CsvGeometry.FILE)) as fd:
+                    CsvGeometry._geometries = json.load(fd)
+            except (IOError, OSError, ValueError):
+                pass
+        return CsvGeometry._geometries
+
+    @staticmethod
+    def save():
+        if ChloeCache.getCacheSize() <= 0:
+            return   # the cache is disabled, kept for the session only
+        cache_dir = ChloeCache.getCacheDir()
+        try:
+            if not os.path.isdir(cache_dir):
+                os.makedirs(cache_dir)
+            with open(os.path.join(cache_dir, CsvGeometry.FILE), 'w') as fd:
+                json.dump(CsvGeometry._geometries, fd)
+        except (IOError, OSError):
+            pass   # kept for the session only
+
+    @staticmethod
+    def getGeometry(f_csv):
+        """Geometry of the grid of the csv, ValueError if the csv has no X;Y"""
+        geometries = CsvGeometry.load()
+        key = CsvGeometry.getKey(f_csv)
+        if key not in geometries:
+            # the geometries of the previous versions of the file are useless
+            prefix = key.rsplit(u'|', 2)[0] + u'|'
+            for old in [old for old in geometries if old.startswith(prefix)]:
+                del geometries[old]
+            geometries[key] = CsvGeometry.compute(f_csv)
+            CsvGeometry.save()
+        return dict(geometries[key])
+
+    @staticmethod
+    def getDivisor(values):
+        """Greatest common divisor of positive floats, the remainders below 1e-6 of the
+        smallest value being rounding errors
+        """
+        tolerance = min(values) * 1e-6
+        divisor = min(values)
+        for value in values:
+            a, b = max(divisor, value), min(divisor, value)
+            while b > tolerance:
+                a, b = b, math.fmod(a, b)
+                if a - b < tolerance:
+                    b = 0.0
+            divisor = a
+        return divisor
+
+    @staticmethod
+    def getStep(coordinates):
+        """Cellsize given by the steps between the distinct coordinates, None if there is one"""
+        steps = np.unique(np.diff(np.unique(coordinates)))
+        return CsvGeometry.getDivisor(steps.tolist()) if len(steps) else None
+
+    @staticmethod
+    def compute(f_csv):
+        with open(f_csv, 'rb') as fd:
+            reader = csv.reader(fd, delimiter=';')
+            headers = [header.strip() for header in next(reader)]
+            if 'X' not in headers or 'Y' not in headers:
+                raise ValueError('no X or Y column in ' + f_csv)
+            x_column, y_column = headers.index('X'), headers.index('Y')
+
+            bounds = None
+            steps = []
+            read = 0
+            while True:
+                rows = [row for row in itertools.islice(reader, CsvGeometry.CHUNK_RECORDS) if row]
+                if not rows:
+                    break
+                x = np.array([row[x_column].strip() for row in rows]).astype(np.float64)
+                y = np.array([row[y_column].strip() for row in rows]).astype(np.float64)
+                chunk = [x.min(), x.max(), y.min(), y.max()]
+                if bounds is None:
+                    bounds = chunk
+                else:
+                    bounds = [min(bounds[0], chunk[0]), max(bounds[1], chunk[1]),
+                              min(bounds[2], chunk[2]), max(bounds[3], chunk[3])]
+                if read < CsvGeometry.SAMPLE_RECORDS:
+                    sample = CsvGeometry.SAMPLE_RECORDS - read
+                    steps += [step for step in [CsvGeometry.getStep(x[:sample]), CsvGeometry.getStep(y[:sample])]
+                              if step is not None]
+                read += len(rows)
+
+        if bounds is None:
+            raise ValueError('no record in ' + f_csv)
+        cellsize = CsvGeometry.getDivisor(steps) if steps else 1.0
+        # the digits of the rounding errors are removed
+        cellsize = float('%.10g' % cellsize)
+        xmin, xmax, ymin, ymax = bounds
+        return {
+            'ncols':     int(round((xmax - xmin) / cellsize)) + 1,
+            'nrows':     int(round((ymax - ymin) / cellsize)) + 1,
+            'xllcorner': xmin - cellsize / 2.0,
+            'yllcorner': ymin - cellsize / 2.0,
+            'cellsize':  cellsize,
+        }
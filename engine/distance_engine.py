@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import tempfile
+
+import numpy as np
+
+from ..ChloeTiling import ChloeTiling
+from .raster_io import AsciiGrid, MatrixAsciiGridWriter
+from .sliding_engine import SlidingEngine
+
+
+class DistanceEngine:
+    """Distance treatment computed with the chamfer distance of Chloe in streamed passes
+
+    Chloe computes the distances to the cells of the values of distance_from with a
+    chamfer mask of 13 weights (apiland ChamferDistance): a forward raster scan then a
+    backward one, the weights being divided by the one of the direct neighbour (68) and
+    multiplied by the cellsize. Every row only depends on the 6 rows before it in the
+    scan, so the forward pass is done strip by strip from the top with a halo of 6 rows,
+    the backward pass from the bottom on the same scratch file, mapped in memory, and the
+    grid is written in a third pass: a raster larger than the memory is computed.
+
+    As in Chloe, the nodata cells are crossed by the distances and written as nodata, the
+    cells which no source reaches are -1 / 68 * cellsize.
+    """
+
+    STRIP_CELLS = 4 * 1024 * 1024  # Cells of a strip
+
+    # Chamfer mask of Chloe: (dx, dy, weight), mirrored on the half plane of the scan
+    CHAMFER = [(1, 0, 68), (1, 1, 96), (2, 1, 152), (3, 1, 215), (3, 2, 245),
+               (4, 1, 280), (4, 3, 340), (5, 1, 346), (6, 1, 413)]
+
+    @staticmethod
+    def getOffsets():
+        """Offsets (dx, dy, weight) of the cells before a cell in the forward scan
+
+        Return the ones of the rows above (dy > 0) and the weight of the left neighbour.
+        """
+        offsets = set()
+        for dx, dy, weight in DistanceEngine.CHAMFER:
+            offsets.update([(dx, dy, weight), (-dx, dy, weight), (dy, dx, weight), (-dy, dx, weight)])
+        above = sorted(offset for offset in offsets if offset[1] > 0)
+        return above, DistanceEngine.CHAMFER[0][2]
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this distance properties, else the reason why not"""
+        sources = SlidingEngine.splitList(properties.get('distance_from', ''))
+        if not sources or not all(value.lstrip('-').isdigit() for value in sources):
+            return 'no distance value or a value which is not an integer'
+        if not properties.get('output_asc'):
+            return 'no output ascii'
+        if not os.path.isfile(properties.get('input_ascii', '')) or not properties['input_ascii'].lower().endswith('.asc'):
+            return 'the input is not an ascii grid'
+        header, header_lines = ChloeTiling.getAsciiHeader(properties['input_ascii'])
+        if 'nodata_value' not in header:
+            return 'the input has no NODATA_value'
+        return None
+
+    @staticmethod
+    def scan(distances, halo):
+        """Chamfer scan of the rows of distances after the halo rows, in place
+
+        The halo rows are the rows already scanned before (inf outside the raster), the
+        distances not reached yet are inf. The backward scan is the one of the array
+        flipped on both axes.
+        """
+        above, weight = DistanceEngine.getOffsets()
+        steps = np.arange(distances.shape[1]) * float(weight)
+        for y in range(halo, len(distances)):
+            row = distances[y]
+            for dx, dy, w in above:
+                source = distances[y - dy]
+                if dx > 0:
+                    np.minimum(row[dx:], source[:-dx] + w, out=row[dx:])
+                elif dx < 0:
+                    np.minimum(row[:dx], source[-dx:] + w, out=row[:dx])
+                else:
+                    np.minimum(row, source + w, out=row)
+            # left neighbour: row[x] = min over j <= x of row[j] + weight * (x - j)
+            row[:] = np.minimum.accumulate(row - steps) + steps
+
+    @staticmethod
+    def run(properties, progress):
+        grid    = AsciiGrid(properties['input_ascii'])
+        nodata  = grid.nodata
+        sources = [int(value) for value in SlidingEngine.splitList(properties['distance_from'])]
+        halo    = max(dy for dx, dy, weight in DistanceEngine.getOffsets()[0])
+
+        f_asc = properties['output_asc']
+        if os.path.dirname(f_asc) and not os.path.isdir(os.path.dirname(f_asc)):
+            os.makedirs(os.path.dirname(f_asc))
+
+        strip_rows = grid.getStripRows(DistanceEngine.STRIP_CELLS)
+        handle, f_scratch = tempfile.mkstemp(suffix='.distances')
+        os.close(handle)
+        try:
+            distances = np.memmap(f_scratch, dtype=np.float64, mode='w+', shape=(grid.nrows, grid.ncols))
+
+            # Forward scan from the top
+            previous = np.full((halo, grid.ncols), np.inf)
+            for top in range(0, grid.nrows, strip_rows):
+                bottom = min(grid.nrows, top + strip_rows)
+                values = grid.readRows(top, bottom)
+                rows = np.vstack([previous, np.where(np.in1d(values, sources).reshape(values.shape), 0.0, np.inf)])
+                DistanceEngine.scan(rows, halo)
+                distances[top:bottom] = rows[halo:]
+                previous = rows[-halo:]
+                progress.setPercentage(int(40 * bottom / grid.nrows))
+
+            # Backward scan from the bottom
+            following = np.full((halo, grid.ncols), np.inf)
+            for bottom in range(grid.nrows, 0, -strip_rows):
+                top = max(0, bottom - strip_rows)
+                rows = np.vstack([np.array(distances[top:bottom]), following])
+                DistanceEngine.scan(rows[::-1, ::-1], halo)
+                distances[top:bottom] = rows[:bottom - top]
+                following = rows[:halo]
+                progress.setPercentage(40 + int(40 * (grid.nrows - top) / grid.nrows))
+
+            writer = MatrixAsciiGridWriter(f_asc, grid, nodata)
+            try:
+                for top in range(0, grid.nrows, strip_rows):
+                    bottom = min(grid.nrows, top + strip_rows)
+                    values = grid.readRows(top, bottom)
+                    rows = np.where(np.isinf(distances[top:bottom]), -1.0, distances[top:bottom])
+                    writer.writeRows(np.where(values == nodata, nodata, rows / DistanceEngine.CHAMFER[0][2] * grid.cellsize))
+                    progress.setPercentage(80 + int(20 * bottom / grid.nrows))
+            finally:
+                writer.close()
+            del distances
+        finally:
+            os.remove(f_scratch)
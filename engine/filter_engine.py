@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+
+import numpy as np
+
+from ..ChloeTiling import ChloeTiling
+from .raster_io import AsciiGrid, MatrixAsciiGridWriter
+from .search_and_replace_engine import SearchAndReplaceEngine
+
+
+class FilterEngine:
+    """Filter treatment computed on aligned strips of the input and of the filter
+
+    As in Chloe (the Pixel2PixelMatrixCalculation of Model.runFilter), a cell keeps the
+    value of the input, nodata included, where the value of the filter is one of the
+    filter_values, else it is 0. Both grids are read together by strips of GDAL blocks
+    and the output is written strip by strip.
+    """
+
+    STRIP_CELLS = 4 * 1024 * 1024  # Cells of the strips of both grids
+
+    @staticmethod
+    def getValues(properties):
+        """filter_values as Chloe reads them (Integer.parseInt), a ValueError if it fails"""
+        values = []
+        for value in SearchAndReplaceEngine.split(properties['filter_values'].replace('{', '').replace('}', ''), ';'):
+            if not SearchAndReplaceEngine.INTEGER.match(value) or not -2 ** 31 <= int(value) < 2 ** 31:
+                raise ValueError('unreadable filter value: ' + value)
+            values.append(int(value))
+        return values
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this filter properties, else the reason why not"""
+        FilterEngine.getValues(properties)
+        if not properties.get('output_asc'):
+            return 'no output ascii'
+        sizes = set()
+        for key in ['input_ascii', 'ascii_filter']:
+            f_asc = properties.get(key, '')
+            if not os.path.isfile(f_asc) or not f_asc.lower().endswith('.asc'):
+                return key + ' is not an ascii grid'
+            header, header_lines = ChloeTiling.getAsciiHeader(f_asc)
+            if 'nodata_value' not in header:
+                return key + ' has no NODATA_value'
+            sizes.add((int(header['ncols']), int(header['nrows'])))
+        if len(sizes) > 1:
+            return 'the input and the filter are of different sizes'
+        return None
+
+    @staticmethod
+    def run(properties, progress):
+        grid   = AsciiGrid(properties['input_ascii'])
+        mask   = AsciiGrid(properties['ascii_filter'])
+        values = FilterEngine.getValues(properties)
+
+        f_asc = properties['output_asc']
+        if os.path.dirname(f_asc) and not os.path.isdir(os.path.dirname(f_asc)):
+            os.makedirs(os.path.dirname(f_asc))
+
+        strip_rows = grid.getStripRows(FilterEngine.STRIP_CELLS // 2)
+        writer = MatrixAsciiGridWriter(f_asc, grid, grid.nodata)
+        try:
+            for top in range(0, grid.nrows, strip_rows):
+                bottom = min(grid.nrows, top + strip_rows)
+                filters = mask.readRows(top, bottom)
+                kept = np.in1d(filters, values).reshape(filters.shape)
+                writer.writeRows(np.where(kept, grid.readRows(top, bottom), 0.0))
+                progress.setPercentage(int(100 * bottom / grid.nrows))
+        finally:
+            writer.close()
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import csv
+import itertools
+
+import numpy as np
+
+from .raster_io import AsciiGridWriter, formatDouble
+from .search_and_replace_engine import SearchAndReplaceEngine
+
+
+class FromCsvEngine:
+    """From csv treatment computed on chunks of records written as they are read
+
+    Chloe (apiland SpatialCsvManager.exportAsciiGrid) goes through the cells from the top
+    left, the centers being added cellsize by cellsize, with the records of the csv in
+    their order: a cell within cellsize / 2 of the X;Y of the current record gets its text
+    and the next record is read, else the cell gets -1 (the nodata value of Raster, the
+    header has nodata_value). A record out of this order stops the reading, the following
+    cells are all -1.
+
+    The engine reads the records by chunks, finds the cell of every record with NumPy and
+    keeps the records taken by this scan, then writes the text of their cells and of the
+    cells between them, in one pass and one output per variable: the memory does not
+    depend on the number of records.
+    """
+
+    CHUNK_RECORDS = 256 * 1024   # Records read at once
+
+    NODATA = '-1'   # Raster.getNoDataValue() written by Chloe in the cells without record
+
+    @staticmethod
+    def getNumber(properties, key, parse):
+        value = properties[key]
+        if parse is int and not SearchAndReplaceEngine.INTEGER.match(value):
+            raise ValueError('{} is not an integer: {}'.format(key, value))
+        return parse(value)
+
+    @staticmethod
+    def getOutputs(properties, headers):
+        """Columns of the csv written and their ascii grid, as Chloe selects them"""
+        variables = set(SearchAndReplaceEngine.split(properties['variables'].replace('{', '').replace('}', '').replace(' ', ''), ';'))
+        if len(variables) == 1 and not properties.get('output_folder'):
+            columns = [column for column in headers if list(variables)[0] in column]
+            if len(columns) != 1 or not properties.get('output_asc'):
+                raise ValueError('variables do not give one column of the csv')
+            return [(columns[0], properties['output_asc'])]
+
+        if not properties.get('output_folder'):
+            raise ValueError('no output folder for several variables')
+        prefix = properties['output_folder'] + '/' + os.path.basename(properties['input_csv']).replace('.csv', '') + '_'
+        if variables:
+            columns = [column for column in headers if any(variable in column for variable in variables)]
+        else:
+            columns = [column for column in headers if column.upper() not in ('X', 'Y')]
+        return [(column, prefix + column + '.asc') for column in columns]
+
+    @staticmethod
+    def readHeaders(reader):
+        return [header.strip() for header in next(reader)]
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this from csv properties, else the reason why not"""
+        if not os.path.isfile(properties.get('input_csv', '')):
+            return 'the input is not a csv file'
+        for key in ['ncols', 'nrows', 'nodata_value']:
+            FromCsvEngine.getNumber(properties, key, int)
+        for key in ['xllcorner', 'yllcorner', 'cellsize']:
+            FromCsvEngine.getNumber(properties, key, float)
+        if not FromCsvEngine.getNumber(properties, 'cellsize', float) > 0:
+            return 'cellsize is not positive'
+        with open(properties['input_csv'], 'rb') as fd:
+            reader = csv.reader(fd, delimiter=';')
+            headers = FromCsvEngine.readHeaders(reader)
+            if 'X' not in headers or 'Y' not in headers:
+                return 'no X or Y column'
+            FromCsvEngine.getOutputs(properties, headers)
+            records = FromCsvEngine.readRecords(reader, headers, [], 1)
+        if records is None:
+            return 'no record'
+        return None
+
+    @staticmethod
+    def readRecords(reader, headers, columns, count):
+        """X, Y (float arrays) and texts (object arrays) of the columns of the next count records,
+        None at the end of the csv
+        """
+        rows = [row for row in itertools.islice(reader, count) if row]
+        if not rows:
+            return None
+        width = len(headers)
+        rows = [row + [''] * (width - len(row)) if len(row) < width else row for row in rows]
+        x = np.array([row[headers.index('X')].strip() for row in rows]).astype(np.float64)
+        y = np.array([row[headers.index('Y')].strip() for row in rows]).astype(np.float64)
+        texts = []
+        for column in columns:
+            index = headers.index(column)
+            texts.append(np.array([row[index].strip() for row in rows], dtype=object))
+        return x, y, texts
+
+    @staticmethod
+    def getCenters(start, step, limit, descending):
+        """Centers of the cells as Chloe computes them, one addition by cell"""
+        centers = []
+        value = start
+        while (value >= limit) if descending else (value < limit):
+            centers.append(value)
+            value = value - step if descending else value + step
+        return np.array(centers, dtype=np.float64)
+
+    @staticmethod
+    def getCandidates(values, centers, cellsize, descending):
+        """First and last center within cellsize / 2 of the values, -1 if none"""
+        first = np.full(len(values), -1, dtype=np.int64)
+        last = np.full(len(values), -1, dtype=np.int64)
+        if not len(centers):
+            return first, last
+        with np.errstate(invalid='ignore'):
+            offsets = (centers[0] - values) if descending else (values - centers[0])
+            nearest = np.rint(np.nan_to_num(offsets / cellsize)).clip(-1, len(centers))
+        nearest = nearest.astype(np.int64)
+        for delta in [-1, 0, 1]:
+            index = nearest + delta
+            inside = (index >= 0) & (index < len(centers))
+            index = index.clip(0, len(centers) - 1)
+            with np.errstate(invalid='ignore'):
+                near = inside & (np.abs(values - centers[index]) < cellsize / 2.0)
+            first = np.where(near & (first < 0), index, first)
+            last = np.where(near, index, last)
+        return first, last
+
+    @staticmethod
+    def run(properties, progress):
+        ncols     = FromCsvEngine.getNumber(properties, 'ncols', int)
+        nrows     = FromCsvEngine.getNumber(properties, 'nrows', int)
+        xllcorner = FromCsvEngine.getNumber(properties, 'xllcorner', float)
+        yllcorner = FromCsvEngine.getNumber(properties, 'yllcorner', float)
+        cellsize  = FromCsvEngine.getNumber(properties, 'cellsize', float)
+        nodata    = FromCsvEngine.getNumber(properties, 'nodata_value', int)
+
+        half = cellsize / 2.0
+        ys = FromCsvEngine.getCenters(yllcorner + (nrows - 1) * cellsize + half, cellsize, yllcorner, True)
+        xs = FromCsvEngine.getCenters(xllcorner + cellsize - half, cellsize, xllcorner + ncols * cellsize, False)
+        width = len(xs)
+        cells = len(ys) * width
+
+        with open(properties['input_csv'], 'rb') as fd:
+            reader = csv.reader(fd, delimiter=';')
+            headers = FromCsvEngine.readHeaders(reader)
+            outputs = FromCsvEngine.getOutputs(properties, headers)
+            columns = [column for column, f_asc in outputs]
+
+            writers = []
+            try:
+                for column, f_asc in outputs:
+                    if os.path.dirname(f_asc) and not os.path.isdir(os.path.dirname(f_asc)):
+                        os.makedirs(os.path.dirname(f_asc))
+                    writer = open(f_asc, 'w')
+                    writers.append(writer)
+                    writer.write('ncols {}\nnrows {}\nxllcorner {}\nyllcorner {}\ncellsize {}\nNODATA_value {}\n'.format(
+                        ncols, nrows, formatDouble(xllcorner), formatDouble(yllcorner), formatDouble(cellsize), nodata))
+
+                position = 0   # next cell of the scan
+                last = None    # cells and texts of the last record taken
+                while position < cells:
+                    line = reader.line_num
+                    try:
+                        records = FromCsvEngine.readRecords(reader, headers, columns, FromCsvEngine.CHUNK_RECORDS)
+                    except ValueError as e:
+                        raise ValueError('unreadable X or Y in the records after line {} of the csv ({})'.format(line, e))
+                    if records is None:
+                        # end of the csv: Chloe keeps the last record, its next cells take its text
+                        if last is not None:
+                            cells_left = np.array([cell for cell in last[0] if cell >= position], dtype=np.int64)
+                            if len(cells_left):
+                                FromCsvEngine.writeCells(writers, position, cells_left,
+                                                         [np.array([text] * len(cells_left), dtype=object) for text in last[1]], width)
+                                position = cells_left[-1] + 1
+                        break
+                    x, y, texts = records
+                    first_rows, last_rows = FromCsvEngine.getCandidates(y, ys, cellsize, True)
+                    first_cols, last_cols = FromCsvEngine.getCandidates(x, xs, cellsize, False)
+                    taken = FromCsvEngine.getTaken(position, first_rows, last_rows, first_cols, last_cols, width)
+                    count = np.count_nonzero(taken >= 0)
+                    if count:
+                        FromCsvEngine.writeCells(writers, position, taken[:count], [text[:count] for text in texts], width)
+                        position = taken[count - 1] + 1
+                        i = count - 1
+                        last = (FromCsvEngine.getCells(first_rows[i], last_rows[i], first_cols[i], last_cols[i], width),
+                                [text[i] for text in texts])
+                    progress.setPercentage(int(100 * position / cells))
+                    if count < len(x):
+                        break   # a record out of the order of the cells, Chloe reads no more
+                FromCsvEngine.writeNodata(writers, position, cells, width)
+            except ValueError:
+                # no partial grid is left, the caller runs Chloe
+                for writer in writers:
+                    writer.close()
+                    os.remove(writer.name)
+                raise
+            finally:
+                for writer in writers:
+                    writer.close()
+
+        if properties.get('output_folder'):
+            prj = AsciiGridWriter.getPrj()
+            if prj is not None:
+                for column, f_asc in outputs:
+                    with open(f_asc.replace('.asc', '') + '.prj', 'wb') as fd:
+                        fd.write(prj)
+
+    @staticmethod
+    def getCells(first_row, last_row, first_col, last_col, width):
+        """Cells within cellsize / 2 of a record, in the order of the scan, none if first_row or
+        first_col is -1
+        """
+        if first_row < 0 or first_col < 0:
+            return []
+        return sorted(set(row * width + col for row in (first_row, last_row) for col in (first_col, last_col)))
+
+    @staticmethod
+    def getTaken(position, first_rows, last_rows, first_cols, last_cols, width):
+        """Cells of the records taken by the scan from the cell position
+
+        A record takes the first of its cells after the previous record, the array stops
+        with -1 at the first record without such a cell: Chloe reads no more.
+        """
+        found = (first_rows >= 0) & (first_cols >= 0)
+        firsts = np.where(found, first_rows * width + first_cols, -1)
+        if ((first_rows == last_rows) & (first_cols == last_cols)).all():
+            # one cell by record: taken while the cells increase
+            previous = np.concatenate([[position - 1], firsts[:-1]])
+            stopped = ~found | (firsts <= previous)
+            if stopped.any():
+                return np.concatenate([firsts[:np.argmax(stopped)], [-1]])
+            return firsts
+        # records on the edge of two cells, one by one
+        taken = []
+        for i in range(len(firsts)):
+            cells = [cell for cell in FromCsvEngine.getCells(first_rows[i], last_rows[i], first_cols[i], last_cols[i], width)
+                     if cell >= position]
+            if not cells:
+                taken.append(-1)
+                break
+            taken.append(cells[0])
+            position = cells[0] + 1
+        return np.array(taken, dtype=np.int64)
+
+    @staticmethod
+    def writeNodata(writers, position, end, width):
+        """Write the cells from position to end without record, by rows"""
+        while position < end:
+            stop = min(end, (position // width + 1) * width)
+            line = (FromCsvEngine.NODATA + ' ') * (stop - position) + ('\n' if stop % width == 0 else '')
+            for writer in writers:
+                writer.write(line)
+            position = stop
+
+    @staticmethod
+    def writeCells(writers, position, taken, texts, width):
+        """Write the cells from position to the last taken cell as Chloe: the text of the record
+        followed by a space, -1 for the cells without record, a new line at the end of the rows
+        """
+        span = taken[-1] + 1 - position
+        if span > 4 * len(taken) + width:
+            # few records on many cells
+            for i, cell in enumerate(taken.tolist()):
+                FromCsvEngine.writeNodata(writers, position, cell, width)
+                line = ('\n' if (cell + 1) % width == 0 else '')
+                for writer, text in zip(writers, texts):
+                    writer.write(text[i] + ' ' + line)
+                position = cell + 1
+            return
+        tokens = np.empty(span, dtype=object)
+        row_ends = np.arange(width - 1 - position % width, span, width)
+        for writer, text in zip(writers, texts):
+            tokens[:] = FromCsvEngine.NODATA + ' '
+            tokens[taken - position] = text + ' '
+            tokens[row_ends] = tokens[row_ends] + '\n'
+            writer.write(''.join(tokens.tolist()))
@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import csv
+import math
+import struct
+
+from osgeo import ogr
+import numpy as np
+
+from .raster_io import AsciiGridWriter, formatDouble
+from .search_and_replace_engine import SearchAndReplaceEngine
+
+
+class Shapes:
+    """Polygons or lines of a shapefile with the text of their cells, read once for all the
+    cellsizes
+
+    As Chloe (apiland ExportAsciiGridFromShapefileAnalysis) a cell gets the text of the
+    attribute (through the lookup table if it has it) of a polygon containing its center,
+    boundary included, or of a line within cellsize * sqrt(2) / 2 of its center. With 100
+    parts or more Chloe only looks at the parts whose envelope is within 1 of the center.
+    A cell in several geometries gets the text of one of them, as in Chloe whose choice
+    depends on the order of a HashSet.
+
+    The shapefile is read with the geometries and the attribute only, the values of the
+    attribute are coded as they are read and the text (and lookup) of every distinct value
+    is computed once. The polygons are filled row by row between the crossings of their
+    edges, the lines cell by cell around every segment with the distance of JTS
+    CGAlgorithms.
+    """
+
+    INDEXED_PARTS = 100        # Parts from which Chloe looks the geometries up in a STRtree
+    CROSSINGS = 1024 * 1024    # Crossings of the edges and the rows computed at once
+
+    def __init__(self, f_shp, attribute, lookup):
+        self.polygons = []     # (xmin, xmax, ymin, ymax, edges x0 y0 x1 y1 (n, 4), index)
+        segments = []          # x0, y0, x1, y1, index, envelope of the part (xmin, xmax, ymin, ymax)
+        codes = {}             # code of the distinct values of the attribute
+
+        self.bounds = Shapes.getBounds(f_shp)
+        datasource = ogr.Open(f_shp)
+        if datasource is None:
+            raise IOError('unreadable shapefile: ' + f_shp)
+        layer = datasource.GetLayer(0)
+        self.lines = Shapes.isLines(layer)
+        field = Shapes.getField(layer, attribute)
+        definition = layer.GetLayerDefn()
+        integer = Shapes.isInteger(definition.GetFieldDefn(field))
+        layer.SetIgnoredFields([definition.GetFieldDefn(k).GetName() for k in range(definition.GetFieldCount()) if k != field])
+
+        self.parts = 0
+        feature = layer.GetNextFeature()
+        while feature is not None:
+            geometry = feature.GetGeometryRef()
+            if geometry is not None:
+                code = codes.setdefault(feature.GetField(field) if feature.IsFieldSet(field) else None, len(codes))
+                for part in Shapes.getParts(geometry):
+                    self.parts += 1
+                    if self.lines:
+                        points = np.array(part.GetPoints(), dtype=np.float64)[:, :2]
+                        envelope = [points[:, 0].min(), points[:, 0].max(), points[:, 1].min(), points[:, 1].max()]
+                        part_segments = np.empty((len(points) - 1, 9))
+                        part_segments[:, 0:2] = points[:-1]
+                        part_segments[:, 2:4] = points[1:]
+                        part_segments[:, 4] = code
+                        part_segments[:, 5:9] = envelope
+                        segments.append(part_segments)
+                    else:
+                        edges = []
+                        for k in range(part.GetGeometryCount()):
+                            points = np.array(part.GetGeometryRef(k).GetPoints(), dtype=np.float64)[:, :2]
+                            if len(points) and (points[0] != points[-1]).any():
+                                points = np.vstack([points, points[:1]])
+                            edges.append(np.hstack([points[:-1], points[1:]]))
+                        edges = np.vstack(edges) if edges else np.empty((0, 4))
+                        if len(edges):
+                            self.polygons.append((min(edges[:, 0].min(), edges[:, 2].min()),
+                                                  max(edges[:, 0].max(), edges[:, 2].max()),
+                                                  min(edges[:, 1].min(), edges[:, 3].min()),
+                                                  max(edges[:, 1].max(), edges[:, 3].max()),
+                                                  edges, code))
+            feature = layer.GetNextFeature()
+        datasource = None
+
+        # the attribute codes replaced by the index of their text
+        self.texts, table = Shapes.join(codes, integer, lookup)   # text of the cells, by index
+        self.polygons = [polygon[:5] + (int(table[polygon[5]]),) for polygon in self.polygons]
+        self.segments = np.vstack(segments) if segments else np.empty((0, 9))
+        self.segments[:, 4] = table[self.segments[:, 4].astype(np.int64)]
+        self.boxes = np.array([polygon[:4] for polygon in self.polygons], dtype=np.float64).reshape(-1, 4)
+
+    @staticmethod
+    def getBounds(f_shp):
+        """minx, maxx, miny, maxy of the header of the shapefile"""
+        with open(f_shp, 'rb') as fd:
+            header = fd.read(100)
+        if len(header) < 100:
+            raise IOError('unreadable shapefile: ' + f_shp)
+        xmin, ymin, xmax, ymax = struct.unpack('<4d', header[36:68])
+        return xmin, xmax, ymin, ymax
+
+    @staticmethod
+    def isLines(layer):
+        """True for lines, False for polygons, a ValueError for the other shapes (Chloe writes
+        only nodata for them)
+        """
+        geometry_type = ogr.GT_Flatten(layer.GetGeomType())
+        if geometry_type in (ogr.wkbLineString, ogr.wkbMultiLineString):
+            return True
+        if geometry_type in (ogr.wkbPolygon, ogr.wkbMultiPolygon):
+            return False
+        raise ValueError('the shapefile has neither polygons nor lines')
+
+    @staticmethod
+    def getField(layer, attribute):
+        """Index of the attribute, its name compared as Chloe does (equalsIgnoreCase)"""
+        definition = layer.GetLayerDefn()
+        for field in range(definition.GetFieldCount()):
+            field_definition = definition.GetFieldDefn(field)
+            if field_definition.GetName().lower() == attribute.lower():
+                if field_definition.GetType() not in (ogr.OFTInteger, getattr(ogr, 'OFTInteger64', ogr.OFTInteger),
+                                                      ogr.OFTReal, ogr.OFTString):
+                    raise ValueError('attribute {} is neither a number nor a string'.format(attribute))
+                return field
+        raise ValueError('no attribute {} in the shapefile'.format(attribute))
+
+    @staticmethod
+    def isInteger(field_definition):
+        """True if the dbf reader of Chloe gives integers for the field (numbers without decimals)"""
+        return field_definition.GetType() != ogr.OFTString and field_definition.GetPrecision() == 0
+
+    @staticmethod
+    def join(codes, integer, lookup):
+        """Texts of the codes and index of the text of every code, the text of every distinct
+        value and its lookup computed once
+        """
+        table = np.empty(len(codes), dtype=np.int64)
+        indexes = {}
+        for value, code in codes.items():
+            text = Shapes.getText(value, integer)
+            table[code] = indexes.setdefault(lookup.get(text, text), len(indexes))
+        return sorted(indexes, key=indexes.get), table
+
+    @staticmethod
+    def getText(value, integer):
+        """Text of an attribute value as Chloe writes it (toString of the value read in the dbf)"""
+        if value is None:
+            return 'null'
+        if isinstance(value, float):
+            return str(int(value)) if integer and value == math.floor(value) else formatDouble(value)
+        if isinstance(value, (int, long)):
+            return str(value)
+        return value.strip()
+
+    @staticmethod
+    def getParts(geometry):
+        """Polygons or lines of a geometry, as the GeometryCollection.getGeometryN of Chloe"""
+        if ogr.GT_Flatten(geometry.GetGeometryType()) in (ogr.wkbMultiPolygon, ogr.wkbMultiLineString):
+            return [geometry.GetGeometryRef(k) for k in range(geometry.GetGeometryCount())]
+        return [geometry]
+
+    def fill(self, values, xs, ys, cellsize):
+        """Index of the text of the cells of centers xs (increasing) and ys (decreasing) in
+        values, -1 if none
+        """
+        if self.lines:
+            self.fillLines(values, xs, ys, cellsize)
+        else:
+            boxes = self.boxes
+            kept = np.nonzero((boxes[:, 0] <= xs[-1]) & (boxes[:, 1] >= xs[0]) &
+                              (boxes[:, 2] <= ys[0]) & (boxes[:, 3] >= ys[-1]))[0]
+            for k in kept.tolist():
+                Shapes.fillPolygon(values, xs, ys, *self.polygons[k])
+
+    @staticmethod
+    def fillPolygon(values, xs, ys, xmin, xmax, ymin, ymax, edges, index):
+        """Cells of a polygon (center inside or on the boundary) set to index"""
+        first_row, last_row = np.searchsorted(-ys, -ymax, side='left'), np.searchsorted(-ys, -ymin, side='right')
+        first_col, last_col = np.searchsorted(xs, xmin, side='left'), np.searchsorted(xs, xmax, side='right')
+        if first_row >= last_row or first_col >= last_col:
+            return
+        centers = xs[first_col:last_col]
+        edge_ymin = np.minimum(edges[:, 1], edges[:, 3])
+        edge_ymax = np.maximum(edges[:, 1], edges[:, 3])
+        step = max(1, Shapes.CROSSINGS // len(edges))
+        for top in range(first_row, last_row, step):
+            bottom = min(last_row, top + step)
+            rows_y = ys[top:bottom]
+            near = (edge_ymax >= rows_y[-1]) & (edge_ymin <= rows_y[0])
+            x0, y0, x1, y1 = [column[:, np.newaxis] for column in edges[near].T]
+            y = rows_y[np.newaxis, :]
+
+            # crossings of the edges and the rows, each edge including its lower end only
+            crossing = (y0 > y) != (y1 > y)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                xc = np.where(crossing, x0 + (y - y0) * (x1 - x0) / (y1 - y0), np.inf)
+            xc.sort(axis=0)
+            counts = crossing.sum(axis=0)
+
+            # inside between the crossings 2k and 2k + 1, plus the horizontal edges on a row
+            starts, ends, rows = [], [], []
+            for k in range(0, counts.max() if len(counts) else 0, 2):
+                spans = np.nonzero(counts >= k + 2)[0]
+                starts.append(xc[k, spans])
+                ends.append(xc[k + 1, spans])
+                rows.append(spans)
+            edge, on_row = np.nonzero((y0 == y) & (y1 == y))
+            starts.append(np.minimum(x0, x1)[edge, 0])
+            ends.append(np.maximum(x0, x1)[edge, 0])
+            rows.append(on_row)
+
+            rows = np.concatenate(rows)
+            if not len(rows):
+                continue
+            changes = np.zeros((bottom - top, len(centers) + 1), dtype=np.int32)
+            np.add.at(changes, (rows, np.searchsorted(centers, np.concatenate(starts), side='left')), 1)
+            np.add.at(changes, (rows, np.searchsorted(centers, np.concatenate(ends), side='right')), -1)
+            inside = np.cumsum(changes[:, :-1], axis=1) > 0
+            values[top:bottom, first_col:last_col][inside] = index
+
+    def fillLines(self, values, xs, ys, cellsize):
+        """Cells within cellsize * sqrt(2) / 2 of a line set to the index of its text"""
+        radius = math.sqrt(2.0) * cellsize / 2.0
+        indexed = self.parts >= Shapes.INDEXED_PARTS
+        segments = self.segments
+        kept = np.nonzero((np.minimum(segments[:, 0], segments[:, 2]) - radius <= xs[-1]) &
+                          (np.maximum(segments[:, 0], segments[:, 2]) + radius >= xs[0]) &
+                          (np.minimum(segments[:, 1], segments[:, 3]) - radius <= ys[0]) &
+                          (np.maximum(segments[:, 1], segments[:, 3]) + radius >= ys[-1]))[0]
+        for ax, ay, bx, by, index, xmin, xmax, ymin, ymax in segments[kept].tolist():
+            left, right = min(ax, bx) - radius, max(ax, bx) + radius
+            bottom, top = min(ay, by) - radius, max(ay, by) + radius
+            if indexed:
+                # the STRtree query of Chloe, envelope of the center +-1
+                left, right = max(left, xmin - 1), min(right, xmax + 1)
+                bottom, top = max(bottom, ymin - 1), min(top, ymax + 1)
+            first_row, last_row = np.searchsorted(-ys, -top, side='left'), np.searchsorted(-ys, -bottom, side='right')
+            first_col, last_col = np.searchsorted(xs, left, side='left'), np.searchsorted(xs, right, side='right')
+            if first_row >= last_row or first_col >= last_col:
+                continue
+            px = xs[np.newaxis, first_col:last_col]
+            py = ys[first_row:last_row, np.newaxis]
+            near = Shapes.getDistance(px, py, ax, ay, bx, by) <= radius
+            values[first_row:last_row, first_col:last_col][near] = int(index)
+
+    @staticmethod
+    def getDistance(px, py, ax, ay, bx, by):
+        """Distance of the points to the segment, as JTS CGAlgorithms.distancePointLine"""
+        if ax == bx and ay == by:
+            return np.sqrt((px - ax) * (px - ax) + (py - ay) * (py - ay))
+        length2 = (bx - ax) * (bx - ax) + (by - ay) * (by - ay)
+        r = ((px - ax) * (bx - ax) + (py - ay) * (by - ay)) / length2
+        s = ((ay - py) * (bx - ax) - (ax - px) * (by - ay)) / length2
+        return np.where(r <= 0.0, np.sqrt((px - ax) * (px - ax) + (py - ay) * (py - ay)),
+                        np.where(r >= 1.0, np.sqrt((px - bx) * (px - bx) + (py - by) * (py - by)),
+                                 np.abs(s) * math.sqrt(length2)))
+
+
+class FromShapefileEngine:
+    """From shapefile treatment computed with the shapefiles read once for all the cellsizes
+
+    Every shapefile is read once (see Shapes) and every cellsize is rasterized from the
+    geometries in memory, strip by strip, and written as Chloe does: the grid starts at the
+    minx and miny of the shapefile (or of the properties), the cells without geometry are
+    -1 (the nodata value of Raster). As the cellsizes of Chloe are a TreeSet written in the
+    same output_asc, only the largest one is kept there.
+    """
+
+    STRIP_CELLS = 4 * 1024 * 1024  # Cells of a strip
+
+    NODATA = '-1'   # Raster.getNoDataValue() written by Chloe in the header and the cells without geometry
+
+    @staticmethod
+    def getShapefiles(properties):
+        """Shapefiles of input_shapefile, the .shp of a folder as Chloe lists them"""
+        f_input = properties['input_shapefile']
+        if os.path.isdir(f_input):
+            return [f_input + '/' + name for name in sorted(os.listdir(f_input)) if name.endswith('.shp')]
+        return [f_input]
+
+    @staticmethod
+    def getCellsizes(properties):
+        """Cellsizes in increasing order, as the TreeSet of Chloe"""
+        value = properties['cellsizes'].replace('{', '').replace('}', '').replace(' ', '')
+        return sorted(set(float(cellsize) for cellsize in SearchAndReplaceEngine.split(value, ';')))
+
+    @staticmethod
+    def getCellsizeText(cellsize):
+        """Chloe Model.formatDoubleToString: the integer part on 4 digits at least"""
+        text = str(int(cellsize))
+        while len(text) < 4:
+            text = '0' + text
+        return text
+
+    @staticmethod
+    def getOutputs(properties, f_shp):
+        """(cellsize, ascii grid) of a shapefile, the last cellsize written in a grid only"""
+        outputs = {}
+        for cellsize in FromShapefileEngine.getCellsizes(properties):
+            if properties.get('output_folder'):
+                name = os.path.basename(f_shp).replace('.shp', '')
+                f_asc = properties['output_folder'] + '/' + name + '_' + FromShapefileEngine.getCellsizeText(cellsize) + '.asc'
+            else:
+                f_asc = properties['output_asc']
+            outputs[f_asc] = cellsize
+        return sorted((cellsize, f_asc) for f_asc, cellsize in outputs.items())
+
+    @staticmethod
+    def getLookup(properties):
+        """Text of the attribute values in the lookup table, as Chloe reads it (CsvReader)"""
+        lookup = {}
+        if properties.get('lookup_table', ''):
+            with open(properties['lookup_table'], 'rb') as fd:
+                reader = csv.reader(fd, delimiter=';')
+                next(reader, None)
+                for row in reader:
+                    if row:
+                        lookup[row[0].strip().replace(' ', '')] = row[1].strip().replace(' ', '') if len(row) > 1 else ''
+        return lookup
+
+    @staticmethod
+    def getExtent(properties, shapes):
+        if 'minx' in properties:
+            return [float(properties[key]) for key in ['minx', 'maxx', 'miny', 'maxy']]
+        return list(shapes.bounds)
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this from shapefile properties, else the reason why not"""
+        if 'attribute' not in properties or 'cellsizes' not in properties:
+            return 'no attribute or cellsizes'
+        if not properties.get('output_folder') and not properties.get('output_asc'):
+            return 'no output'
+        if any(not cellsize > 0 for cellsize in FromShapefileEngine.getCellsizes(properties)):
+            return 'a cellsize is not positive'
+        shapefiles = FromShapefileEngine.getShapefiles(properties)
+        if not shapefiles:
+            return 'no shapefile'
+        if len(shapefiles) > 1 and not properties.get('output_folder'):
+            return 'several shapefiles written in one output ascii, the one kept by Chloe is not known'
+        for f_shp in shapefiles:
+            if not f_shp.endswith('.shp') or not os.path.isfile(f_shp):
+                return 'not a shapefile: ' + f_shp
+            datasource = ogr.Open(f_shp)
+            if datasource is None:
+                return 'unreadable shapefile: ' + f_shp
+            layer = datasource.GetLayer(0)
+            Shapes.isLines(layer)
+            Shapes.getField(layer, properties['attribute'])
+            datasource = None
+        FromShapefileEngine.getLookup(properties)
+        if 'minx' in properties:
+            FromShapefileEngine.getExtent(properties, None)
+        return None
+
+    @staticmethod
+    def getSize(minimum, maximum, cellsize):
+        """Cells between minimum and maximum, as Chloe computes ncols and nrows"""
+        if math.fmod(maximum - minimum, cellsize) == 0:
+            return int(math.floor((maximum - minimum) / cellsize))
+        return int(math.floor((maximum - minimum) / cellsize) + 1)
+
+    @staticmethod
+    def run(properties, progress):
+        lookup = FromShapefileEngine.getLookup(properties)
+        shapefiles = FromShapefileEngine.getShapefiles(properties)
+        rasters = len(shapefiles) * len(FromShapefileEngine.getOutputs(properties, shapefiles[0]))
+
+        done = 0
+        for f_shp in shapefiles:
+            shapes = Shapes(f_shp, properties['attribute'], lookup)
+            extent = FromShapefileEngine.getExtent(properties, shapes)
+            for cellsize, f_asc in FromShapefileEngine.getOutputs(properties, f_shp):
+                FromShapefileEngine.rasterize(shapes, extent, cellsize, f_asc)
+                done += 1
+                progress.setPercentage(int(100 * done / rasters))
+
+    @staticmethod
+    def rasterize(shapes, extent, cellsize, f_asc):
+        minx, maxx, miny, maxy = extent
+        ncols = FromShapefileEngine.getSize(minx, maxx, cellsize)
+        nrows = FromShapefileEngine.getSize(miny, maxy, cellsize)
+        top = miny + (math.floor((maxy - miny) / cellsize) + (0 if math.fmod(maxy - miny, cellsize) == 0 else 1)) * cellsize
+        xs = (minx + cellsize / 2.0) + np.arange(ncols) * cellsize
+        tokens = np.array([FromShapefileEngine.NODATA + ' '] + [text + ' ' for text in shapes.texts], dtype=object)
+
+        if os.path.dirname(f_asc) and not os.path.isdir(os.path.dirname(f_asc)):
+            os.makedirs(os.path.dirname(f_asc))
+        with open(f_asc, 'w') as fd:
+            fd.write('ncols {}\nnrows {}\nxllcorner {}\nyllcorner {}\ncellsize {}\nNODATA_value {}\n'.format(
+                ncols, nrows, formatDouble(minx), formatDouble(miny), formatDouble(cellsize), FromShapefileEngine.NODATA))
+            if ncols > 0:
+                strip_rows = max(1, FromShapefileEngine.STRIP_CELLS // ncols)
+                for first in range(0, nrows, strip_rows):
+                    ys = (top - cellsize / 2.0) - np.arange(first, min(nrows, first + strip_rows)) * cellsize
+                    values = np.full((len(ys), ncols), -1, dtype=np.int64)
+                    shapes.fill(values, xs, ys, cellsize)
+                    for row in tokens[values + 1]:
+                        fd.write(''.join(row) + '\n')
+
+        prj = AsciiGridWriter.getPrj()
+        if prj is not None:
+            with open(f_asc.replace('.asc', '') + '.prj', 'wb') as fd:
+                fd.write(prj)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import csv
+import math
+import hashlib
+
+import numpy as np
+
+from ..ChloeCache import ChloeCache
+
+
+class Friction:
+    """Friction of the values of the raster, read once from a friction file of Chloe
+
+    The file is a csv (separator ;) with the columns code and friction, as Chloe a code
+    given twice keeps its last friction.
+    """
+
+    def __init__(self, f_friction):
+        frictions = {}
+        with open(f_friction, 'rb') as fd:
+            reader = csv.reader(fd, delimiter=';')
+            header = [title.strip() for title in next(reader)]
+            code_column = header.index('code')
+            friction_column = header.index('friction')
+            for record in reader:
+                if any(field.strip() for field in record):
+                    frictions[float(record[code_column])] = float(record[friction_column])
+        if not frictions:
+            raise ValueError('no friction in ' + f_friction)
+        self.f_friction = f_friction
+        self.codes      = np.array(sorted(frictions), dtype=np.float64)
+        self.frictions  = np.array([frictions[code] for code in self.codes.tolist()], dtype=np.float64)
+        self.min        = self.frictions.min()
+
+    def getFrictions(self, values, nodata):
+        """Frictions of the values (float array), nodata for the nodata values and the unknown codes"""
+        index = np.minimum(np.searchsorted(self.codes, values), len(self.codes) - 1)
+        known = (self.codes[index] == values) & (values != nodata)
+        return np.where(known, self.frictions[index], nodata)
+
+    def getUnknown(self, values, nodata):
+        """Values (not nodata) without friction, Chloe fails on them"""
+        values = np.unique(values[values != nodata])
+        return values[~np.in1d(values, self.codes)]
+
+
+class FunctionalWindow:
+    """Functional window of Chloe: the cells reached from its center within the distance
+
+    The distance is size * cellsize / 2, a move between two neighbours costs the half of the
+    friction of each one times the cellsize (times sqrt(2) on the diagonals). As Chloe
+    (apiland FunctionalWindow) the cells are reached by a diffusion from the center: the
+    pending cell of lowest cost is taken first (the last one pending among equal costs), and
+    its rook then queen neighbours not reached yet and not nodata get their cost through
+    it if it is not over the distance. A cell keeps the first cost it gets, so the window
+    is the one of Chloe even where this is not the shortest path.
+
+    The cells are in a box of diameter x diameter cells centered on the window center, the
+    diameter being the longest path at the lowest friction. The diffusions of many windows
+    are computed at once with NumPy, one pending cell of every window by step.
+    """
+
+    # Neighbours (dy, dx, diagonal) in the order of the diffusion of Chloe
+    NEIGHBOURS = [(-1, 0, False), (0, 1, False), (1, 0, False), (0, -1, False),
+                  (-1, 1, True), (1, 1, True), (1, -1, True), (-1, -1, True)]
+
+    def __init__(self, friction, size, cellsize):
+        self.size     = size
+        self.cellsize = cellsize
+        self.distance = size * cellsize / 2.0
+        diameter = int(2 * self.distance / cellsize / friction.min)
+        self.diameter = diameter + 1 if diameter % 2 == 0 else diameter
+        self.radius   = self.diameter // 2
+
+    def getMasks(self, frictions, nodata):
+        """Cells of the windows (bool array windows x diameter x diameter)
+
+        frictions are the frictions of the boxes of the windows (windows x diameter x diameter),
+        nodata outside the raster.
+        """
+        count = len(frictions)
+        width = self.diameter + 2
+        # a ring of nodata around the boxes, never reached
+        boxes = np.full((count, width, width), nodata, dtype=np.float64)
+        boxes[:, 1:-1, 1:-1] = frictions
+        boxes = boxes.reshape(count, width * width)
+
+        costs = np.full(boxes.shape, np.inf)
+        center = (self.radius + 1) * width + self.radius + 1
+        costs[:, center] = 0.0
+
+        # pending cells of every window: cell, cost and order of arrival, free slots at inf
+        pending_cells  = np.zeros(boxes.shape, dtype=np.int64)
+        pending_costs  = np.full(boxes.shape, np.inf)
+        pending_orders = np.zeros(boxes.shape, dtype=np.int64)
+        pending        = np.ones(count, dtype=np.int64)
+        pending_cells[:, 0] = center
+        pending_costs[:, 0] = 0.0
+        order = 1
+
+        moves = [(dy * width + dx, (math.sqrt(2) * self.cellsize if diagonal else self.cellsize) / 2.0)
+                 for dy, dx, diagonal in FunctionalWindow.NEIGHBOURS]
+        windows = np.flatnonzero(pending)
+        while len(windows):
+            # lowest cost pending, the last arrived among equal costs
+            slots = pending[windows].max()
+            cell_costs = pending_costs[windows, :slots]
+            lowest = cell_costs.min(axis=1)
+            slot = np.where(cell_costs == lowest[:, None], pending_orders[windows, :slots], -1).argmax(axis=1)
+            cells = pending_cells[windows, slot]
+
+            # removed by moving the last pending cell to its slot
+            last = pending[windows] - 1
+            pending_cells[windows, slot]  = pending_cells[windows, last]
+            pending_costs[windows, slot]  = pending_costs[windows, last]
+            pending_orders[windows, slot] = pending_orders[windows, last]
+            pending_costs[windows, last]  = np.inf
+            pending[windows] = last
+
+            cell_frictions = boxes[windows, cells]
+            spread = cell_frictions != nodata
+            windows, cells, lowest, cell_frictions = (
+                windows[spread], cells[spread], lowest[spread], cell_frictions[spread])
+            for move, half in moves:
+                neighbours = cells + move
+                neighbour_frictions = boxes[windows, neighbours]
+                cost = lowest + (half * cell_frictions + half * neighbour_frictions)
+                reached = ((costs[windows, neighbours] == np.inf) & (neighbour_frictions != nodata)
+                           & (cost <= self.distance))
+                reached_windows = windows[reached]
+                costs[reached_windows, neighbours[reached]] = cost[reached]
+                slot = pending[reached_windows]
+                pending_cells[reached_windows, slot]  = neighbours[reached]
+                pending_costs[reached_windows, slot]  = cost[reached]
+                pending_orders[reached_windows, slot] = order
+                pending[reached_windows] += 1
+                order += 1
+            windows = np.flatnonzero(pending)
+
+        reached = costs.reshape(count, width, width)[:, 1:-1, 1:-1] != np.inf
+        return reached
+
+
+class FunctionalWindowCache:
+    """Cells of the functional windows of a raster, kept on disk from one run to another
+
+    The windows depend on the values of the raster, the friction file, the size and the
+    cellsize only: they are computed once for all the metrics and runs. The cells of the
+    window of every cell of the raster are packed in bits in a file mapped in memory, with
+    the cells whose window is known, in an entry of the Chloe cache directory removed with
+    the results of ChloeCache (same disk budget, least recently used first).
+
+    Usage:
+
+        cache = FunctionalWindowCache.open(window, grid, f_friction)
+        masks = cache.getMasks(indexes, frictions, nodata)   # indexes of the centers
+        cache.close()
+    """
+
+    PREFIX = 'functional_'   # entries of the Chloe cache directory
+
+    def __init__(self, entry_dir, window, cells):
+        self.window = window
+        self.bytes  = (window.diameter * window.diameter + 7) // 8
+        f_masks = os.path.join(entry_dir, 'masks.bin')
+        f_known = os.path.join(entry_dir, 'known.bin')
+        mode = 'r+' if os.path.isfile(f_masks) and os.path.isfile(f_known) else 'w+'
+        self.masks = np.memmap(f_masks, dtype=np.uint8, mode=mode, shape=(cells, self.bytes))
+        self.known = np.memmap(f_known, dtype=np.bool_, mode=mode, shape=(cells,))
+
+    @staticmethod
+    def getKey(window, grid, f_friction):
+        """Hash of the windows: contents of the raster and of the friction file, size and cellsize"""
+        sha = hashlib.sha1()
+        sha.update('input={}\nfriction={}\nsize={}\ncellsize={}\ndiameter={}\n'.format(
+            ChloeCache.getFileHash(grid.f_asc), ChloeCache.getFileHash(f_friction),
+            window.size, repr(window.cellsize), window.diameter).encode('utf-8'))
+        return sha.hexdigest()
+
+    @staticmethod
+    def open(window, grid, f_friction):
+        """Cache of the windows of the raster, None if the Chloe cache is disabled or too small"""
+        budget = ChloeCache.getCacheSize() * 1024 * 1024
+        cells = grid.nrows * grid.ncols
+        if budget <= 0 or cells * ((window.diameter * window.diameter + 7) // 8 + 1) > budget:
+            return None
+        entry_dir = os.path.join(ChloeCache.getCacheDir(),
+                                 FunctionalWindowCache.PREFIX + FunctionalWindowCache.getKey(window, grid, f_friction))
+        try:
+            if not os.path.isdir(entry_dir):
+                os.makedirs(entry_dir)
+            os.utime(entry_dir, None)   # most recently used
+            cache = FunctionalWindowCache(entry_dir, window, cells)
+            ChloeCache.evict(budget)
+        except (IOError, OSError, ValueError):
+            return None
+        return cache
+
+    def getMasks(self, indexes, frictions, nodata):
+        """Cells of the windows centered on the cells indexes (row * ncols + column) of the raster
+
+        frictions are the frictions of the boxes of the windows, only the windows not in the
+        cache are computed (see FunctionalWindow.getMasks), then stored.
+        """
+        diameter = self.window.diameter
+        masks = np.empty(frictions.shape, dtype=bool)
+        known = np.asarray(self.known[indexes])
+        if known.any():
+            bits = np.unpackbits(self.masks[indexes[known]], axis=1)[:, :diameter * diameter]
+            masks[known] = bits.reshape(-1, diameter, diameter).astype(bool)
+        missing = ~known
+        if missing.any():
+            computed = self.window.getMasks(frictions[missing], nodata)
+            masks[missing] = computed
+            self.masks[indexes[missing]] = np.packbits(computed.reshape(len(computed), -1), axis=1)
+            self.known[indexes[missing]] = True
+        return masks
+
+    def close(self):
+        self.masks.flush()
+        self.known.flush()
+        del self.masks
+        del self.known
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+
+import numpy as np
+
+from ..ChloeUtils import ChloeUtils
+from ..ChloeTiling import ChloeTiling
+from .raster_io import AsciiGrid, GridAsciiGridWriter, GridCsvWriter
+from .sliding_engine import SlidingEngine
+
+
+class GridEngine:
+    """Grid treatment computed with block reductions
+
+    The raster is cut in blocks of grid_size x grid_size cells from its upper left corner,
+    the blocks of the last row and column are cut by the border of the raster. The metrics
+    are computed from the sums over the blocks of the same quantities as SlidingEngine,
+    reduced with np.add.reduceat which handles these ragged blocks without padding.
+    The raster is read once, strip by strip of rows, for all the grid sizes: a row of
+    blocks which is not complete at the end of a strip is carried over to the next one.
+
+    As in Chloe, a block is computed when its rate of valid cells (nodata excluded, cells
+    outside the raster included) is at least 1 - maximum_nodata_value_rate / 100, and
+    every grid size has its own outputs.
+    """
+
+    STRIP_CELLS = 16 * 1024 * 1024  # Cells of all the quantities of a strip
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this grid properties, else the reason why not"""
+        metrics = SlidingEngine.splitList(properties.get('metrics', ''))
+        unsupported = [metric for metric in metrics if not SlidingEngine.isSupported(metric)]
+        if not metrics or unsupported:
+            return 'metric(s) not supported: ' + ';'.join(unsupported)
+        if (not properties.get('output_folder')
+                and len(ChloeUtils.splitSizes(properties['grid_sizes'].strip('{}'))) > 1):
+            return 'several grid sizes written to the same outputs'
+        if not properties.get('input_ascii', '').lower().endswith('.asc'):
+            return 'the input is not an ascii grid'
+        header, header_lines = ChloeTiling.getAsciiHeader(properties['input_ascii'])
+        if 'nodata_value' not in header:
+            return 'the input has no NODATA_value'
+        return None
+
+    @staticmethod
+    def getOutputs(properties, grid, size, metrics):
+        """Paths of the outputs of a grid size, named as Chloe does
+
+        Return (csv or None, list of (metric, ascii path)).
+        """
+        folder = properties.get('output_folder')
+        prefix = folder + '/' + grid.getName() + '_g' + str(size) if folder else None
+
+        f_csv = None
+        if properties.get('export_csv', 'true') == 'true':
+            f_csv = properties.get('output_csv') or (prefix + '.csv' if prefix else None)
+
+        asciis = []
+        if properties.get('export_ascii', 'true') == 'true':
+            ascii = properties.get('output_asc') or (prefix + '_' if prefix else None)
+            if ascii is None:
+                pass
+            elif ascii.endswith('.asc') and len(metrics) == 1:
+                asciis.append((metrics[0], ascii))
+            else:
+                for metric in metrics:
+                    asciis.append((metric, ascii + metric + '.asc'))
+        return f_csv, asciis
+
+    @staticmethod
+    def getBlockSums(quantities, rows, size, ncols):
+        """Sums of the quantities over the blocks met by a strip
+
+        rows are the indexes in the raster of the rows of the strip, the sums have a row
+        by row of blocks (the first and the last ones may be partial) and a column by
+        column of blocks. The couples of the first row (column) of a block are not summed,
+        their neighbour is in the block above (on the left).
+        """
+        row_starts = np.flatnonzero((rows % size == 0) | (np.arange(len(rows)) == 0))
+        col_starts = np.arange(0, ncols, size)
+        sums = {}
+        for name, quantity in quantities.items():
+            direction = name[0] if isinstance(name, tuple) else None
+            if direction == 'horizontal':
+                quantity = np.where(np.arange(ncols) % size == 0, 0, quantity)
+            elif direction == 'vertical':
+                quantity = np.where((rows % size == 0)[:, None], 0, quantity)
+            sums[name] = np.add.reduceat(np.add.reduceat(quantity, row_starts, axis=0), col_starts, axis=1)
+        return SlidingEngine.mergeCouples(sums)
+
+    @staticmethod
+    def run(properties, progress):
+        grid    = AsciiGrid(properties['input_ascii'])
+        nodata  = grid.nodata
+        sizes   = [int(size) for size in ChloeUtils.splitSizes(properties['grid_sizes'].strip('{}'))]
+        metrics = SlidingEngine.splitList(properties['metrics'])
+        minRate = 1 - float(properties.get('maximum_nodata_value_rate', '100')) / 100
+
+        names = SlidingEngine.getNames(metrics, properties['input_ascii'])
+
+        outputs = []    # (size, csv writer, [(metric, ascii writer)]) by grid size
+        try:
+            for size in sizes:
+                f_csv, asciis = GridEngine.getOutputs(properties, grid, size, metrics)
+                for f_out in [f_csv] + [f_asc for metric, f_asc in asciis]:
+                    if f_out and os.path.dirname(f_out) and not os.path.isdir(os.path.dirname(f_out)):
+                        os.makedirs(os.path.dirname(f_out))
+                csv = GridCsvWriter(f_csv, grid, size, metrics, nodata) if f_csv else None
+                writers = [(metric, GridAsciiGridWriter(f_asc, grid, size, nodata)) for metric, f_asc in asciis]
+                outputs.append((size, csv, writers))
+
+            pending = dict((size, None) for size in sizes)   # sums of the row of blocks started
+            above = None    # last row of the previous strip, for the vertical couples
+            strip_rows = max(1, GridEngine.STRIP_CELLS // (grid.ncols * len(names)))
+            for top in range(0, grid.nrows, strip_rows):
+                bottom = min(grid.nrows, top + strip_rows)
+                values = grid.readRows(top, bottom)
+                quantities = SlidingEngine.getQuantities(values, nodata, names, above)
+                above = values[-1]
+
+                for size, csv, writers in outputs:
+                    sums = GridEngine.getBlockSums(quantities, np.arange(top, bottom), size, grid.ncols)
+                    if pending[size] is not None:
+                        for name in sums:
+                            sums[name][0] += pending[size][name]
+                    if bottom % size and bottom < grid.nrows:
+                        # the last row of blocks goes on in the next strip
+                        pending[size] = dict((name, value[-1]) for name, value in sums.items())
+                        sums = dict((name, value[:-1]) for name, value in sums.items())
+                    else:
+                        pending[size] = None
+                    if not len(sums['count']):
+                        continue
+
+                    # Upper left cell of the blocks and number of their cells in the raster
+                    ys = (top // size + np.arange(len(sums['count']))) * size
+                    xs = np.arange(0, grid.ncols, size)
+                    sums['total'] = np.outer(np.minimum(ys + size, grid.nrows) - ys,
+                                             np.minimum(xs + size, grid.ncols) - xs).astype(np.float64)
+                    ok = sums['count'] / float(size * size) >= minRate
+                    columns = dict((metric, SlidingEngine.getMetric(metric, sums, ok, nodata, grid.cellsize, size * size))
+                                   for metric in metrics)
+
+                    for metric, writer in writers:
+                        writer.writeRows(columns[metric])
+                    if csv is not None:
+                        csv.writeRows(ys, xs, columns)
+                progress.setPercentage(int(100 * bottom / grid.nrows))
+        finally:
+            for size, csv, writers in outputs:
+                for metric, writer in writers:
+                    writer.close()
+                if csv is not None:
+                    csv.close()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import numpy as np
+
+
+class PatchLabeller:
+    """Connected components of the cells of the same class, labelled strip by strip
+
+    The cells of a strip are joined to their neighbours of the same class (on the left and
+    above, plus the two upper diagonals with the queen neighbourhood) with a vectorized
+    union-find whose roots are always the smallest index: the components of a strip get
+    provisional labels in the order of their first cell. The last row of a strip is kept
+    to merge the provisional labels across the seam with the next one, so only the labels
+    (one by component piece) stay in memory whatever the size of the raster.
+
+    At the end getRoots gives the component of every provisional label as its smallest
+    provisional label, which is the one of the first cell of the component in raster order.
+    """
+
+    ROOK  = [(0, -1), (-1, 0)]
+    QUEEN = [(0, -1), (-1, -1), (-1, 0), (-1, 1)]
+
+    def __init__(self, queen=False):
+        self.offsets = PatchLabeller.QUEEN if queen else PatchLabeller.ROOK
+        self.parents = np.zeros(0, dtype=np.int64)  # union-find of the provisional labels
+        self.classes = np.zeros(0, dtype=np.int64)  # class of the provisional labels
+        self.counts  = np.zeros(0, dtype=np.int64)  # cells of the provisional labels
+        self.above   = None                         # (labels, classes) of the last row labelled
+
+    @staticmethod
+    def find(parents, nodes):
+        """Roots of the nodes, the path of the nodes is compressed"""
+        roots = parents[nodes]
+        while True:
+            up = parents[roots]
+            if np.array_equal(up, roots):
+                break
+            roots = up
+        parents[nodes] = roots
+        return roots
+
+    @staticmethod
+    def union(parents, nodes1, nodes2):
+        """Join the nodes pairwise, the larger root is hooked to the smaller one
+
+        A root hooked by several pairs at once keeps the smallest one, the other pairs are
+        joined again from their new roots until every pair has the same root.
+        """
+        while len(nodes1):
+            roots1 = PatchLabeller.find(parents, nodes1)
+            roots2 = PatchLabeller.find(parents, nodes2)
+            apart = roots1 != roots2
+            nodes1 = roots1[apart]
+            nodes2 = roots2[apart]
+            np.minimum.at(parents, np.maximum(nodes1, nodes2), np.minimum(nodes1, nodes2))
+
+    @staticmethod
+    def getPairs(labels, classes, offsets, top_labels=None, top_classes=None):
+        """Pairs of labels (>= 0) of neighbour cells of the same class
+
+        With top_labels (top_classes) the pairs are the ones of the first row of labels with
+        the row above, else the ones inside labels.
+        """
+        pairs1 = []
+        pairs2 = []
+        nrows, ncols = labels.shape
+        for dy, dx in offsets:
+            if top_labels is None:
+                if -dy >= nrows:
+                    continue
+                cells = labels[-dy:, max(0, -dx):ncols - max(0, dx)]
+                cell_classes = classes[-dy:, max(0, -dx):ncols - max(0, dx)]
+                neighbours = labels[:nrows + dy, max(0, dx):ncols + min(0, dx)]
+                neighbour_classes = classes[:nrows + dy, max(0, dx):ncols + min(0, dx)]
+            elif dy == -1:
+                cells = labels[0, max(0, -dx):ncols - max(0, dx)]
+                cell_classes = classes[0, max(0, -dx):ncols - max(0, dx)]
+                neighbours = top_labels[max(0, dx):ncols + min(0, dx)]
+                neighbour_classes = top_classes[max(0, dx):ncols + min(0, dx)]
+            else:
+                continue
+            joined = (cells >= 0) & (neighbours >= 0) & (cell_classes == neighbour_classes)
+            pairs1.append(cells[joined])
+            pairs2.append(neighbours[joined])
+        return np.concatenate(pairs1), np.concatenate(pairs2)
+
+    def addRows(self, classes, labelled):
+        """Provisional labels of a strip (-1 for the cells not labelled)
+
+        classes are the classes (integer array) of the cells of the strip, labelled is True
+        for the cells to label. The strips are added in raster order.
+        """
+        nrows, ncols = classes.shape
+        cells = np.where(labelled, np.arange(nrows * ncols).reshape(nrows, ncols), -1)
+        parents = np.arange(nrows * ncols)
+        PatchLabeller.union(parents, *PatchLabeller.getPairs(cells, classes, self.offsets))
+
+        # the roots are the first cell of the components of the strip
+        labels = np.full((nrows, ncols), -1, dtype=np.int64)
+        roots, local = np.unique(PatchLabeller.find(parents, cells[labelled]), return_inverse=True)
+        base = len(self.parents)
+        labels[labelled] = base + local
+        self.parents = np.concatenate([self.parents, base + np.arange(len(roots))])
+        self.classes = np.concatenate([self.classes, classes.ravel()[roots]])
+        self.counts  = np.concatenate([self.counts, np.bincount(local, minlength=len(roots))])
+
+        if self.above is not None:
+            PatchLabeller.union(self.parents, *PatchLabeller.getPairs(labels, classes, self.offsets, *self.above))
+        self.above = (labels[-1], classes[-1])
+        return labels
+
+    def getRoots(self):
+        """Component (its smallest provisional label) of the provisional labels"""
+        return PatchLabeller.find(self.parents, np.arange(len(self.parents)))
+
+    def getComponents(self):
+        """Return the classes and the cells of the components, in the order of their first cell,
+        and the index of the component of every provisional label
+        """
+        roots, components = np.unique(self.getRoots(), return_inverse=True)
+        counts = np.bincount(components, weights=self.counts, minlength=len(roots)).astype(np.int64)
+        return self.classes[roots], counts, components
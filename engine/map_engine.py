@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+
+import numpy as np
+
+from ..ChloeTiling import ChloeTiling
+from .raster_io import AsciiGrid, formatValue
+from .labelling import PatchLabeller
+from .sliding_engine import SlidingEngine
+
+
+class MapEngine:
+    """Map treatment (metrics of the whole raster) computed in one streamed pass
+
+    The raster is read by strips of GDAL blocks and the quantities of the metrics (see
+    SlidingEngine) are accumulated: their sums and the histograms of the classes and of the
+    couples of classes, so the memory used is the one of a strip whatever the size of the
+    raster. The last row of a strip is kept for the vertical couples of the next one.
+
+    The patches metrics are computed from the patches labelled by PatchLabeller during the
+    same pass: as in Chloe a patch is a rook connected component of the cells of a class
+    (nodata excluded) and the patches of the class 0 are not counted.
+
+    As in Chloe the metrics are always computed (there is no maximum rate of nodata) and
+    the csv has a row with the name of the input followed by the metrics in alphabetical
+    order.
+    """
+
+    STRIP_CELLS = 4 * 1024 * 1024  # Cells of a strip
+
+    PATCH_METRICS = ['NP', 'LPI', 'MPS', 'SDPS', 'VCPS']
+    PATCH_CLASS_METRICS = ['NP-class_', 'LPI-class_', 'MPS-class_', 'SDPS-class_', 'VCPS-class_']
+
+    @staticmethod
+    def getPatchMetric(metric):
+        """Return (name, class or None) of a patches metric, None if the metric is not one"""
+        for prefix in MapEngine.PATCH_CLASS_METRICS:
+            if metric.startswith(prefix):
+                try:
+                    return prefix[:-len('-class_')], int(metric[len(prefix):])
+                except ValueError:
+                    return None
+        if metric in MapEngine.PATCH_METRICS:
+            return metric, None
+        return None
+
+    @staticmethod
+    def getPatchValue(metric, classes, areas):
+        """Value of a patches metric from the classes and the areas of the patches"""
+        name, value = MapEngine.getPatchMetric(metric)
+        areas = areas[classes == value] if value is not None else areas[classes != 0]
+        if name == 'NP':
+            return float(len(areas))
+        if not len(areas):
+            return 0.0
+        if name == 'LPI':
+            return areas.max()
+        average = areas.sum() / len(areas)
+        if name == 'MPS':
+            return average
+        # Chloe Stats: deviation of the population, rounded to 5 decimals
+        deviation = np.sqrt(abs((areas * areas).sum() / len(areas) - average * average))
+        if name == 'SDPS':
+            return float('%.5f' % deviation)
+        return float('%.5f' % (deviation / average))
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this map properties, else the reason why not"""
+        metrics = SlidingEngine.splitList(properties.get('metrics', ''))
+        unsupported = [metric for metric in metrics
+                       if not SlidingEngine.isSupported(metric) and MapEngine.getPatchMetric(metric) is None]
+        if not metrics or unsupported:
+            return 'metric(s) not supported: ' + ';'.join(unsupported)
+        if not properties.get('output_csv'):
+            return 'no output csv'
+        if not os.path.isfile(properties.get('input_ascii', '')) or not properties['input_ascii'].lower().endswith('.asc'):
+            return 'the input is not an ascii grid'
+        header, header_lines = ChloeTiling.getAsciiHeader(properties['input_ascii'])
+        if 'nodata_value' not in header:
+            return 'the input has no NODATA_value'
+        return None
+
+    @staticmethod
+    def getNames(metrics):
+        """Quantities summed for the metrics
+
+        'classes' and 'couples' stand for the histograms of the classes and of the couples,
+        'patches' for the labelling of the patches.
+        """
+        names = set()
+        for metric in metrics:
+            if MapEngine.getPatchMetric(metric) is not None:
+                names.add('patches')
+            elif SlidingEngine.getClassMetric(metric) is not None:
+                names.update(['count', 'nonzero', 'classes'])
+            elif SlidingEngine.getCoupleMetric(metric) is not None:
+                names.update(['count', 'valid_couples', 'count_couples', 'couples'])
+            else:
+                names.update(SlidingEngine.METRICS[metric])
+        return names
+
+    @staticmethod
+    def run(properties, progress):
+        grid    = AsciiGrid(properties['input_ascii'])
+        nodata  = grid.nodata
+        metrics = sorted(SlidingEngine.splitList(properties['metrics']))
+
+        names = MapEngine.getNames(metrics)
+        histogram = 'classes' in names
+        couples = 'couples' in names
+        labeller = PatchLabeller() if 'patches' in names else None
+        names.discard('classes')
+        names.discard('couples')
+        names.discard('patches')
+
+        totals = dict((name, 0.0) for name in names)
+        counts = {}     # cells by class
+        codes = {}      # couples by code
+        above = None    # last row of the previous strip
+        strip_rows = grid.getStripRows(MapEngine.STRIP_CELLS)
+        for top in range(0, grid.nrows, strip_rows):
+            bottom = min(grid.nrows, top + strip_rows)
+            values = grid.readRows(top, bottom)
+            for name, quantity in SlidingEngine.getQuantities(values, nodata, names, above).items():
+                # the couples of the first column (row) of the raster have their neighbour outside
+                if isinstance(name, tuple) and name[0] == 'horizontal':
+                    totals[name[1]] += quantity[:, 1:].sum()
+                elif isinstance(name, tuple) and name[0] == 'vertical':
+                    totals[name[1]] += quantity[1:].sum() if top == 0 else quantity.sum()
+                else:
+                    totals[name] += quantity.sum()
+            if histogram:
+                # as Chloe, a class is the integer part of a value different from 0 and nodata
+                classes, cells = np.unique(np.trunc(values[(values != nodata) & (values != 0)]), return_counts=True)
+                for value, count in zip(classes.tolist(), cells.tolist()):
+                    counts[int(value)] = counts.get(int(value), 0) + count
+            if couples:
+                for direction, valid, counted, couple_codes in SlidingEngine.getCouples(values, nodata, above):
+                    if direction == 'horizontal':
+                        counted[:, 0] = False
+                    elif top == 0:
+                        counted[0] = False
+                    couple_codes, cells = np.unique(couple_codes[counted], return_counts=True)
+                    for code, count in zip(couple_codes.tolist(), cells.tolist()):
+                        codes[code] = codes.get(code, 0) + count
+            if labeller is not None:
+                labeller.addRows(np.trunc(values).astype(np.int64), values != nodata)
+            above = values[-1]
+            progress.setPercentage(int(100 * bottom / grid.nrows))
+
+        for value, count in counts.items():
+            totals[('class', value)] = count
+        for code, count in codes.items():
+            totals[('couple', code)] = count
+        for metric in metrics:
+            class_metric = SlidingEngine.getClassMetric(metric)
+            couple_metric = SlidingEngine.getCoupleMetric(metric)
+            if class_metric is not None:
+                totals.setdefault(('class', class_metric[1]), 0)
+            elif couple_metric is not None:
+                totals.setdefault(('couple', couple_metric[1]), 0)
+
+        if labeller is not None:
+            classes, cells, components = labeller.getComponents()
+            areas = cells * grid.cellsize * grid.cellsize
+
+        # The whole raster is one window of the metrics of SlidingEngine
+        sums = dict((name, np.array([total], dtype=np.float64)) for name, total in totals.items())
+        sums['total'] = np.array([grid.ncols * grid.nrows], dtype=np.float64)
+        ok = np.array([True])
+        values = []
+        for metric in metrics:
+            if MapEngine.getPatchMetric(metric) is not None:
+                value = MapEngine.getPatchValue(metric, classes, areas)
+            else:
+                value = SlidingEngine.getMetric(metric, sums, ok, nodata, grid.cellsize, grid.ncols * grid.nrows)[0]
+            values.append(formatValue(value))
+
+        f_csv = properties['output_csv']
+        if os.path.dirname(f_csv) and not os.path.isdir(os.path.dirname(f_csv)):
+            os.makedirs(os.path.dirname(f_csv))
+        with open(f_csv, 'w') as fd:
+            fd.write(';'.join(['name'] + metrics) + '\n')
+            fd.write(';'.join([os.path.basename(properties['input_ascii'])] + values) + '\n')
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+
+import numpy as np
+
+from ..ChloeTiling import ChloeTiling
+from .raster_io import AsciiGrid, MatrixAsciiGridWriter
+
+
+class OverlayEngine:
+    """Overlay treatment computed on aligned strips of all the inputs
+
+    As in Chloe (the Pixel2PixelMatrixCalculation of Model.runOverlay), a cell takes the
+    value of the first input, in the order of overlaying_matrix, which is neither 0 nor
+    nodata, else 0 if an input is 0, else nodata. The inputs are read together by strips
+    of GDAL blocks and the output is written strip by strip, so only one strip of every
+    input is in memory.
+    """
+
+    STRIP_CELLS = 4 * 1024 * 1024  # Cells of the strips of all the inputs
+
+    @staticmethod
+    def getInputs(properties):
+        """Ascii grids of overlaying_matrix as Chloe reads them (the spaces are removed)"""
+        value = properties['overlaying_matrix'].replace('{', '').replace('}', '').replace(' ', '')
+        return [f_asc for f_asc in value.split(';') if f_asc]
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this overlay properties, else the reason why not"""
+        if 'overlaying_matrix' not in properties:
+            return 'no overlaying_matrix'
+        if not properties.get('output_folder') and not properties.get('output_asc'):
+            return 'no output'
+        geometry = None
+        for f_asc in OverlayEngine.getInputs(properties):
+            if not os.path.isfile(f_asc) or not f_asc.lower().endswith('.asc'):
+                return 'an input is not an ascii grid: ' + f_asc
+            header, header_lines = ChloeTiling.getAsciiHeader(f_asc)
+            if 'nodata_value' not in header:
+                return 'an input has no NODATA_value: ' + f_asc
+            # the cells of the inputs are overlaid by their row and column, with one nodata
+            input_geometry = (int(header['ncols']), int(header['nrows']), int(header['nodata_value']))
+            if geometry is not None and input_geometry != geometry:
+                return 'inputs of different sizes or NODATA_value'
+            geometry = input_geometry
+        if geometry is None:
+            return 'no input'
+        return None
+
+    @staticmethod
+    def overlay(layers, nodata):
+        """Overlay of the values of the inputs (float arrays of the same shape)"""
+        values = np.full(layers[0].shape, nodata, dtype=np.float64)
+        found = np.zeros(layers[0].shape, dtype=bool)
+        zero = np.zeros(layers[0].shape, dtype=bool)
+        for layer in layers:
+            taken = ~found & (layer != 0) & (layer != nodata)
+            values[taken] = layer[taken]
+            found |= taken
+            zero |= layer == 0
+        values[~found & zero] = 0
+        return values
+
+    @staticmethod
+    def run(properties, progress):
+        grids  = [AsciiGrid(f_asc) for f_asc in OverlayEngine.getInputs(properties)]
+        grid   = grids[0]
+        nodata = grid.nodata
+
+        if properties.get('output_folder'):
+            f_asc = properties['output_folder'] + '/overlay.asc'
+        else:
+            f_asc = properties['output_asc']
+        if os.path.dirname(f_asc) and not os.path.isdir(os.path.dirname(f_asc)):
+            os.makedirs(os.path.dirname(f_asc))
+
+        strip_rows = grid.getStripRows(OverlayEngine.STRIP_CELLS // len(grids))
+        writer = MatrixAsciiGridWriter(f_asc, grid, nodata)
+        try:
+            for top in range(0, grid.nrows, strip_rows):
+                bottom = min(grid.nrows, top + strip_rows)
+                writer.writeRows(OverlayEngine.overlay([g.readRows(top, bottom) for g in grids], nodata))
+                progress.setPercentage(int(100 * bottom / grid.nrows))
+        finally:
+            writer.close()
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import math
+import zipfile
+from decimal import Decimal
+
+from osgeo import gdal
+import numpy as np
+
+from ..ChloeTiling import ChloeTiling
+
+
+class AsciiGrid:
+    """Input ascii grid read by blocks of rows with GDAL
+
+    The geometry is taken from the header as Chloe reads it (the 3rd and 4th values
+    are the lower left corner) and the NODATA_value is an integer, as in Chloe.
+    """
+
+    def __init__(self, f_asc):
+        header, header_lines = ChloeTiling.getAsciiHeader(f_asc)
+        self.f_asc    = f_asc
+        self.ncols    = int(header['ncols'])
+        self.nrows    = int(header['nrows'])
+        self.minx     = float(header.get('xllcorner', header.get('xllcenter')))
+        self.miny     = float(header.get('yllcorner', header.get('yllcenter')))
+        self.cellsize = float(header['cellsize'])
+        self.nodata   = int(header['nodata_value']) if 'nodata_value' in header else None
+
+        # Float32 by default for the decimal grids, the values would not be the ones of Chloe
+        previous = gdal.GetConfigOption('AAIGRID_DATATYPE')
+        gdal.SetConfigOption('AAIGRID_DATATYPE', 'Float64')
+        try:
+            self.ds = gdal.Open(f_asc)
+        finally:
+            gdal.SetConfigOption('AAIGRID_DATATYPE', previous)
+        if self.ds is None:
+            raise IOError('Unable to read ' + f_asc)
+        self.band = self.ds.GetRasterBand(1)
+
+    def getName(self):
+        """Name of the grid used by Chloe as prefix of the outputs of a folder"""
+        return os.path.basename(self.f_asc).replace('.asc', '')
+
+    def getStripRows(self, cells):
+        """Rows of a strip of about cells cells, whole GDAL blocks of rows"""
+        block_rows = self.band.GetBlockSize()[1]
+        return max(1, cells // (self.ncols * block_rows)) * block_rows
+
+    def readRows(self, start, end):
+        """Values (float64 array) of the rows [start, end["""
+        return self.band.ReadAsArray(0, start, self.ncols, end - start).astype(np.float64)
+
+    def getProjectedX(self, x):
+        return x * self.cellsize + self.minx + self.cellsize / 2
+
+    def getProjectedY(self, y):
+        return self.cellsize * (self.nrows - y) + self.miny - self.cellsize / 2
+
+
+def formatDouble(value):
+    """Java Double.toString of a value (header values and csv coordinates)"""
+    value = float(value)
+    if value != 0 and (abs(value) >= 1e7 or abs(value) < 1e-3):
+        # computerized scientific notation, with the shortest digits as repr
+        sign, digits, exponent = Decimal(repr(value)).as_tuple()
+        exponent += len(digits) - 1
+        digits = ''.join(str(digit) for digit in digits).rstrip('0')
+        return ('-' if sign else '') + digits[0] + '.' + (digits[1:] or '0') + 'E' + str(exponent)
+    return repr(value)
+
+
+def formatValue(value):
+    """Java output of a metric value: an integer if it is, else 5 decimals"""
+    if value == math.floor(value):
+        return str(int(value))
+    return '%.5f' % value
+
+
+def formatValues(values):
+    return [formatValue(value) for value in values.tolist()]
+
+
+class AsciiGridWriter:
+    """Output ascii grid of a metric, written row by row as Chloe does
+
+    With a displacement delta, a cell of the output covers delta x delta cells of the input
+    centered on the computed cell, the header is the one of Chloe DeltaAsciiGridOutput.
+    """
+
+    PRJ_RESOURCE = 'fr/inra/sad/bagap/apiland/core/element/manager/lambert93.prj'
+
+    _prj = None   # projection file written by Chloe beside its ascii outputs
+
+    def __init__(self, f_asc, grid, delta, nodata):
+        self.f_asc = f_asc
+        self.fd = open(f_asc, 'w')
+        self.writeHeader(grid, delta, nodata)
+
+    def writeHeader(self, grid, delta, nodata):
+        ncols = grid.ncols // delta + (1 if grid.ncols % delta else 0)
+        nrows = grid.nrows // delta + (1 if grid.nrows % delta else 0)
+        cellsize = grid.cellsize
+        shift = (delta - 1) * cellsize / 2.0
+        rest = math.fmod(grid.nrows * cellsize + shift, delta * cellsize)
+        if rest == 0:
+            miny = grid.miny
+        elif rest >= delta * cellsize / 2.0:
+            miny = grid.miny - (delta * cellsize - rest)
+        else:
+            miny = grid.miny + rest
+        self.fd.write('ncols ' + str(ncols) + '\n')
+        self.fd.write('nrows ' + str(nrows) + '\n')
+        self.fd.write('xllcorner ' + formatDouble(grid.minx - shift) + '\n')
+        self.fd.write('yllcorner ' + formatDouble(miny) + '\n')
+        self.fd.write('cellsize ' + formatDouble(delta * cellsize) + '\n')
+        self.fd.write('NODATA_value ' + str(nodata) + '\n')
+
+    def writeRows(self, values):
+        for row in values:
+            self.fd.write(' '.join(formatValues(row)) + '\n')
+
+    def close(self):
+        self.fd.close()
+        prj = AsciiGridWriter.getPrj()
+        if prj is not None:
+            with open(self.f_asc.replace('.asc', '') + '.prj', 'wb') as fd:
+                fd.write(prj)
+
+    @staticmethod
+    def getPrj():
+        if AsciiGridWriter._prj is None:
+            f_jar = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'Chloe2012', 'bin', 'apiland-1.0.jar')
+            try:
+                with zipfile.ZipFile(f_jar) as jar:
+                    AsciiGridWriter._prj = jar.read(AsciiGridWriter.PRJ_RESOURCE)
+            except (IOError, KeyError, zipfile.BadZipfile):
+                return None
+        return AsciiGridWriter._prj
+
+
+class GridAsciiGridWriter(AsciiGridWriter):
+    """Output ascii grid of a metric of the grid treatment
+
+    A cell of the output is a block of size x size cells of the input, the blocks start
+    at the upper left corner so the last row of blocks overlaps the bottom of the input
+    (header of Chloe GridAsciiGridOutput).
+    """
+
+    def writeHeader(self, grid, size, nodata):
+        ncols = grid.ncols // size + (1 if grid.ncols % size else 0)
+        nrows = grid.nrows // size + (1 if grid.nrows % size else 0)
+        miny = grid.miny
+        if grid.nrows % size:
+            miny -= (size - grid.nrows % size) * grid.cellsize
+        self.fd.write('ncols ' + str(ncols) + '\n')
+        self.fd.write('nrows ' + str(nrows) + '\n')
+        self.fd.write('xllcorner ' + formatDouble(grid.minx) + '\n')
+        self.fd.write('yllcorner ' + formatDouble(miny) + '\n')
+        self.fd.write('cellsize ' + formatDouble(size * grid.cellsize) + '\n')
+        self.fd.write('NODATA_value ' + str(nodata) + '\n')
+
+
+class MatrixAsciiGridWriter(AsciiGridWriter):
+    """Output ascii grid of a matrix of the raster (Chloe MatrixManager.exportAsciiGrid)
+
+    The geometry is the one of the input and every value is written as a Java double
+    followed by a space.
+    """
+
+    def __init__(self, f_asc, grid, nodata):
+        AsciiGridWriter.__init__(self, f_asc, grid, 1, nodata)
+
+    def writeRows(self, values):
+        integral = np.array_equal(values, np.trunc(values)) and not (np.abs(values) >= 1e7).any()
+        for row in values:
+            if integral:
+                # Double.toString of an integer below 10^7 is the integer followed by .0
+                self.fd.write(('%d.0 ' * len(row)) % tuple(row.astype(np.int64).tolist()) + '\n')
+            else:
+                self.fd.write(''.join(formatDouble(value) + ' ' for value in row.tolist()) + '\n')
+
+
+class CsvWriter:
+    """Output csv of the metrics: X;Y of the cell center then the metrics in alphabetical order
+
+    As in Chloe, the cells whose metrics are all nodata are not written.
+    """
+
+    def __init__(self, f_csv, grid, titles, nodata):
+        self.grid = grid
+        self.titles = sorted(titles)
+        self.nodata = nodata
+        self.fd = open(f_csv, 'w')
+        self.fd.write(';'.join(['X', 'Y'] + self.titles) + '\n')
+
+    def getX(self, x):
+        return self.grid.getProjectedX(x)
+
+    def getY(self, y):
+        return self.grid.getProjectedY(y)
+
+    def writeRows(self, ys, xs, columns):
+        """Write the cells (ys x xs), columns are the values arrays by title"""
+        x_texts = [formatDouble(self.getX(x)) for x in xs]
+        values = [columns[title] for title in self.titles]
+        for i, y in enumerate(ys):
+            y_text = formatDouble(self.getY(y))
+            row_values = [formatValues(value[i]) for value in values]
+            written = np.zeros(len(xs), dtype=bool)
+            for value in values:
+                written |= value[i] != self.nodata
+            for j in np.flatnonzero(written).tolist():
+                self.fd.write(';'.join([x_texts[j], y_text] + [texts[j] for texts in row_values]) + '\n')
+
+    def close(self):
+        self.fd.close()
+
+
+class GridCsvWriter(CsvWriter):
+    """Output csv of the grid treatment: X;Y of the center of the blocks (Chloe GridCsvOutput)"""
+
+    def __init__(self, f_csv, grid, size, titles, nodata):
+        CsvWriter.__init__(self, f_csv, grid, titles, nodata)
+        self.size = size
+
+    def getX(self, x):
+        cellsize = self.grid.cellsize
+        return self.grid.getProjectedX(x) - cellsize / 2 + self.size / 2.0 * cellsize
+
+    def getY(self, y):
+        cellsize = self.grid.cellsize
+        return self.grid.getProjectedY(y) + cellsize / 2 - self.size / 2.0 * cellsize
+
+
+class SelectedAsciiGridWriter(AsciiGridWriter):
+    """Output ascii grid of a metric of the selected treatment (Chloe SelectedAsciiGridOutput)
+
+    The geometry is the one of the input, the metric is written on the selected pixels
+    and the other cells are nodata.
+    """
+
+    def __init__(self, f_asc, grid, nodata):
+        AsciiGridWriter.__init__(self, f_asc, grid, 1, nodata)
+        self.grid = grid
+        self.nodata = nodata
+
+    def writePixels(self, ys, xs, values):
+        """Write all the rows, values are the ones of the pixels (ys, xs) sorted by row"""
+        empty = [formatValue(self.nodata)] * self.grid.ncols
+        empty_line = ' '.join(empty) + '\n'
+        texts = formatValues(values)
+        starts = np.searchsorted(ys, np.arange(self.grid.nrows + 1)).tolist()
+        xs = xs.tolist()
+        for y in range(self.grid.nrows):
+            if starts[y] == starts[y + 1]:
+                self.fd.write(empty_line)
+                continue
+            row = list(empty)
+            for i in range(starts[y], starts[y + 1]):
+                row[xs[i]] = texts[i]
+            self.fd.write(' '.join(row) + '\n')
+
+
+class SelectedCsvWriter(CsvWriter):
+    """Output csv of the selected treatment (Chloe SelectedCsvOutput)
+
+    Every selected pixel is written, in the order of the rows: its id (a point of a points
+    file with an id column) then X;Y and the metrics in alphabetical order. X;Y are the
+    coordinates of the point for the pixels with an id, else the center of the pixel. As
+    in Chloe the id column is in the header when the first pixel has an id.
+    """
+
+    def __init__(self, f_csv, grid, titles, nodata, identified):
+        self.grid = grid
+        self.titles = sorted(titles)
+        self.nodata = nodata
+        self.fd = open(f_csv, 'w')
+        self.fd.write(';'.join((['id'] if identified else []) + ['X', 'Y'] + self.titles) + '\n')
+
+    def writePixels(self, ids, coordinates, columns):
+        """Write the pixels, ids are None for the pixels without id and coordinates their (X, Y)
+        arrays, columns are the values arrays by title"""
+        x_texts = [formatDouble(x) for x in coordinates[0].tolist()]
+        y_texts = [formatDouble(y) for y in coordinates[1].tolist()]
+        values = [formatValues(columns[title]) for title in self.titles]
+        for i in range(len(x_texts)):
+            row = [ids[i]] if ids[i] is not None else []
+            self.fd.write(';'.join(row + [x_texts[i], y_texts[i]] + [texts[i] for texts in values]) + '\n')
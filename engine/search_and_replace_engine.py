@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import re
+
+from .raster_io import AsciiGridWriter, formatDouble
+
+
+class SearchAndReplaceEngine:
+    """Search and replace treatment computed on the text of the grid, line by line
+
+    Chloe (apiland AsciiGridManager.searchAndReplace) does not read the values: it cleans
+    every line of the file (header separators, decimal commas, integers written with .0,
+    NODATA_value) then replaces the words of the rows equal to a searched integer by its
+    new value, the other words are written as they are. The engine applies the same
+    cleaning to the lines read one at a time, the words being replaced through a table
+    of the changes, so the output is the one of Chloe whatever the size of the raster.
+    """
+
+    INTEGER = re.compile(r'^[+-]?\d+$')   # Integer.parseInt of Chloe
+
+    HEADER_LINES = 6
+
+    @staticmethod
+    def getChanges(value):
+        """Changes {(old,new);...} as Chloe reads them: the words of the old integers to the
+        Java words of the new doubles, a ValueError if Chloe fails to read them
+        """
+        changes = {}
+        for change in value.replace('{', '').replace('}', '').split(';'):
+            words = change.replace('(', '').replace(')', '').split(',')
+            if len(words) < 2 or not SearchAndReplaceEngine.INTEGER.match(words[0]):
+                raise ValueError('unreadable change: ' + change)
+            old = int(words[0])
+            new = float(words[1])
+            if not -2 ** 31 <= old < 2 ** 31 or new != new or new in (float('inf'), float('-inf')):
+                raise ValueError('unreadable change: ' + change)
+            changes[str(old)] = formatDouble(new)
+        return changes
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this search and replace properties, else the reason why not"""
+        if not os.path.isfile(properties.get('input_ascii', '')):
+            return 'the input is not an ascii grid file'
+        if not properties.get('output_folder') and not properties.get('output_asc'):
+            return 'no output'
+        if not SearchAndReplaceEngine.INTEGER.match(properties.get('nodata_value', '')):
+            return 'no integer nodata_value'
+        SearchAndReplaceEngine.getChanges(properties.get('changes', '').rstrip(';'))
+        return None
+
+    @staticmethod
+    def split(line, separator=' '):
+        """Java String.split: the empty words at the end are removed"""
+        if separator not in line:
+            return [line]
+        words = line.split(separator)
+        while words and not words[-1]:
+            words.pop()
+        return words
+
+    @staticmethod
+    def cleanHeader(line, index, separator, nodata):
+        """Header line index (from 1) cleaned as Chloe, separator is None when the header
+        is written with single spaces
+        """
+        if separator is not None and (index < SearchAndReplaceEngine.HEADER_LINES or line.startswith('NODATA_value')):
+            words = SearchAndReplaceEngine.split(line, separator)
+            line = words[0] + ' ' + words[-1]
+        line = line.replace(',', '.').replace('.0 ', ' ')
+        if index == SearchAndReplaceEngine.HEADER_LINES:
+            line = 'NODATA_value ' + str(nodata)
+        return line
+
+    @staticmethod
+    def run(properties, progress):
+        f_input = properties['input_ascii']
+        nodata  = int(properties['nodata_value'])
+        changes = SearchAndReplaceEngine.getChanges(properties['changes'].rstrip(';'))
+        if properties.get('output_folder'):
+            f_asc = properties['output_folder'] + '/' + os.path.basename(f_input)
+        else:
+            f_asc = properties['output_asc']
+        if os.path.dirname(f_asc) and not os.path.isdir(os.path.dirname(f_asc)):
+            os.makedirs(os.path.dirname(f_asc))
+
+        size = float(max(1, os.path.getsize(f_input)))
+        done = 0    # bytes of the lines read, the position of fd is the one of its read-ahead buffer
+        separator = None
+        replace = changes.get
+        with open(f_input, 'rU') as fd, open(f_asc, 'w') as out:
+            for index, line in enumerate(fd, 1):
+                done += len(line)
+                line = line.rstrip('\n')
+                if index <= SearchAndReplaceEngine.HEADER_LINES:
+                    if index == 1 and len(SearchAndReplaceEngine.split(line)) != 2:
+                        separator = line[5]   # after ncols
+                    out.write(SearchAndReplaceEngine.cleanHeader(line, index, separator, nodata) + '\n')
+                    continue
+                words = SearchAndReplaceEngine.split(line.replace(',', '.').replace('.0 ', ' '))
+                out.write(' '.join(map(replace, words, words)) + (' \n' if words else '\n'))
+                if index % 1000 == 0:
+                    progress.setPercentage(int(100 * done / size))
+
+        prj = AsciiGridWriter.getPrj()
+        if prj is not None:
+            with open(f_asc.replace('.asc', '') + '.prj', 'wb') as fd:
+                fd.write(prj)
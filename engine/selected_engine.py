@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+
+import os
+import csv
+
+import numpy as np
+
+from ..ChloeUtils import ChloeUtils
+from .raster_io import AsciiGrid, SelectedAsciiGridWriter, SelectedCsvWriter, formatDouble
+from .functional import Friction, FunctionalWindow, FunctionalWindowCache
+from .sliding_engine import SlidingEngine
+
+
+class SelectedPixels:
+    """Pixels selected by a pixels file (X;Y columns and rows) or a points file (X;Y coordinates)
+
+    As Chloe does, a point is snapped to the pixel containing it (the coordinates are
+    truncated toward zero), the pixels are sorted in the order of the rows and a pixel
+    selected twice is kept once, with its first point. A point with an id (column id, ID,
+    Id or iD) keeps its id and its coordinates for the csv output.
+    """
+
+    ID_COLUMNS = ['id', 'ID', 'Id', 'iD']
+
+    _last = None   # (key, pixels) of the last file read, check and run read it once
+
+    @staticmethod
+    def get(properties, grid):
+        """Pixels of the properties, read again only if the file or the grid changed"""
+        f_csv = properties.get('pixels') or properties['points']
+        stat = os.stat(f_csv)
+        key = (bool(properties.get('pixels')), os.path.abspath(f_csv), stat.st_size, stat.st_mtime,
+               grid.ncols, grid.nrows, grid.minx, grid.miny, grid.cellsize)
+        if SelectedPixels._last is None or SelectedPixels._last[0] != key:
+            SelectedPixels._last = (key, SelectedPixels(properties, grid))
+        return SelectedPixels._last[1]
+
+    def __init__(self, properties, grid):
+        if properties.get('pixels'):
+            xs, ys, ids, coordinates = SelectedPixels.readPixels(properties['pixels'])
+        else:
+            xs, ys, ids, coordinates = SelectedPixels.readPoints(properties['points'], grid)
+
+        # sorted by row, column then order in the file, the first of each pixel is kept
+        order = np.lexsort((np.arange(len(xs)), xs, ys))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (xs[order][1:] != xs[order][:-1]) | (ys[order][1:] != ys[order][:-1])
+        order = order[first]
+
+        self.xs = xs[order]
+        self.ys = ys[order]
+        self.ids = [ids[i] for i in order.tolist()]
+        self.coordinates = (np.where(np.isnan(coordinates[0][order]), grid.getProjectedX(self.xs), coordinates[0][order]),
+                            np.where(np.isnan(coordinates[1][order]), grid.getProjectedY(self.ys), coordinates[1][order]))
+        self.inside = (self.xs >= 0) & (self.xs < grid.ncols) & (self.ys >= 0) & (self.ys < grid.nrows)
+
+    @staticmethod
+    def readRecords(f_csv):
+        """Headers and records of a csv file separated by ;, values stripped as Chloe reads them"""
+        with open(f_csv, 'rb') as fd:
+            reader = csv.reader(fd, delimiter=';')
+            headers = [header.strip() for header in next(reader)]
+            records = [[value.strip() for value in row] for row in reader if row]
+        return headers, records
+
+    @staticmethod
+    def getColumn(headers, records, header):
+        index = headers.index(header)
+        return [record[index] if index < len(record) else '' for record in records]
+
+    @staticmethod
+    def readPixels(f_pixels):
+        headers, records = SelectedPixels.readRecords(f_pixels)
+        xs = np.array([int(x) for x in SelectedPixels.getColumn(headers, records, 'X')], dtype=np.int64)
+        ys = np.array([int(y) for y in SelectedPixels.getColumn(headers, records, 'Y')], dtype=np.int64)
+        return xs, ys, [None] * len(records), (np.full(len(records), np.nan), np.full(len(records), np.nan))
+
+    @staticmethod
+    def readPoints(f_points, grid):
+        headers, records = SelectedPixels.readRecords(f_points)
+        x = np.array([float(x) for x in SelectedPixels.getColumn(headers, records, 'X' if 'X' in headers else 'x')])
+        y = np.array([float(y) for y in SelectedPixels.getColumn(headers, records, 'Y' if 'Y' in headers else 'y')])
+        # Java (int) of a double: truncated toward zero, bounded to the int range
+        xs = np.clip(np.trunc((x - grid.minx) / grid.cellsize), -2 ** 31, 2 ** 31 - 1).astype(np.int64)
+        ys = grid.nrows - 1 - np.clip(np.trunc((y - grid.miny) / grid.cellsize), -2 ** 31, 2 ** 31 - 1).astype(np.int64)
+
+        columns = [SelectedPixels.getColumn(headers, records, header)
+                   for header in SelectedPixels.ID_COLUMNS if header in headers]
+        ids = [next((value for value in values if value), None) for values in zip(*columns)] or [None] * len(records)
+        identified = np.array([i is not None for i in ids], dtype=bool)
+        return xs, ys, ids, (np.where(identified, x, np.nan), np.where(identified, y, np.nan))
+
+
+class SelectedEngine:
+    """Selected window treatment: the metrics of the windows centered on selected pixels
+
+    The pixels (see SelectedPixels) are grouped in blocks computed together: strips of rows
+    of pixels, cut where the pixels of a strip are far apart. Only the rows around the
+    pixels are read, and the sums of the quantities of SlidingEngine are taken over the
+    block around its pixels with a halo of the radius of the largest window: summed area
+    tables for SQUARE windows, FFT convolutions for CIRCLE ones (the cells of the disks
+    when the block has few pixels), the cells of every window for FUNCTIONAL ones.
+
+    As Chloe does, a window is computed when its rate of valid cells is at least
+    1 - maximum_nodata_value_rate / 100, the pixels outside the raster are written as
+    nodata in the csv, and the cells of every window are exported in the filters folder.
+    """
+
+    BLOCK_GAP = 256   # Columns between two pixels of a strip cutting its block
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this selected properties, else the reason why not"""
+        if not properties.get('pixels') and not properties.get('points'):
+            return 'only the pixels and points files are supported'
+        if not properties.get('output_folder') and not properties.get('output_csv'):
+            return 'no output folder or csv'
+        if (properties.get('shape', 'SQUARE') == 'FUNCTIONAL' and not properties.get('output_folder')
+                and len(ChloeUtils.splitSizes(properties['window_sizes'].strip('{}'))) > 1):
+            return 'several functional window sizes written to the same outputs'
+        reason = SlidingEngine.check(properties)
+        if reason is not None:
+            return reason
+        if not SelectedPixels.get(properties, AsciiGrid(properties['input_ascii'])).inside.any():
+            return 'no selected pixel in the raster'
+        return None
+
+    @staticmethod
+    def getOutputs(properties, grid, sizes, metrics):
+        """Paths of the outputs, named as Chloe does
+
+        Chloe computes the FUNCTIONAL windows size by size, each size with its own outputs.
+        Return a list of (sizes, csv or None, list of (metric, size, ascii path)) by run.
+        """
+        folder = properties.get('output_folder')
+        shape  = properties.get('shape', 'SQUARE')
+        if shape == 'FUNCTIONAL':
+            runs = [([size], '_w' + str(size)) for size in sizes]
+        else:
+            runs = [(sizes, '_' + SlidingEngine.SHAPES[shape])]
+
+        outputs = []
+        for run_sizes, suffix in runs:
+            prefix = folder + '/' + grid.getName() + suffix if folder else None
+
+            f_csv = None
+            if properties.get('export_csv', 'true') == 'true':
+                f_csv = properties.get('output_csv') or (prefix + '.csv' if prefix else None)
+
+            asciis = []
+            if properties.get('export_ascii', 'true') == 'true':
+                ascii = properties.get('output_asc') or (prefix + '_' if prefix else None)
+                if ascii is None:
+                    pass
+                elif ascii.endswith('.asc') and len(metrics) == 1 and len(run_sizes) == 1:
+                    asciis.append((metrics[0], run_sizes[0], ascii))
+                else:
+                    for metric in metrics:
+                        for size in run_sizes:
+                            asciis.append((metric, size, ascii + 'w' + str(size) + '_' + metric + '.asc'))
+            outputs.append((run_sizes, f_csv, asciis))
+        return outputs
+
+    @staticmethod
+    def getFiltersDir(properties):
+        """Folder of the cells of the windows, as Chloe the folder of the csv has no separator"""
+        if properties.get('output_folder'):
+            return properties['output_folder'] + '/filters/'
+        return os.path.dirname(properties['output_csv']) + 'filters/'
+
+    @staticmethod
+    def getBlocks(ys, xs, halo, strip_rows):
+        """Blocks of the pixels (ys, xs) sorted by row: list of (indexes of the pixels, first row,
+        rows end, first column, columns end) in the pixels coordinates, halo included"""
+        blocks = []
+        start = 0
+        while start < len(ys):
+            end = int(np.searchsorted(ys, ys[start] + strip_rows))
+            strip = start + np.argsort(xs[start:end], kind='mergesort')
+            gaps = np.flatnonzero(np.diff(xs[strip]) > max(SelectedEngine.BLOCK_GAP, 2 * halo)) + 1
+            for pixels in np.split(strip, gaps):
+                blocks.append((np.sort(pixels), ys[start] - halo, ys[end - 1] + halo + 1,
+                               xs[pixels].min() - halo, xs[pixels].max() + halo + 1))
+            start = end
+        return blocks
+
+    @staticmethod
+    def getDiskSums(quantities, sizes, rows, xs):
+        """Sums of the quantities over the circle windows centered on the cells (rows, xs) of the block, by size
+
+        The cells of every disk are gathered: for a few pixels this is faster than the
+        convolutions of SlidingEngine.getCircleSums over the whole block.
+        'total' is the number of cells of the window in the raster.
+        """
+        halo = max(sizes) // 2
+        quantities = dict(quantities)
+        quantities['total'] = np.ones(next(iter(quantities.values())).shape)
+        quantities = dict((name, np.pad(quantity, halo, 'constant')) for name, quantity in quantities.items())
+        sums_by_size = {}
+        for size in sizes:
+            sums = {}
+            for name, quantity in quantities.items():
+                direction = name[0] if isinstance(name, tuple) else None
+                dy, dx = np.nonzero(SlidingEngine.getCoupleMask(SlidingEngine.getDisk(size), direction))
+                dy, dx = dy - size // 2 + halo, dx - size // 2 + halo
+                sums[name] = np.zeros(len(rows))
+                batch = max(1, SlidingEngine.BATCH_CELLS // max(1, len(dy)))
+                for start in range(0, len(rows), batch):
+                    sums[name][start:start + batch] = quantity[rows[start:start + batch, None] + dy,
+                                                               xs[start:start + batch, None] + dx].sum(axis=1)
+            sums_by_size[size] = SlidingEngine.mergeCouples(sums)
+        return sums_by_size
+
+    @staticmethod
+    def exportWindow(f_asc, grid, x, y, width, values, mask):
+        """Write the cells of the window of width width of the pixel (x, y) as Chloe Window.export
+
+        values is the box of the window (nodata outside the raster), the cells out of the
+        mask (None for a SQUARE window) are written -1. As Chloe, the box of a SQUARE window
+        of even size has one more row and column than its width in the header.
+        """
+        if np.array_equal(values, np.trunc(values)) and not (np.abs(values) >= 1e7).any():
+            # Double.toString of an integer below 10^7 is the integer followed by .0
+            texts = ['%d.0' % value for value in values.astype(np.int64).ravel().tolist()]
+        else:
+            texts = [formatDouble(value) for value in values.ravel().tolist()]
+        if mask is not None:
+            texts = [text if inside else '-1' for text, inside in zip(texts, mask.ravel().tolist())]
+        with open(f_asc, 'w') as fd:
+            fd.write('ncols ' + str(width) + '\n')
+            fd.write('nrows ' + str(width) + '\n')
+            fd.write('xllcorner ' + formatDouble(grid.getProjectedX(x) - width / 2.0 * grid.cellsize) + '\n')
+            fd.write('yllcorner ' + formatDouble(grid.getProjectedY(y) - width / 2.0 * grid.cellsize) + '\n')
+            fd.write('cellsize ' + formatDouble(grid.cellsize) + '\n')
+            fd.write('NODATA_value  ' + str(grid.nodata) + '\n')
+            side = len(values)
+            for row in range(side):
+                fd.write(''.join(text + ' ' for text in texts[row * side:(row + 1) * side]) + '\n')
+
+    @staticmethod
+    def run(properties, progress):
+        grid    = AsciiGrid(properties['input_ascii'])
+        nodata  = grid.nodata
+        sizes   = [int(size) for size in ChloeUtils.splitSizes(properties['window_sizes'].strip('{}'))]
+        metrics = SlidingEngine.splitList(properties['metrics'])
+        minRate = 1 - float(properties.get('maximum_nodata_value_rate', '100')) / 100
+
+        names  = SlidingEngine.getNames(metrics, properties['input_ascii'])
+        pixels = SelectedPixels.get(properties, grid)
+
+        shape = properties.get('shape', 'SQUARE')
+        windows = None
+        caches  = {}
+        if shape == 'FUNCTIONAL':
+            friction = Friction(properties['friction'])
+            windows = dict((size, FunctionalWindow(friction, size, grid.cellsize)) for size in sizes)
+            caches = dict((size, FunctionalWindowCache.open(window, grid, properties['friction']))
+                          for size, window in windows.items())
+            theoretical = None
+            widths = dict((size, window.diameter) for size, window in windows.items())
+            kind = 'functional'
+        elif shape == 'CIRCLE':
+            getSums = SlidingEngine.getCircleSums
+            theoretical = dict((size, SlidingEngine.getDisk(size).sum()) for size in sizes)
+            widths = dict((size, size) for size in sizes)
+            kind = 'circle'
+        else:
+            getSums = SlidingEngine.getSquareSums
+            theoretical = dict((size, size * size) for size in sizes)
+            widths = dict((size, size) for size in sizes)
+            kind = 'square'
+
+        filters_dir = SelectedEngine.getFiltersDir(properties)
+        if not os.path.isdir(filters_dir):
+            os.makedirs(filters_dir)
+
+        # Metrics of every pixel by (metric, size), nodata for the pixels outside the raster
+        results = dict(((metric, size), np.full(len(pixels.xs), float(nodata))) for metric in metrics for size in sizes)
+
+        inside = np.flatnonzero(pixels.inside)
+        ys, xs = pixels.ys[inside], pixels.xs[inside]
+        halo = max(window.radius for window in windows.values()) if windows else max(sizes) // 2
+        strip_rows = max(1, SlidingEngine.STRIP_CELLS // (grid.ncols * len(names)))
+        blocks = SelectedEngine.getBlocks(ys, xs, halo, strip_rows)
+        strip = None    # (first row, rows end, values) of the rows read last
+        try:
+            for count, (block, top, bottom, left, right) in enumerate(blocks):
+                top, bottom = max(0, top), min(grid.nrows, bottom)
+                left, right = max(0, left), min(grid.ncols, right)
+                if strip is None or strip[0] != top or strip[1] != bottom:
+                    strip = (top, bottom, grid.readRows(top, bottom))
+                values = strip[2][:, left:right]
+                rows, columns = ys[block] - top, xs[block] - left
+
+                quantities = SlidingEngine.getQuantities(values, nodata, names)
+                boxes = {}
+                if windows:
+                    sums_by_size = SlidingEngine.getFunctionalSums(
+                        quantities, windows, friction.getFrictions(values, nodata), rows, columns, nodata,
+                        caches, top, left, grid.ncols, boxes)
+                elif shape == 'CIRCLE' and len(block) * max(sizes) ** 2 < values.size:
+                    sums_by_size = SelectedEngine.getDiskSums(quantities, sizes, rows, columns)
+                else:
+                    sums_by_size = getSums(quantities, sizes, rows, columns)
+
+                for size in sizes:
+                    sums = sums_by_size[size]
+                    size_theoretical = sums['total'] if windows else theoretical[size]
+                    ok = sums['count'] / np.asarray(size_theoretical, dtype=np.float64) >= minRate
+                    for metric in metrics:
+                        results[(metric, size)][inside[block]] = SlidingEngine.getMetric(
+                            metric, sums, ok, nodata, grid.cellsize, size_theoretical)
+
+                # Cells of the windows, nodata outside the raster
+                padded = np.pad(values, halo, 'constant', constant_values=nodata)
+                for size in sizes:
+                    width = widths[size]
+                    mask = SlidingEngine.getDisk(size) if shape == 'CIRCLE' else None
+                    for i, (row, column) in enumerate(zip(rows.tolist(), columns.tolist())):
+                        # width // 2 cells on each side of the center, as Chloe does
+                        box = padded[row + halo - width // 2:row + halo + width // 2 + 1,
+                                     column + halo - width // 2:column + halo + width // 2 + 1]
+                        x, y = column + left, row + top
+                        SelectedEngine.exportWindow(
+                            filters_dir + grid.getName() + '_' + kind + '_' + str(width) + '_' +
+                            formatDouble(grid.getProjectedX(x)) + '-' + formatDouble(grid.getProjectedY(y)) + '.asc',
+                            grid, x, y, width, box, boxes[size][i] if windows else mask)
+                progress.setPercentage(int(100 * (count + 1) / len(blocks)))
+        finally:
+            for cache in caches.values():
+                if cache is not None:
+                    cache.close()
+
+        for run_sizes, f_csv, asciis in SelectedEngine.getOutputs(properties, grid, sizes, metrics):
+            for f_out in [f_csv] + [f_asc for metric, size, f_asc in asciis]:
+                if f_out and os.path.dirname(f_out) and not os.path.isdir(os.path.dirname(f_out)):
+                    os.makedirs(os.path.dirname(f_out))
+            for metric, size, f_asc in asciis:
+                writer = SelectedAsciiGridWriter(f_asc, grid, nodata)
+                try:
+                    writer.writePixels(ys, xs, results[(metric, size)][inside])
+                finally:
+                    writer.close()
+            if f_csv:
+                def title(metric, size):
+                    return metric if len(run_sizes) == 1 else 'w' + str(size) + '_' + metric
+                columns = dict((title(metric, size), results[(metric, size)]) for metric in metrics for size in run_sizes)
+                writer = SelectedCsvWriter(f_csv, grid, list(columns), nodata, pixels.ids[0] is not None)
+                try:
+                    writer.writePixels(pixels.ids, pixels.coordinates, columns)
+                finally:
+                    writer.close()
@@ -0,0 +1,730 @@
+# -*- coding: utf-8 -*-
+
+#####################################################################################################
+# Chloe - landscape metrics
+#
+# Copyright 2018 URCAUE-Nouvelle Aquitaine
+# Author(s) J-C. Naud, O. Bedel - Alkante (http://www.alkante.com) ;
+#           H. Boussard - INRA UMR BAGAP (https://www6.rennes.inra.fr/sad)
+#
+# Created on Mon Oct 22 2018
+# This file is part of Chloe - landscape metrics.
+#
+# Chloe - landscape metrics is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Chloe - landscape metrics is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Chloe - landscape metrics.  If not, see <http://www.gnu.org/licenses/>.
+#####################################################################################################
+
+import os
+import re
+
+import numpy as np
+
+from ..ChloeUtils import ChloeUtils
+from ..ChloeTiling import ChloeTiling
+from .raster_io import AsciiGrid, AsciiGridWriter, CsvWriter
+from .functional import Friction, FunctionalWindow, FunctionalWindowCache
+
+
+class SlidingEngine:
+    """Sliding window treatment computed with summed area tables or FFT convolutions
+
+    The metrics only need the sums over the windows of a few quantities: the valid cells,
+    the values, their squares, the cells of each class... For SQUARE windows the sums are
+    read in O(1) from the summed area tables of the quantities. For CIRCLE windows they are
+    the convolutions of the quantities with the disk, computed by FFT in O(N log N) whatever
+    the diameter. For FUNCTIONAL windows they are gathered over the cells of every window,
+    found by the diffusion of Chloe on the frictions (see FunctionalWindow). The couples
+    metrics (NC-, E-, HET...) count the couples of a cell with its left and upper neighbours:
+    each couple is a quantity of the cell coded as Chloe does, whose sums are taken over the
+    windows reduced to the cells whose neighbour is in the window too. The quantities are
+    computed strip by strip of output rows (with a halo of the radius of the largest window),
+    so the memory used does not depend on the height of the raster, and all the window sizes
+    are computed in the same pass from the same strips.
+
+    The metrics follow Chloe: a window is computed when its center is in the filters
+    (and not in the unfilters) and when its rate of valid cells (nodata excluded, cells
+    outside the raster included) is at least 1 - maximum_nodata_value_rate / 100,
+    otherwise its metrics are nodata. The outputs are identical to Chloe ones for integer
+    rasters; for decimal rasters the sums may differ in the last bits.
+    """
+
+    # Metric: quantities summed over the windows it needs, 'classes' stands for the count
+    # of every class of the raster (the values different from 0 and nodata)
+    METRICS = {
+        'N-theoretical':      ['count'],
+        'N-total':            ['count'],
+        'N-valid':            ['count'],
+        'pN-valid':           ['count'],
+        'Nclass':             ['count', 'classes'],
+        'SHDI':               ['count', 'nonzero', 'classes'],
+        'SHEI':               ['count', 'nonzero', 'classes'],
+        'SIDI':               ['count', 'nonzero', 'classes'],
+        'SIEI':               ['count', 'nonzero', 'classes'],
+        'sum':                ['count', 'sum'],
+        'square_sum':         ['count', 'square_sum'],
+        'average':            ['count', 'sum'],
+        'variance':           ['count', 'sum', 'square_sum'],
+        'standard_deviation': ['count', 'sum', 'square_sum'],
+        'standard_error':     ['count', 'sum', 'square_sum'],
+        'count_positives':    ['count', 'positives'],
+        'count_negatives':    ['count', 'negatives'],
+        'size':               ['count'],
+        'NAT':                ['count', 'nonzero', 'class_sum'],
+        'NC-total':           ['count', 'total_couples'],
+        'NC-valid':           ['count', 'valid_couples'],
+        'pNC-valid':          ['count', 'total_couples', 'valid_couples', 'count_couples'],
+        'NC-homo':            ['count', 'count_couples', 'homogeneous_couples'],
+        'NC-hete':            ['count', 'count_couples', 'heterogeneous_couples'],
+        'E-homo':             ['count', 'count_couples', 'homogeneous_couples'],
+        'E-hete':             ['count', 'count_couples', 'heterogeneous_couples'],
+        'HET':                ['count', 'valid_couples', 'count_couples', 'couples'],
+        'HET-agg':            ['count', 'valid_couples', 'count_couples', 'couples'],
+        'HET-frag':           ['count', 'valid_couples', 'count_couples', 'couples'],
+    }
+
+    # Metrics of one class, the name is the prefix followed by the class value (NV_3)
+    CLASS_METRICS = ['NV_', 'pNV_']
+
+    # Metrics of one couple of classes, the name is the prefix followed by the classes (NC_1-3)
+    COUPLE_METRICS = ['NC_', 'pNC_', 'E_', 'HETC_']
+
+    # Quantities of the couples, with the count of a couple named ('couple', code)
+    COUPLE_NAMES = ['total_couples', 'valid_couples', 'count_couples', 'homogeneous_couples', 'heterogeneous_couples']
+
+    STRIP_CELLS = 16 * 1024 * 1024  # Cells of all the quantities of a strip
+    BATCH_CELLS = 2 * 1024 * 1024   # Cells of the boxes of the functional windows computed at once
+
+    # Abbreviation of the shape in the outputs names
+    SHAPES = {'SQUARE': 'sq', 'CIRCLE': 'cr', 'FUNCTIONAL': 'fn'}
+
+    @staticmethod
+    def splitList(value):
+        return [item.strip() for item in value.strip().strip('{}').split(';') if item.strip()]
+
+    @staticmethod
+    def getClassMetric(metric):
+        """Return (prefix, class) of a class metric, None if the metric is not one"""
+        for prefix in SlidingEngine.CLASS_METRICS:
+            if metric.startswith(prefix):
+                try:
+                    return prefix, int(metric[len(prefix):])
+                except ValueError:
+                    return None
+        return None
+
+    @staticmethod
+    def getCoupleCode(value1, value2):
+        """Code of the couple of two values, as Chloe: 0 if one is 0, else min + 0.001 * max"""
+        if value1 == 0 or value2 == 0:
+            return 0.0
+        return min(value1, value2) + 0.001 * max(value1, value2)
+
+    @staticmethod
+    def isHomogeneous(codes):
+        """Couples of two identical classes, tested on their codes as Chloe does"""
+        classes = np.floor(codes)
+        return codes == classes + 0.001 * classes
+
+    @staticmethod
+    def getCoupleMetric(metric):
+        """Return (prefix, code of the couple) of a couple metric, None if the metric is not one"""
+        for prefix in SlidingEngine.COUPLE_METRICS:
+            if metric.startswith(prefix):
+                match = re.match(r'^(-?\d+)-(-?\d+)$', metric[len(prefix):])
+                if match is None:
+                    return None
+                return prefix, float(SlidingEngine.getCoupleCode(int(match.group(1)), int(match.group(2))))
+        return None
+
+    @staticmethod
+    def isSupported(metric):
+        return (metric in SlidingEngine.METRICS or SlidingEngine.getClassMetric(metric) is not None
+                or SlidingEngine.getCoupleMetric(metric) is not None)
+
+    @staticmethod
+    def isCoupleName(name):
+        return name in SlidingEngine.COUPLE_NAMES or (isinstance(name, tuple) and name[0] == 'couple')
+
+    @staticmethod
+    def getNames(metrics, f_input):
+        """Quantities needed by the metrics, the count of a class is named ('class', value)
+        and the one of a couple ('couple', code)
+        """
+        names = set()
+        classes = set()
+        codes = set()
+        for metric in metrics:
+            class_metric = SlidingEngine.getClassMetric(metric)
+            couple_metric = SlidingEngine.getCoupleMetric(metric)
+            if class_metric is not None:
+                names.update(['count', 'nonzero'])
+                classes.add(class_metric[1])
+            elif couple_metric is not None:
+                names.update(['count', 'valid_couples', 'count_couples'])
+                codes.add(couple_metric[1])
+            else:
+                names.update(SlidingEngine.METRICS[metric])
+        if 'classes' in names or 'couples' in names:
+            values = ChloeUtils.extractValueNotNull(f_input)
+            if 'classes' in names:
+                names.remove('classes')
+                classes.update(values)
+            if 'couples' in names:
+                # every couple of classes of the raster
+                names.remove('couples')
+                codes.update(SlidingEngine.getCoupleCode(value1, value2)
+                             for value1 in values for value2 in values if value1 <= value2)
+        names.update(('class', value) for value in classes)
+        names.update(('couple', code) for code in codes)
+        return names
+
+    @staticmethod
+    def check(properties):
+        """Return None if the engine computes this sliding properties, else the reason why not"""
+        shape = properties.get('shape', 'SQUARE')
+        if shape not in SlidingEngine.SHAPES:
+            return 'only SQUARE, CIRCLE and FUNCTIONAL windows are supported'
+        if shape == 'CIRCLE' and any(int(size) % 2 == 0
+                                     for size in ChloeUtils.splitSizes(properties['window_sizes'].strip('{}'))):
+            return 'CIRCLE windows of even size are not supported'
+        if properties.get('interpolation', 'false') == 'true':
+            return 'interpolation is not supported'
+        metrics = SlidingEngine.splitList(properties.get('metrics', ''))
+        unsupported = [metric for metric in metrics if not SlidingEngine.isSupported(metric)]
+        if not metrics or unsupported:
+            return 'metric(s) not supported: ' + ';'.join(unsupported)
+        if (properties.get('export_csv', 'true') == 'true' and properties.get('output_csv', properties.get('output_folder'))
+                and int(properties.get('delta_displacement', '1')) != 1):
+            return 'csv output with a displacement is not supported'
+        if not properties.get('input_ascii', '').lower().endswith('.asc'):
+            return 'the input is not an ascii grid'
+        header, header_lines = ChloeTiling.getAsciiHeader(properties['input_ascii'])
+        if 'nodata_value' not in header:
+            return 'the input has no NODATA_value'
+        if shape == 'FUNCTIONAL':
+            if not os.path.isfile(properties.get('friction', '')):
+                return 'no friction file (only the frictions by value are supported)'
+            friction = Friction(properties['friction'])
+            if friction.min <= 0:
+                return 'a friction is not positive'
+            grid = AsciiGrid(properties['input_ascii'])
+            strip_rows = grid.getStripRows(SlidingEngine.STRIP_CELLS)
+            for top in range(0, grid.nrows, strip_rows):
+                unknown = friction.getUnknown(grid.readRows(top, min(grid.nrows, top + strip_rows)), grid.nodata)
+                if len(unknown):
+                    return 'value without friction: ' + str(unknown[0])
+        return None
+
+    @staticmethod
+    def getOutputs(properties, grid, sizes, metrics, delta):
+        """Paths of the outputs, named as Chloe does
+
+        Return (csv or None, list of (metric, size, ascii path)).
+        """
+        folder = properties.get('output_folder')
+        shape  = SlidingEngine.SHAPES[properties.get('shape', 'SQUARE')]
+        prefix = folder + '/' + grid.getName() + '_' + shape if folder else None
+
+        f_csv = None
+        if properties.get('export_csv', 'true') == 'true':
+            f_csv = properties.get('output_csv') or (prefix + '.csv' if prefix else None)
+
+        asciis = []
+        if properties.get('export_ascii', 'true') == 'true':
+            ascii = properties.get('output_asc') or (prefix + '_' if prefix else None)
+            if ascii is None:
+                pass
+            elif ascii.endswith('.asc') and len(metrics) == 1 and len(sizes) == 1:
+                asciis.append((metrics[0], sizes[0], ascii))
+            elif len(sizes) == 1:
+                for metric in metrics:
+                    asciis.append((metric, sizes[0],
+                                   ascii + 'w' + str(sizes[0]) + '_' + metric + '_d_' + str(delta) + '.asc'))
+            else:
+                for metric in metrics:
+                    for size in sizes:
+                        asciis.append((metric, size, ascii + 'w' + str(size) + '_' + metric + '.asc'))
+        return f_csv, asciis
+
+    @staticmethod
+    def getCouples(values, nodata, above=None):
+        """Couples of every cell of a strip with its left neighbour and with its upper one
+
+        above is the row before the strip, the neighbours outside the raster (or unknown)
+        are nodata. Return a list of (direction, valid, counted, codes): as Chloe, a couple
+        is valid when one of its values is 0 or none is nodata, and is counted by code when
+        none of its values is 0 or nodata.
+        """
+        left = np.empty_like(values)
+        left[:, 0] = nodata
+        left[:, 1:] = values[:, :-1]
+        up = np.empty_like(values)
+        up[0] = nodata if above is None else above
+        up[1:] = values[:-1]
+        couples = []
+        for direction, neighbours in (('horizontal', left), ('vertical', up)):
+            zero = (values == 0) | (neighbours == 0)
+            counted = (values != nodata) & (neighbours != nodata) & ~zero
+            valid = counted | zero
+            codes = np.minimum(values, neighbours) + 0.001 * np.maximum(values, neighbours)
+            couples.append((direction, valid, counted, codes))
+        return couples
+
+    @staticmethod
+    def getQuantities(values, nodata, names, above=None):
+        """Cumulated quantities of every cell of a strip of the input
+
+        A couple quantity is split in ('horizontal', name) and ('vertical', name), the couples
+        of the cells with their left and upper neighbours (see getCouples).
+        """
+        quantities = {}
+        couple_names = [name for name in names if SlidingEngine.isCoupleName(name)]
+        if couple_names:
+            for direction, valid, counted, codes in SlidingEngine.getCouples(values, nodata, above):
+                homogeneous = counted & SlidingEngine.isHomogeneous(codes)
+                for name in couple_names:
+                    if isinstance(name, tuple):
+                        quantity = counted & (codes == name[1])
+                    elif name == 'total_couples':
+                        quantity = np.ones(values.shape, dtype=bool)
+                    elif name == 'valid_couples':
+                        quantity = valid
+                    elif name == 'count_couples':
+                        quantity = counted
+                    elif name == 'homogeneous_couples':
+                        quantity = homogeneous
+                    else:
+                        quantity = counted & ~homogeneous
+                    quantities[(direction, name)] = quantity.astype(np.float64)
+
+        valid = values != nodata
+        values = np.where(valid, values, 0)
+        classes = np.trunc(values)   # a class is the integer part of the value
+        for name in names:
+            if SlidingEngine.isCoupleName(name):
+                continue
+            elif isinstance(name, tuple):
+                # count of a class, as Chloe the cells of value 0 are in no class
+                quantities[name] = ((classes == name[1]) & (values != 0)).astype(np.float64)
+            elif name == 'count':
+                quantities[name] = valid.astype(np.float64)
+            elif name == 'sum':
+                quantities[name] = values
+            elif name == 'square_sum':
+                quantities[name] = values * values
+            elif name == 'positives':
+                quantities[name] = (values > 0).astype(np.float64)
+            elif name == 'negatives':
+                quantities[name] = (values < 0).astype(np.float64)
+            elif name == 'nonzero':
+                quantities[name] = (values != 0).astype(np.float64)
+            elif name == 'class_sum':
+                quantities[name] = classes
+        return quantities
+
+    @staticmethod
+    def mergeCouples(sums):
+        """Add up the sums of the horizontal and vertical couples of every couple quantity"""
+        for key in [key for key in sums if isinstance(key, tuple) and key[0] in ('horizontal', 'vertical')]:
+            value = sums.pop(key)
+            sums[key[1]] = sums[key[1]] + value if key[1] in sums else value
+        return sums
+
+    @staticmethod
+    def getTable(values):
+        """Summed area table, table[i, j] is the sum of values[:i, :j]"""
+        table = np.zeros((values.shape[0] + 1, values.shape[1] + 1))
+        table[1:, 1:] = values.cumsum(axis=0).cumsum(axis=1)
+        return table
+
+    @staticmethod
+    def getWindowSums(table, y0, y1, x0, x1):
+        """Sums of the windows [y0, y1[ x [x0, x1[ (rows and columns indexes arrays broadcast together)"""
+        return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+    @staticmethod
+    def getSquareSums(quantities, sizes, rows, xs):
+        """Sums of the quantities over the square windows centered on the cells (rows, xs) of the strip, by size
+
+        rows and xs are broadcast together: rows[:, None] and xs[None, :] for all the cells
+        of these rows and columns, or two arrays of the same length for a list of cells.
+        'total' is the number of cells of the window in the raster.
+        """
+        nrows, ncols = next(iter(quantities.values())).shape
+        tables = dict((name, SlidingEngine.getTable(quantity)) for name, quantity in quantities.items())
+        sums_by_size = {}
+        for size in sizes:
+            # as Chloe, a window of even size has one more cell before its center than after
+            top  = rows - size // 2
+            left = xs - size // 2
+            y0 = np.maximum(top, 0)
+            y1 = np.minimum(top + size, nrows)
+            x0 = np.maximum(left, 0)
+            x1 = np.minimum(left + size, ncols)
+            sums = {}
+            for name, table in tables.items():
+                # the couples of the first row (column) of the window have their neighbour outside
+                direction = name[0] if isinstance(name, tuple) else None
+                sums[name] = SlidingEngine.getWindowSums(
+                    table, np.maximum(top + 1, 0) if direction == 'vertical' else y0, y1,
+                    np.maximum(left + 1, 0) if direction == 'horizontal' else x0, x1)
+            sums['total'] = ((y1 - y0) * (x1 - x0)).astype(np.float64)
+            sums_by_size[size] = SlidingEngine.mergeCouples(sums)
+        return sums_by_size
+
+    @staticmethod
+    def getDisk(size):
+        """Cells of a CIRCLE window, as Chloe: their center is at most size / 2 - 0.5 from the window center"""
+        radius = size / 2.0 - 0.5
+        offsets = np.arange(size) - radius
+        return (np.sqrt(offsets[:, None] ** 2 + offsets[None, :] ** 2) <= radius).astype(np.float64)
+
+    @staticmethod
+    def getCoupleMask(window, direction):
+        """Cells of a window whose neighbour in the direction of the couples is in the window too"""
+        mask = window.copy()
+        if direction == 'horizontal':
+            mask[:, 0] = 0
+            mask[:, 1:] *= window[:, :-1]
+        elif direction == 'vertical':
+            mask[0] = 0
+            mask[1:] *= window[:-1]
+        return mask
+
+    @staticmethod
+    def getFftSize(n):
+        """Smallest 2^a.3^b.5^c not lower than n, the FFT is fast for these sizes"""
+        size = n
+        while True:
+            rest = size
+            for factor in (2, 3, 5):
+                while rest % factor == 0:
+                    rest //= factor
+            if rest == 1:
+                return size
+            size += 1
+
+    @staticmethod
+    def getCircleSums(quantities, sizes, rows, xs):
+        """Sums of the quantities over the circle windows centered on the cells (rows, xs) of the strip, by size
+
+        The sums are the convolutions of the quantities with the disks, the FFT of a quantity
+        is computed once for all the sizes. The sums of an integral quantity (counts, values of
+        an integer raster) are rounded, they are then exact.
+        'total' is the number of cells of the window in the raster.
+        """
+        nrows, ncols = next(iter(quantities.values())).shape
+        diameter = max(sizes)
+        halo = diameter // 2
+        shape = (SlidingEngine.getFftSize(nrows + diameter - 1), SlidingEngine.getFftSize(ncols + diameter - 1))
+
+        quantities = dict(quantities)
+        quantities['total'] = np.ones((nrows, ncols))
+        directions = set(name[0] if isinstance(name, tuple) else None for name in quantities)
+
+        kernels = {}    # by (size, direction of the couples or None)
+        for size in sizes:
+            offset = halo - size // 2
+            for direction in directions:
+                # the convolution flips the kernel, the masks of the couples are not symmetric
+                kernel = np.zeros((diameter, diameter))
+                kernel[offset:offset + size, offset:offset + size] = SlidingEngine.getCoupleMask(
+                    SlidingEngine.getDisk(size), direction)[::-1, ::-1]
+                kernels[(size, direction)] = np.fft.rfft2(kernel, shape)
+
+        sums_by_size = dict((size, {}) for size in sizes)
+        for name, quantity in quantities.items():
+            direction = name[0] if isinstance(name, tuple) else None
+            transform = np.fft.rfft2(quantity, shape)
+            integral = np.array_equal(quantity, np.trunc(quantity))
+            for size in sizes:
+                # the result of the cell (i, j) is at (i + halo, j + halo) in the full convolution
+                value = np.fft.irfft2(transform * kernels[(size, direction)], shape)[rows + halo, xs + halo]
+                sums_by_size[size][name] = np.rint(value) if integral else value
+        for sums in sums_by_size.values():
+            SlidingEngine.mergeCouples(sums)
+        return sums_by_size
+
+    @staticmethod
+    def getFunctionalSums(quantities, windows, frictions, rows, xs, nodata, caches=None, top=0, left=0, columns=None,
+                          boxes=None):
+        """Sums of the quantities over the functional windows centered on the cells (rows, xs) of the strip, by size
+
+        windows are the FunctionalWindow by size and frictions the frictions of the strip,
+        whose upper left cell is the cell (top, left) of a raster of columns columns (the
+        strip columns by default). The windows in caches (FunctionalWindowCache by size, None
+        if not cached) are read from the cache, not computed. boxes, when given, gets by size
+        the cells of the windows (bool array cells x diameter x diameter).
+        The couples are the ones of the cells whose neighbour is in the window too.
+        'total' is the number of cells of the window, all in the raster.
+        """
+        nrows, ncols = frictions.shape
+        halo = max(window.radius for window in windows.values())
+        width = ncols + 2 * halo
+        frictions = np.pad(frictions, halo, 'constant', constant_values=nodata).ravel()
+        quantities = dict((name, np.pad(quantity, halo, 'constant').ravel()) for name, quantity in quantities.items())
+        directions = set(name[0] if isinstance(name, tuple) else None for name in quantities)
+
+        shape   = np.broadcast(rows, xs).shape
+        centers = ((rows + halo) * width + (xs + halo)).ravel()
+        indexes = ((rows + top) * (columns or ncols) + (xs + left)).ravel()   # in the raster
+        sums_by_size = {}
+        for size, window in windows.items():
+            offsets = ((np.arange(window.diameter) - window.radius)[:, None] * width
+                       + (np.arange(window.diameter) - window.radius)[None, :])
+            sums = dict((name, np.zeros(len(centers))) for name in list(quantities) + ['total'])
+            if boxes is not None:
+                boxes[size] = np.empty((len(centers), window.diameter, window.diameter), dtype=bool)
+            batch = max(1, SlidingEngine.BATCH_CELLS // offsets.size)
+            for start in range(0, len(centers), batch):
+                cells = centers[start:start + batch, None, None] + offsets
+                cache = caches.get(size) if caches else None
+                if cache is not None:
+                    masks = cache.getMasks(indexes[start:start + batch], frictions[cells], nodata)
+                else:
+                    masks = window.getMasks(frictions[cells], nodata)
+                if boxes is not None:
+                    boxes[size][start:start + batch] = masks
+                for direction in directions:
+                    mask = SlidingEngine.getCoupleMask(masks.transpose(1, 2, 0), direction).transpose(2, 0, 1)
+                    index = np.nonzero(mask)
+                    for name, quantity in quantities.items():
+                        if (name[0] if isinstance(name, tuple) else None) == direction:
+                            sums[name][start:start + batch] = np.bincount(
+                                index[0], weights=quantity[cells[index]], minlength=len(mask))
+                sums['total'][start:start + batch] = masks.sum(axis=(1, 2))
+            sums_by_size[size] = SlidingEngine.mergeCouples(
+                dict((name, value.reshape(shape)) for name, value in sums.items()))
+        return sums_by_size
+
+    @staticmethod
+    def getDiversity(sums):
+        """Sums over the classes present in the windows of p.ln(p) and of p^2 and the number of classes
+
+        p is the rate of the class among the valid cells, the classes are summed in ascending
+        order as Chloe does.
+        """
+        count = sums['count']
+        shannon = np.zeros(count.shape)
+        simpson = np.zeros(count.shape)
+        nclass = np.zeros(count.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for name in sorted(name for name in sums if isinstance(name, tuple) and name[0] == 'class'):
+                present = sums[name] > 0
+                rate = np.where(present, sums[name] / count, 1)
+                shannon += np.where(present, rate * np.log(rate), 0)
+                simpson += np.where(present, rate * rate, 0)
+                nclass += present
+        return shannon, simpson, nclass
+
+    @staticmethod
+    def getCoupleEntropy(sums, names):
+        """Sum of p.ln(p) over the couples of names present in the windows
+
+        p is the rate of the couple among the valid couples, the couples are summed in
+        ascending order of their codes as Chloe does.
+        """
+        valid = sums['valid_couples']
+        entropy = np.zeros(valid.shape)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for name in sorted(names):
+                present = sums[name] > 0
+                rate = np.where(present, sums[name] / valid, 1)
+                entropy += np.where(present, rate * np.log(rate), 0)
+        return entropy
+
+    @staticmethod
+    def getMetric(metric, sums, ok, nodata, cellsize, theoretical):
+        count = sums['count']
+        class_metric = SlidingEngine.getClassMetric(metric)
+        couple_metric = SlidingEngine.getCoupleMetric(metric)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if class_metric is not None:
+                prefix, value = class_metric
+                if prefix == 'NV_':
+                    value = sums[('class', value)]
+                    ok = ok & (sums['nonzero'] > 0)
+                else:
+                    value = np.where(sums['nonzero'] > 0, sums[('class', value)] / count, 0)
+            elif couple_metric is not None:
+                prefix, code = couple_metric
+                value = sums[('couple', code)]
+                if prefix == 'pNC_':
+                    value = np.where(sums['valid_couples'] > 0, value / sums['valid_couples'], 0)
+                elif prefix == 'E_':
+                    value = value * cellsize
+                    ok = ok & (sums['count_couples'] > 0)
+                elif prefix == 'HETC_':
+                    entropy = SlidingEngine.getCoupleEntropy(sums, [('couple', code)])
+                    value = np.where((sums['count_couples'] > 0) & (entropy != 0), -entropy, 0)
+            elif metric == 'NC-total':
+                value = sums['total_couples']
+            elif metric == 'NC-valid':
+                value = sums['valid_couples']
+            elif metric == 'pNC-valid':
+                value = sums['valid_couples'] / sums['total_couples']
+                ok = ok & (sums['count_couples'] > 0)
+            elif metric in ['NC-homo', 'NC-hete', 'E-homo', 'E-hete']:
+                value = sums['homogeneous_couples' if metric.endswith('homo') else 'heterogeneous_couples']
+                if metric.startswith('E'):
+                    value = value * cellsize
+                # nodata for the windows without couple of classes
+                ok = ok & (sums['count_couples'] > 0)
+            elif metric in ['HET', 'HET-agg', 'HET-frag']:
+                names = [name for name in sums if isinstance(name, tuple) and name[0] == 'couple']
+                if metric != 'HET':
+                    homogeneous = metric == 'HET-agg'
+                    names = [name for name in names if bool(SlidingEngine.isHomogeneous(name[1])) == homogeneous]
+                entropy = SlidingEngine.getCoupleEntropy(sums, names)
+                value = np.where((sums['count_couples'] > 0) & (entropy != 0), -entropy, 0)
+            elif metric == 'N-theoretical':
+                value = np.zeros(count.shape) + theoretical
+            elif metric == 'N-total':
+                value = sums['total']
+            elif metric == 'N-valid':
+                value = count
+            elif metric == 'pN-valid':
+                value = count / np.asarray(theoretical, dtype=np.float64)
+            elif metric in ['Nclass', 'SHDI', 'SHEI', 'SIDI', 'SIEI']:
+                shannon, simpson, nclass = SlidingEngine.getDiversity(sums)
+                if metric == 'Nclass':
+                    value = nclass
+                else:
+                    # 0 for the windows without class
+                    classified = sums['nonzero'] > 0
+                    if metric == 'SHDI':
+                        value = np.where(classified & (shannon != 0), -shannon, 0)
+                    elif metric == 'SHEI':
+                        value = np.where(classified & (shannon != 0), shannon * (-1.0 / np.log(nclass)), 0)
+                    elif metric == 'SIDI':
+                        value = np.where(classified, 1 - simpson, 0)
+                    else:
+                        value = np.where(classified, (1 - simpson) / nclass, 0)
+            elif metric == 'size':
+                value = count
+            elif metric == 'NAT':
+                value = sums['class_sum'] * (cellsize ** 2)
+                ok = ok & (sums['nonzero'] > 0)
+            else:
+                ok = ok & (count > 0)
+                if metric == 'sum':
+                    value = sums['sum']
+                elif metric == 'square_sum':
+                    value = sums['square_sum']
+                elif metric == 'average':
+                    value = sums['sum'] / count
+                elif metric == 'count_positives':
+                    value = sums['positives']
+                elif metric == 'count_negatives':
+                    value = sums['negatives']
+                else:
+                    average = sums['sum'] / count
+                    # rounding may give a tiny negative variance for a constant window
+                    value = np.maximum(sums['square_sum'] / count - average * average, 0)
+                    if metric == 'standard_deviation':
+                        value = np.sqrt(value)
+                    elif metric == 'standard_error':
+                        value = np.sqrt(value) / np.sqrt(count)
+            # Chloe writes an infinite SHEI when one class shares the window with cells of value 0
+            # (its evenness divides by ln(1)), nodata is written instead
+            return np.where(ok & np.isfinite(value), value, nodata)
+
+    @staticmethod
+    def run(properties, progress):
+        grid    = AsciiGrid(properties['input_ascii'])
+        nodata  = grid.nodata
+        sizes   = [int(size) for size in ChloeUtils.splitSizes(properties['window_sizes'].strip('{}'))]
+        metrics = SlidingEngine.splitList(properties['metrics'])
+        delta   = int(properties.get('delta_displacement', '1'))
+        minRate = 1 - float(properties.get('maximum_nodata_value_rate', '100')) / 100
+        filters   = [int(value) for value in SlidingEngine.splitList(properties.get('filters', ''))]
+        unfilters = [int(value) for value in SlidingEngine.splitList(properties.get('unfilters', ''))]
+
+        names = SlidingEngine.getNames(metrics, properties['input_ascii'])
+
+        shape = properties.get('shape', 'SQUARE')
+        windows = None
+        caches  = {}
+        if shape == 'FUNCTIONAL':
+            # the theoretical size of a functional window is its number of cells
+            friction = Friction(properties['friction'])
+            windows = dict((size, FunctionalWindow(friction, size, grid.cellsize)) for size in sizes)
+            caches = dict((size, FunctionalWindowCache.open(window, grid, properties['friction']))
+                          for size, window in windows.items())
+            theoretical = None
+        elif shape == 'CIRCLE':
+            getSums = SlidingEngine.getCircleSums
+            theoretical = dict((size, SlidingEngine.getDisk(size).sum()) for size in sizes)
+        else:
+            getSums = SlidingEngine.getSquareSums
+            theoretical = dict((size, size * size) for size in sizes)
+
+        f_csv, asciis = SlidingEngine.getOutputs(properties, grid, sizes, metrics, delta)
+        for f_out in [f_csv] + [f_asc for metric, size, f_asc in asciis]:
+            if f_out and os.path.dirname(f_out) and not os.path.isdir(os.path.dirname(f_out)):
+                os.makedirs(os.path.dirname(f_out))
+
+        def title(metric, size):
+            return metric if len(sizes) == 1 else 'w' + str(size) + '_' + metric
+
+        writers = [(metric, size, AsciiGridWriter(f_asc, grid, delta, nodata)) for metric, size, f_asc in asciis]
+        csv = CsvWriter(f_csv, grid, [title(metric, size) for metric in metrics for size in sizes], nodata) if f_csv else None
+
+        # Windows are computed on the cells whose row and column are multiples of delta
+        ys = np.arange(0, grid.nrows, delta)
+        xs = np.arange(0, grid.ncols, delta)
+        halo = max(window.radius for window in windows.values()) if windows else max(sizes) // 2
+        strip_rows = max(1, SlidingEngine.STRIP_CELLS // (grid.ncols * len(names)) // delta)
+        strip_rows = max(strip_rows, halo // delta + 1)   # not less rows than the halo, read twice
+        try:
+            for start in range(0, len(ys), strip_rows):
+                strip_ys = ys[start:start + strip_rows]
+                top      = max(0, strip_ys[0] - halo)
+                bottom   = min(grid.nrows, strip_ys[-1] + halo + 1)
+                values   = grid.readRows(top, bottom)
+                quantities = SlidingEngine.getQuantities(values, nodata, names)
+                if windows:
+                    sums_by_size = SlidingEngine.getFunctionalSums(
+                        quantities, windows, friction.getFrictions(values, nodata), (strip_ys - top)[:, None],
+                        xs[None, :], nodata, caches, top)
+                else:
+                    sums_by_size = getSums(quantities, sizes, (strip_ys - top)[:, None], xs[None, :])
+
+                # Filters on the value of the center of the window
+                centers  = np.trunc(values[np.ix_(strip_ys - top, xs)])
+                computed = ~np.in1d(centers, unfilters).reshape(centers.shape)
+                if filters:
+                    computed &= np.in1d(centers, filters).reshape(centers.shape)
+
+                columns = {}
+                for size in sizes:
+                    sums = sums_by_size[size]
+                    size_theoretical = sums['total'] if windows else theoretical[size]
+                    ok = computed & (sums['count'] / np.asarray(size_theoretical, dtype=np.float64) >= minRate)
+                    for metric in metrics:
+                        columns[title(metric, size)] = SlidingEngine.getMetric(
+                            metric, sums, ok, nodata, grid.cellsize, size_theoretical)
+
+                for metric, size, writer in writers:
+                    writer.writeRows(columns[title(metric, size)])
+                if csv is not None:
+                    csv.writeRows(strip_ys, xs, columns)
+                progress.setPercentage(int(100 * min(len(ys), start + strip_rows) / len(ys)))
+        finally:
+            for metric, size, writer in writers:
+                writer.close()
+            if csv is not None:
+                csv.close()
+            for cache in caches.values():
+                if cache is not None:
+                    cache.close()
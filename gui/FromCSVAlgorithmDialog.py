@@ -39,13 +39,15 @@ from processing.gui.InputLayerSelectorPanel import InputLayerSelectorPanel
 
 from .ChloeAlgorithmDialog import ChloeAlgorithmDialog
 from .ChloeAlgorithmDialog import ChloeParametersPanel
+from ..engine.csv_geometry import CsvGeometry
 
 from processing.core.outputs import OutputRaster, OutputVector, OutputTable
 
 from processing.tools import dataobjects
 
 
-from PyQt4.QtGui import QFileDialog
+from PyQt4.QtGui import QFileDialog, QMessageBox, QApplication, QCursor
+from PyQt4.QtCore import Qt
 try:
     from PyQt4.QtCore import QStringList
 except ImportError:
@@ -136,6 +138,13 @@ class FromCSVParametersPanel(ChloeParametersPanel):
 
         self.pbHeader.clicked.connect(self.uploadHeader)
 
+        pb = QPushButton(self.tr("Infer header from csv"))
+        self.layoutMain.insertWidget(5,pb)
+
+        self.pbInferHeader = pb
+
+        self.pbInferHeader.clicked.connect(self.inferHeader)
+
         self.connectParameterSignals()
         self.parametersHaveChanged()
     
@@ -172,6 +181,27 @@ class FromCSVParametersPanel(ChloeParametersPanel):
 
  	 
 
+    def inferHeader(self):
+        """Fill the grid parameters with the geometry of the X;Y of the input csv"""
+        f_input = self.alg.getParameterFromName("INPUT_FILE_CSV").value
+        if not f_input:
+            return
+
+        QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
+        try:
+            geometry = CsvGeometry.getGeometry(f_input)
+        except (IOError, OSError, ValueError) as e:
+            QApplication.restoreOverrideCursor()
+            QMessageBox.critical(self, self.tr('Unable to infer the header'), unicode(e))
+            return
+        QApplication.restoreOverrideCursor()
+
+        self.widgets["N_COLS"].spnValue.setValue(geometry['ncols'])
+        self.widgets["N_ROWS"].spnValue.setValue(geometry['nrows'])
+        self.widgets["XLL_CORNER"].spnValue.setValue(geometry['xllcorner'])
+        self.widgets["YLL_CORNER"].spnValue.setValue(geometry['yllcorner'])
+        self.widgets["CELL_SIZE"].spnValue.setValue(geometry['cellsize'])
+
     def connectParameterSignals(self):
         for w in self.widgets.values():
             if isinstance(w, QLineEdit):
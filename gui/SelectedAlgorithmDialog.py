@@ -155,6 +155,8 @@ class SelectedParametersPanel(ChloeParametersPanel):
                 w.hasChanged.connect(self.parametersHaveChanged)
             elif isinstance(w, FileSelectionPanel):
                 w.leText.textChanged.connect(self.parametersHaveChanged)
+            elif isinstance(w, InputLayerSelectorPanel) and w is not self.widgets["INPUT_LAYER_ASC"]:
+                w.cmbText.currentIndexChanged.connect(self.parametersHaveChanged)   # points layer
             elif isinstance(w, InputLayerSelectorPanel):
                 w.cmbText.currentIndexChanged.connect(self.initCalculateMetric)
                 w.cmbText.currentIndexChanged.connect(self.parametersHaveChanged)
@@ -214,9 +216,15 @@ class SelectedParametersPanel(ChloeParametersPanel):
         if index == 0:   # pixel(s) file
             self.widgets["PIXELS_FILE"].leText.setDisabled(False)
             self.widgets["POINTS_FILE"].leText.setDisabled(True)
+            self.widgets["POINTS_LAYER"].setDisabled(True)
         elif index == 1: # point(s) file
             self.widgets["PIXELS_FILE"].leText.setDisabled(True)
             self.widgets["POINTS_FILE"].leText.setDisabled(False)
+            self.widgets["POINTS_LAYER"].setDisabled(True)
+        elif index == 2: # point(s) layer
+            self.widgets["PIXELS_FILE"].leText.setDisabled(True)
+            self.widgets["POINTS_FILE"].leText.setDisabled(True)
+            self.widgets["POINTS_LAYER"].setDisabled(False)
 
 
     # === param:WINDOW_SHAPE Widget:ComboBox
@@ -0,0 +1,92 @@
+# coding=utf-8
+"""Tests of the Chloe results cache: key, hit, failed runs and eviction."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..ChloeCache import ChloeCache
+from .utilities import RecordingProgress
+
+
+class ChloeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='chloe_test')
+        self.cache_dir = self.path('cache')
+        self.getCacheDir = ChloeCache.__dict__['getCacheDir']
+        self.getCacheSize = ChloeCache.__dict__['getCacheSize']
+        ChloeCache.getCacheDir = staticmethod(lambda: self.cache_dir)
+        ChloeCache.getCacheSize = staticmethod(lambda: 1)
+        self.f_input = self.writeFile('in.asc', 'ncols 1\nnrows 1\n1\n')
+
+    def tearDown(self):
+        ChloeCache.getCacheDir = self.getCacheDir
+        ChloeCache.getCacheSize = self.getCacheSize
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def path(self, *names):
+        return os.path.join(self.folder, *names)
+
+    def writeFile(self, name, content):
+        with open(self.path(name), 'w') as fd:
+            fd.write(content)
+        return self.path(name)
+
+    def writeProperties(self, name, output, timestamp='2018-10-22 10:00:00', metrics='sum'):
+        return self.writeFile(name, '#{}\ntreatment=sliding\ninput_ascii={}\nmetrics={{{}}}\noutput_csv={}\n'.format(
+            timestamp, self.f_input, metrics, self.path(output)))
+
+    def runJob(self, f_properties, f_output, status=0):
+        """Run a fake job writing the output of a properties file and store it"""
+        cache = ChloeCache(f_properties)
+        if not cache.fetch(RecordingProgress()):
+            self.writeFile(f_output, 'X;Y;sum\n')
+            cache.store(RecordingProgress(), status)
+        return cache
+
+    def test_key(self):
+        key = ChloeCache(self.writeProperties('a.properties', 'a.csv')).key
+        # neither the timestamp line nor the outputs are part of the key
+        self.assertEqual(ChloeCache(self.writeProperties('b.properties', 'b.csv', '2019-01-01 00:00:00')).key, key)
+        self.assertNotEqual(ChloeCache(self.writeProperties('c.properties', 'a.csv', metrics='average')).key, key)
+        # the content of the inputs is
+        self.writeFile('in.asc', 'ncols 1\nnrows 1\n2\n')
+        self.assertNotEqual(ChloeCache(self.writeProperties('a.properties', 'a.csv')).key, key)
+
+    def test_hit(self):
+        self.runJob(self.writeProperties('a.properties', 'a.csv'), 'a.csv')
+        self.writeFile('a.csv', 'changed\n')
+
+        cache = ChloeCache(self.writeProperties('b.properties', 'b.csv'))
+        self.assertTrue(cache.fetch(RecordingProgress()))
+        with open(self.path('b.csv')) as fd:
+            self.assertEqual(fd.read(), 'X;Y;sum\n')
+
+    def test_failed_run(self):
+        cache = self.runJob(self.writeProperties('a.properties', 'a.csv'), 'a.csv', status=1)
+        self.assertFalse(os.path.isdir(cache.getEntryDir()))
+        self.assertFalse(ChloeCache(self.writeProperties('b.properties', 'b.csv')).fetch(RecordingProgress()))
+
+    def test_disabled(self):
+        ChloeCache.getCacheSize = staticmethod(lambda: 0)
+        cache = self.runJob(self.writeProperties('a.properties', 'a.csv'), 'a.csv')
+        self.assertIsNone(cache.key)
+        self.assertFalse(os.path.isdir(self.cache_dir))
+
+    def test_eviction(self):
+        entries = []
+        for i in range(3):
+            cache = self.runJob(self.writeProperties('a.properties', 'a.csv', metrics='m{}'.format(i)), 'a.csv')
+            entries.append(cache.getEntryDir())
+            os.utime(entries[-1], (1000 + i, 1000 + i))
+        # fetching an entry makes it the most recently used
+        self.assertTrue(ChloeCache(self.writeProperties('a.properties', 'a.csv', metrics='m0')).fetch(RecordingProgress()))
+
+        ChloeCache.evict(2 * ChloeCache.getDirSize(entries[0]))
+        self.assertEqual([os.path.isdir(entry) for entry in entries], [True, False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+# coding=utf-8
+"""Tests of the dispatch of the properties files to the native engines."""
+
+import os
+import unittest
+
+from ..ChloeEngine import ChloeEngine
+from .utilities import EngineTestCase, RecordingProgress
+
+
+class FailingEngine(object):
+    """Writes a part of its outputs then fails with the given exception"""
+
+    error = None
+
+    @staticmethod
+    def check(properties):
+        return None
+
+    @staticmethod
+    def run(properties, progress):
+        with open(properties['output_asc'], 'w') as fd:
+            fd.write('ncols 4\n')
+        raise FailingEngine.error
+
+
+class ChloeEngineTest(EngineTestCase):
+
+    def setUp(self):
+        EngineTestCase.setUp(self)
+        self.isEnabled = ChloeEngine.__dict__['isEnabled']
+        self.engines = ChloeEngine.ENGINES
+        ChloeEngine.isEnabled = staticmethod(lambda: True)
+        ChloeEngine.ENGINES = dict(self.engines, failing=FailingEngine)
+
+    def tearDown(self):
+        ChloeEngine.isEnabled = self.isEnabled
+        ChloeEngine.ENGINES = self.engines
+        EngineTestCase.tearDown(self)
+
+    def writeProperties(self, treatment, **properties):
+        with open(self.path('run.properties'), 'w') as fd:
+            fd.write('#2018-10-22 10:00:00\ntreatment={}\ninput_ascii={}\n'.format(treatment, self.f_input))
+            for key, value in sorted(properties.items()):
+                fd.write('{}={}\n'.format(key, value))
+        return self.path('run.properties')
+
+    def test_run(self):
+        f_properties = self.writeProperties('distance', output_asc=self.path('distance.asc'), distance_from='{3}')
+        self.assertTrue(ChloeEngine.run(f_properties, RecordingProgress()))
+        self.assertTrue(os.path.isfile(self.path('distance.asc')))
+
+    def test_unsupported(self):
+        # Chloe runs the treatments without engine and the options an engine does not support
+        progress = RecordingProgress()
+        f_properties = self.writeProperties('combine', output_asc=self.path('out.asc'))
+        self.assertFalse(ChloeEngine.run(f_properties, progress))
+        f_properties = self.writeProperties('sliding', output_folder=self.folder, window_sizes='{3}',
+                                            metrics='{sum}', shape='FUNCTIONAL', friction=self.path('none.asc'))
+        self.assertFalse(ChloeEngine.run(f_properties, progress))
+        self.assertEqual(sorted(os.listdir(self.folder)), ['in.asc', 'run.properties'])
+
+    def test_failure(self):
+        # the partial outputs are removed and Chloe is run, the other files of the folder are kept
+        f_properties = self.writeProperties('failing', output_asc=self.path('out.asc'))
+        for error in [IOError('disk full'), OSError('no space'), ValueError('bad record'), KeyError('x'), MemoryError()]:
+            FailingEngine.error = error
+            progress = RecordingProgress()
+            self.assertFalse(ChloeEngine.run(f_properties, progress))
+            self.assertEqual(sorted(os.listdir(self.folder)), ['in.asc', 'run.properties'])
+            self.assertTrue(progress.infos[-1].endswith('running Chloe'))
+
+
+if __name__ == '__main__':
+    unittest.main()
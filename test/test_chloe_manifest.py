@@ -0,0 +1,85 @@
+# coding=utf-8
+"""Tests of the run manifest of the incremental multi sizes runs."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..ChloeManifest import ChloeManifest
+
+
+class ChloeManifestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='chloe_test')
+        os.makedirs(self.path('out'))
+        self.f_input = self.writeFile('in.asc', 'ncols 1\nnrows 1\n1\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def path(self, *names):
+        return os.path.join(self.folder, *names)
+
+    def writeFile(self, name, content):
+        with open(self.path(name), 'w') as fd:
+            fd.write(content)
+        return self.path(name)
+
+    def getManifest(self, window_sizes='3;5', metrics='sum;average', shape='SQUARE'):
+        f_properties = self.writeFile('run.properties', (
+            '#2018-10-22 10:00:00\ntreatment=sliding\ninput_ascii={}\noutput_folder={}\n'
+            'window_sizes={{{}}}\nmetrics={{{}}}\nshape={}\n').format(
+                self.f_input, self.path('out'), window_sizes, metrics, shape))
+        return ChloeManifest(f_properties)
+
+    def test_resume(self):
+        metrics = ['sum', 'average']
+        manifest = self.getManifest()
+        self.assertEqual(manifest.getMissingMetrics('3', metrics), metrics)
+
+        self.writeFile(os.path.join('out', 'in_sq_w3_sum.asc'), '1\n')
+        self.writeFile(os.path.join('out', 'in_sq_w3_sum.prj'), 'PROJCS\n')
+        self.writeFile(os.path.join('out', 'in_sq_w5_sum.asc'), '1\n')
+        manifest.setDone('3', ['sum'])
+        self.assertEqual(sorted(manifest.sizes['3']['files']), ['in_sq_w3_sum.asc'])
+
+        # a run of other sizes and metrics resumes from the saved manifest
+        manifest = self.getManifest('3', 'sum;average;Nclass')
+        self.assertEqual(manifest.getMissingMetrics('3', metrics), ['average'])
+        self.assertEqual(manifest.getMissingMetrics('5', metrics), metrics)
+
+        # the projection files are rewritten after every run, they are not checked
+        self.writeFile(os.path.join('out', 'in_sq_w3_sum.prj'), 'GEOGCS\n')
+        self.assertTrue(manifest.isValid('3'))
+
+    def test_changed(self):
+        self.writeFile(os.path.join('out', 'in_sq_w3_sum.asc'), '1\n')
+        self.getManifest().setDone('3', ['sum'])
+
+        # another treatment (or input) does not resume
+        self.assertEqual(self.getManifest(shape='CIRCLE').getMissingMetrics('3', ['sum']), ['sum'])
+        # an output overwritten since the run is computed again
+        self.writeFile(os.path.join('out', 'in_sq_w3_sum.asc'), '22\n')
+        manifest = self.getManifest()
+        self.assertFalse(manifest.isValid('3'))
+        self.assertEqual(manifest.getMissingMetrics('3', ['sum']), ['sum'])
+
+    def test_merge_csv(self):
+        f_previous = self.writeFile('previous.csv', 'X;Y;sum\n5.0;5.0;4\n15.0;5.0;6\n')
+        f_csv = self.writeFile('in.csv', 'X;Y;average\n5.0;5.0;1\n15.0;5.0;1.5\n')
+        self.assertTrue(ChloeManifest.mergeCsv(f_previous, f_csv))
+        with open(f_csv) as fd:
+            self.assertEqual(fd.read(), 'X;Y;average;sum\n5.0;5.0;1;4\n15.0;5.0;1.5;6\n')
+
+    def test_merge_csv_mismatch(self):
+        f_previous = self.writeFile('previous.csv', 'X;Y;sum\n5.0;5.0;4\n15.0;15.0;6\n')
+        f_csv = self.writeFile('in.csv', 'X;Y;average\n5.0;5.0;1\n15.0;5.0;1.5\n')
+        self.assertFalse(ChloeManifest.mergeCsv(f_previous, f_csv))
+        with open(f_csv) as fd:
+            self.assertEqual(fd.read(), 'X;Y;average\n5.0;5.0;1\n15.0;5.0;1.5\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
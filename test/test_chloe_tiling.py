@@ -0,0 +1,120 @@
+# coding=utf-8
+"""Tests of the tiled sliding runs: the mosaic of the tiles is the output of the whole grid."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..ChloeTiling import ChloeTiling
+from ..engine.sliding_engine import SlidingEngine
+from .utilities import RecordingProgress
+
+HEADER = ['ncols 4', 'nrows 7', 'xllcorner 100.0', 'yllcorner 200.0', 'cellsize 10.0', 'NODATA_value -1']
+
+INPUT = ['1 1 2 2',
+         '1 3 2 2',
+         '3 3 -1 2',
+         '3 1 3 2',
+         '2 2 1 1',
+         '-1 2 3 1',
+         '1 1 1 3']
+
+
+class ChloeTilingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='chloe_test')
+        self.f_input = self.path('in.asc')
+        with open(self.f_input, 'w') as fd:
+            fd.write('\n'.join(HEADER + INPUT) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def path(self, *names):
+        return os.path.join(self.folder, *names)
+
+    def read(self, f_name):
+        with open(f_name) as fd:
+            return fd.read()
+
+    def test_tiles(self):
+        self.assertEqual(ChloeTiling.getTiles(7, 3, 1), [(0, 0, 3, 4), (2, 3, 6, 7), (5, 6, 7, 7)])
+        self.assertEqual(ChloeTiling.getTiles(6, 3, 0), [(0, 0, 3, 3), (3, 3, 6, 6)])
+
+    def test_split_merge(self):
+        tiles = ChloeTiling.getTiles(7, 3, 2)
+        f_tiles = [self.path('tile_{}.asc'.format(i)) for i in range(len(tiles))]
+        ChloeTiling.splitAscii(self.f_input, tiles, f_tiles)
+
+        # each tile holds its halo rows, at its own place
+        header, header_lines, rows = ChloeTiling.readAscii(f_tiles[1])
+        self.assertEqual(list(rows), INPUT[1:7])
+        self.assertEqual((header['nrows'], header['yllcorner']), ('6', '200.0'))
+        header, header_lines, rows = ChloeTiling.readAscii(f_tiles[0])
+        self.assertEqual((header['nrows'], header['yllcorner']), ('5', '220.0'))
+
+        f_out = self.path('out.asc')
+        ChloeTiling.mergeAscii(f_tiles, tiles, f_out)
+        self.assertEqual(self.read(f_out), self.read(self.f_input))
+
+    def test_wrapped_rows(self):
+        # the rows of a grid may be wrapped on several lines
+        with open(self.f_input, 'w') as fd:
+            fd.write('\n'.join(HEADER) + '\n' + '\n'.join(' '.join(INPUT).split()) + '\n')
+        header, header_lines, rows = ChloeTiling.readAscii(self.f_input)
+        self.assertEqual(list(rows), INPUT)
+
+    def test_merge_csv(self):
+        tiles = ChloeTiling.getTiles(4, 2, 1)
+        f_tiles = []
+        for i, ys in enumerate([[35.0, 25.0, 15.0], [25.0, 15.0, 5.0]]):
+            f_tiles.append(self.path('tile_{}.csv'.format(i)))
+            with open(f_tiles[-1], 'w') as fd:
+                fd.write('X;Y;sum\n')
+                for y in ys:
+                    fd.write('5.0;{};{}\n'.format(y, i))
+        f_out = self.path('out.csv')
+        ChloeTiling.mergeCsv(f_tiles, tiles, 40.0, 10.0, f_out)
+        # the halo lines are dropped, each row comes from its own tile
+        self.assertEqual(self.read(f_out), 'X;Y;sum\n5.0;35.0;0\n5.0;25.0;0\n5.0;15.0;1\n5.0;5.0;1\n')
+
+    def runSliding(self, f_input, out_dir):
+        SlidingEngine.run({
+            'treatment': 'sliding', 'input_ascii': f_input, 'output_folder': out_dir,
+            'window_sizes': '{3;5}', 'metrics': '{N-valid;sum;Nclass}', 'shape': 'SQUARE',
+            'export_csv': 'true', 'export_ascii': 'true'}, RecordingProgress())
+
+    def test_mosaic(self):
+        os.makedirs(self.path('whole'))
+        self.runSliding(self.f_input, self.path('whole'))
+
+        # halo of max(window_sizes) // 2 rows
+        tiles = ChloeTiling.getTiles(7, 3, 2)
+        out_dirs = []
+        f_inputs = []
+        for i in range(len(tiles)):
+            out_dirs.append(self.path('tile_{}'.format(i)))
+            os.makedirs(out_dirs[-1])
+            f_inputs.append(self.path('tile_{}'.format(i), 'in.asc'))
+        ChloeTiling.splitAscii(self.f_input, tiles, f_inputs)
+        for f_input, out_dir in zip(f_inputs, out_dirs):
+            self.runSliding(f_input, out_dir)
+
+        # merged as runTiled does
+        top = ChloeTiling.getTop({'nrows': '7', 'yllcorner': '200.0', 'cellsize': '10.0'})
+        for name in sorted(os.listdir(self.path('whole'))):
+            f_tiles = [os.path.join(out_dir, name) for out_dir in out_dirs]
+            f_out = self.path(name)
+            ext = os.path.splitext(name)[1]
+            if ext == '.asc':
+                ChloeTiling.mergeAscii(f_tiles, tiles, f_out)
+            elif ext == '.csv':
+                ChloeTiling.mergeCsv(f_tiles, tiles, top, 10.0, f_out)
+            else:
+                shutil.copyfile(f_tiles[0], f_out)
+            self.assertEqual(self.read(f_out), self.read(self.path('whole', name)), name)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# coding=utf-8
+"""Tests of the Chloe runners of ChloeUtils, with scripts standing for Chloe."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from ..ChloeWorker import ChloeWorker
+from ..ChloeUtils import ChloeUtils
+from .utilities import RecordingProgress
+
+# Runs a properties file as Chloe would: writes its output_asc and exits with its status.
+# A job with crash=true kills the worker.
+FAKE_JOB = '''
+def runJob(f_properties):
+    properties = dict(line.strip().split('=', 1) for line in open(f_properties) if '=' in line)
+    if properties.get('crash') == 'true':
+        sys.exit(3)
+    with open(properties['output_asc'], 'w') as fd:
+        fd.write('done\\n')
+    return int(properties.get('status', '0'))
+'''
+
+FAKE_CHLOE = 'import sys\n' + FAKE_JOB + '''
+sys.exit(runJob(sys.argv[-1]))
+'''
+
+FAKE_WORKER = 'import sys\n' + FAKE_JOB + '''
+sys.stdout.write('##worker ready\\n')
+sys.stdout.flush()
+for line in iter(sys.stdin.readline, ''):
+    if line.strip() == '##quit':
+        break
+    status = runJob(line.strip())
+    sys.stdout.write('##100/100\\n##worker done {}\\n'.format(status))
+    sys.stdout.flush()
+'''
+
+
+class ChloeRunnerTestCase(unittest.TestCase):
+    """Runs the fake Chloe and worker scripts instead of the JVM"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='chloe_test')
+        f_chloe = self.writeScript('chloe.py', FAKE_CHLOE)
+        f_worker = self.writeScript('worker.py', FAKE_WORKER)
+
+        self.getJavaCommands = ChloeUtils.__dict__['getJavaCommands']
+        self.getWorkerCommands = ChloeWorker.__dict__['getCommands']
+        ChloeUtils.getJavaCommands = staticmethod(
+            lambda f_properties: [sys.executable, f_chloe, '"' + f_properties + '"'])
+        ChloeWorker.getCommands = lambda worker: [sys.executable, f_worker]
+
+    def tearDown(self):
+        ChloeUtils.getJavaCommands = self.getJavaCommands
+        ChloeWorker.getCommands = self.getWorkerCommands
+        ChloeWorker.stopInstance()
+        ChloeWorker._disabled = False
+        ChloeUtils.batchJobs = None
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def writeScript(self, name, script):
+        f_script = os.path.join(self.folder, name)
+        with open(f_script, 'w') as fd:
+            fd.write(script)
+        return f_script
+
+    def writeJob(self, name, status=0, crash=False):
+        """Write a properties file, return it and its output"""
+        f_properties = os.path.join(self.folder, name + '.properties')
+        f_output = os.path.join(self.folder, name + '.asc')
+        with open(f_properties, 'w') as fd:
+            fd.write('output_asc={}\nstatus={}\n'.format(f_output, status))
+            if crash:
+                fd.write('crash=true\n')
+        return f_properties, f_output
+
+
+class RunCholeBatchTest(ChloeRunnerTestCase):
+
+    def test_statuses(self):
+        jobs = [self.writeJob('a'), self.writeJob('b', status=2), self.writeJob('c')]
+        done = []
+        statuses = ChloeUtils.runCholeBatch([f_properties for f_properties, f_output in jobs],
+                                            RecordingProgress(), lambda index, status: done.append((index, status)))
+        self.assertEqual(statuses, [0, 2, 0])
+        self.assertEqual(done, [(0, 0), (1, 2), (2, 0)])
+        self.assertTrue(all(os.path.isfile(f_output) for f_properties, f_output in jobs))
+
+    def test_worker_died(self):
+        # the job killing the worker and the next ones are run in new processes
+        jobs = [self.writeJob('a'), self.writeJob('b', crash=True), self.writeJob('c', status=1)]
+        progress = RecordingProgress()
+        statuses = ChloeUtils.runCholeBatch([f_properties for f_properties, f_output in jobs], progress)
+        self.assertEqual(statuses, [0, 3, 1])
+        self.assertTrue(any('Running the remaining Chloe jobs in new processes' in info for info in progress.infos))
+
+    def test_no_worker(self):
+        with open(os.path.join(self.folder, 'worker.py'), 'w') as fd:
+            fd.write('import sys\nsys.exit(1)\n')
+        jobs = [self.writeJob('a'), self.writeJob('b', status=4)]
+        statuses = ChloeUtils.runCholeBatch([f_properties for f_properties, f_output in jobs], RecordingProgress())
+        self.assertEqual(statuses, [0, 4])
+
+
+class RunCholeParallelTest(ChloeRunnerTestCase):
+
+    def test_statuses(self):
+        jobs = [self.writeJob(name, status) for name, status in [('a', 0), ('b', 5), ('c', 0), ('d', 1)]]
+        done = []
+        progress = RecordingProgress()
+        statuses = ChloeUtils.runCholeParallel([f_properties for f_properties, f_output in jobs],
+                                               progress, 2, lambda index, status: done.append((index, status)))
+        # the statuses are in the order of the jobs whatever the order they finished in
+        self.assertEqual(statuses, [0, 5, 0, 1])
+        self.assertEqual(sorted(done), [(0, 0), (1, 5), (2, 0), (3, 1)])
+        self.assertTrue(all(os.path.isfile(f_output) for f_properties, f_output in jobs))
+        self.assertEqual(progress.percentages[-1], 100)
+
+    def test_crash(self):
+        jobs = [self.writeJob('a', crash=True), self.writeJob('b')]
+        statuses = ChloeUtils.runCholeParallel([f_properties for f_properties, f_output in jobs], RecordingProgress(), 2)
+        self.assertEqual(statuses, [3, 0])
+
+
+class ChloeBatchTest(ChloeRunnerTestCase):
+
+    def test_queue(self):
+        f_properties, f_output = self.writeJob('a')
+        done = []
+        ChloeUtils.startBatch()
+        self.assertFalse(ChloeUtils.runChole(ChloeUtils.getJavaCommands(f_properties), RecordingProgress(), done.append))
+        # nothing runs before endBatch, the algorithm may rewrite its properties file
+        self.assertEqual(done, [])
+        self.assertFalse(os.path.isfile(f_output))
+        with open(f_properties, 'w') as fd:
+            fd.write('rewritten\n')
+        ChloeUtils.endBatch(RecordingProgress())
+        self.assertEqual(done, [0])
+        self.assertTrue(os.path.isfile(f_output))
+
+    def test_end_batch(self):
+        jobs = [self.writeJob('a'), self.writeJob('b', status=2)]
+        done = {}
+        ChloeUtils.startBatch()
+        for f_properties, f_output in jobs:
+            def jobDone(status, f_output=f_output):
+                # the outputs exist when the job is post-processed
+                done[f_output] = (status, os.path.isfile(f_output))
+            ChloeUtils.runChole(ChloeUtils.getJavaCommands(f_properties), RecordingProgress(), jobDone)
+        f_copies = [f_job for f_properties, f_job, jobDone in ChloeUtils.batchJobs]
+
+        results = ChloeUtils.endBatch(RecordingProgress())
+        self.assertEqual(results, [(jobs[0][0], 0), (jobs[1][0], 2)])
+        self.assertEqual(done, {jobs[0][1]: (0, True), jobs[1][1]: (2, True)})
+        # the copies of the properties files are removed
+        self.assertFalse(any(os.path.isfile(f_job) for f_job in f_copies))
+        self.assertFalse(ChloeUtils.isBatchStarted())
+
+    def test_run(self):
+        # out of a batch the job is run before runChole returns
+        f_properties, f_output = self.writeJob('a', status=1)
+        done = []
+        self.assertTrue(ChloeUtils.runChole(ChloeUtils.getJavaCommands(f_properties), RecordingProgress(), done.append))
+        self.assertEqual(done, [1])
+        self.assertTrue(os.path.isfile(f_output))
+
+
+if __name__ == '__main__':
+    unittest.main()
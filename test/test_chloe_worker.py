@@ -0,0 +1,100 @@
+# coding=utf-8
+"""Tests of the Chloe worker protocol, with a script standing for the worker JVM."""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from ..ChloeWorker import ChloeWorker, ChloeWorkerError
+from ..ChloeUtils import ChloeUtils
+from .utilities import RecordingProgress
+
+# Answers a job as Chloe2012/worker/ChloeWorker.java does: its console output then
+# '##worker done <status>'. A job named fail fails, a job named crash kills the worker.
+FAKE_WORKER = '''
+import sys
+sys.stdout.write('starting\\n##worker ready\\n')
+sys.stdout.flush()
+for line in iter(sys.stdin.readline, ''):
+    job = line.strip()
+    if job == '##quit':
+        break
+    if job.endswith('crash.properties'):
+        sys.exit(1)
+    sys.stdout.write('running ' + job + '\\n##50/100\\n\\n')
+    sys.stdout.write('##worker done {}\\n'.format(1 if job.endswith('fail.properties') else 0))
+    sys.stdout.flush()
+'''
+
+
+class FakeWorker(ChloeWorker):
+
+    def __init__(self, f_script):
+        ChloeWorker.__init__(self)
+        self.f_script = f_script
+
+    def getCommands(self):
+        return [sys.executable, self.f_script]
+
+
+class ChloeWorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='chloe_test')
+        self.f_script = os.path.join(self.folder, 'worker.py')
+        with open(self.f_script, 'w') as fd:
+            fd.write(FAKE_WORKER)
+        self.worker = FakeWorker(self.f_script)
+        self.worker.cwd = self.folder
+
+    def tearDown(self):
+        self.worker.stop()
+        ChloeWorker._disabled = False
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_jobs(self):
+        lines = []
+        self.assertEqual(self.worker.run('a.properties', lines.append), 0)
+        self.assertEqual(self.worker.run('fail.properties', lines.append), 1)
+        # one JVM for both jobs, the empty lines are dropped
+        self.assertTrue(self.worker.isAlive())
+        self.assertEqual(lines, ['running a.properties', '##50/100', 'running fail.properties', '##50/100'])
+
+    def test_died(self):
+        self.assertRaises(ChloeWorkerError, self.worker.run, 'crash.properties', lambda line: None)
+        self.assertFalse(self.worker.isAlive())
+        # the next job starts a new JVM
+        self.assertEqual(self.worker.run('a.properties', lambda line: None), 0)
+
+    def test_start_failure(self):
+        with open(self.f_script, 'w') as fd:
+            fd.write('import sys\nsys.stdout.write("Error: UnsupportedClassVersionError\\n")\n')
+        self.assertRaises(ChloeWorkerError, self.worker.run, 'a.properties', lambda line: None)
+        # not retried for the session
+        self.assertTrue(ChloeWorker._disabled)
+        self.assertRaises(ChloeWorkerError, ChloeWorker.getInstance)
+
+    def test_stop(self):
+        self.worker.run('a.properties', lambda line: None)
+        process = self.worker.process
+        self.worker.stop()
+        self.assertEqual(process.wait(), 0)
+        self.assertFalse(self.worker.isAlive())
+
+
+class HandleOutputLineTest(unittest.TestCase):
+
+    def test_lines(self):
+        progress = RecordingProgress()
+        loglines = []
+        for line in ['##12/100', 'Chloe 4.0', ' ## 100 / 100 ']:
+            ChloeUtils.handleOutputLine(line, progress, loglines)
+        self.assertEqual(progress.percentages, [12, 100])
+        self.assertEqual(progress.console, ['Chloe 4.0'])
+        self.assertEqual(loglines, ['##12/100', 'Chloe 4.0', ' ## 100 / 100 '])
+
+
+if __name__ == '__main__':
+    unittest.main()
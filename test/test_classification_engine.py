@@ -0,0 +1,21 @@
+# coding=utf-8
+"""Tests of the native classification engine."""
+
+import unittest
+
+from ..engine.classification_engine import ClassificationEngine
+from .utilities import EngineTestCase
+
+
+class ClassificationEngineTest(EngineTestCase):
+
+    def test_classification(self):
+        self.runEngine(ClassificationEngine, {
+            'treatment': 'classification', 'input_ascii': self.f_input, 'output_asc': self.path('classes.asc'),
+            'domains': '{([1,2]-10);(]2,3]-20)}'})
+        self.assertAscii('classes.asc', ['10.0 10.0 10.0 10.0 ', '10.0 10.0 10.0 10.0 ',
+                                         '20.0 20.0 -1.0 10.0 ', '20.0 20.0 20.0 10.0 '])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+# coding=utf-8
+"""Tests of the native cluster engine."""
+
+import unittest
+
+from ..engine.cluster_engine import ClusterEngine
+from .utilities import EngineTestCase
+
+
+class ClusterEngineTest(EngineTestCase):
+
+    def test_rook(self):
+        self.runEngine(ClusterEngine, {
+            'treatment': 'cluster', 'input_ascii': self.f_input, 'output_asc': self.path('cluster.asc'),
+            'cluster': '{2}', 'cluster_type': 'rook'})
+        self.assertAscii('cluster.asc', ['0.0 0.0 1.0 1.0 ', '0.0 0.0 1.0 1.0 ',
+                                         '0.0 0.0 -1.0 1.0 ', '0.0 0.0 0.0 1.0 '])
+        self.assertText('cluster.csv', ['id;type;count;area', '1;2;6;600.0'])
+
+    def test_queen(self):
+        self.runEngine(ClusterEngine, {
+            'treatment': 'cluster', 'input_ascii': self.f_input, 'output_asc': self.path('cluster.asc'),
+            'cluster': '{1;3}', 'cluster_type': 'queen'})
+        # the classes touch diagonally, their cells are in different clusters
+        self.assertAscii('cluster.asc', ['1.0 1.0 0.0 0.0 ', '1.0 1.0 0.0 0.0 ',
+                                         '2.0 2.0 -1.0 0.0 ', '2.0 2.0 2.0 0.0 '])
+        self.assertText('cluster.csv', ['id;type;count;area', '1;1;4;400.0', '2;3;5;500.0'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# coding=utf-8
+"""Tests of the grid geometry of the X;Y of a csv, and of its persistence in the Chloe cache."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..ChloeCache import ChloeCache
+from ..engine.csv_geometry import CsvGeometry
+
+
+class CsvGeometryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='chloe_test')
+        self.cache_dir = os.path.join(self.folder, 'cache')
+        self.getCacheDir = ChloeCache.__dict__['getCacheDir']
+        self.getCacheSize = ChloeCache.__dict__['getCacheSize']
+        ChloeCache.getCacheDir = staticmethod(lambda: self.cache_dir)
+        ChloeCache.getCacheSize = staticmethod(lambda: 1)
+        CsvGeometry._geometries = None
+        self.f_csv = os.path.join(self.folder, 'in.csv')
+        with open(self.f_csv, 'w') as fd:
+            # cell centers of a 4x3 grid of cellsize 10, some cells missing
+            fd.write('X;Y;sum\n105.0;225.0;1\n125.0;225.0;2\n135.0;205.0;3\n115.0;215.0;4\n')
+
+    def tearDown(self):
+        ChloeCache.getCacheDir = self.getCacheDir
+        ChloeCache.getCacheSize = self.getCacheSize
+        CsvGeometry._geometries = None
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_geometry(self):
+        self.assertEqual(CsvGeometry.getGeometry(self.f_csv), {
+            'ncols': 4, 'nrows': 3, 'xllcorner': 100.0, 'yllcorner': 200.0, 'cellsize': 10.0})
+
+    def test_no_xy(self):
+        with open(self.f_csv, 'w') as fd:
+            fd.write('A;B\n1;2\n')
+        self.assertRaises(ValueError, CsvGeometry.getGeometry, self.f_csv)
+
+    def test_saved(self):
+        geometry = CsvGeometry.getGeometry(self.f_csv)
+        self.assertTrue(os.path.isfile(os.path.join(self.cache_dir, CsvGeometry.FILE)))
+        # a new session reads the geometry from the cache directory
+        CsvGeometry._geometries = None
+        compute = CsvGeometry.__dict__['compute']
+        CsvGeometry.compute = staticmethod(lambda f_csv: self.fail('computed again'))
+        try:
+            self.assertEqual(CsvGeometry.getGeometry(self.f_csv), geometry)
+        finally:
+            CsvGeometry.compute = compute
+
+    def test_disabled(self):
+        ChloeCache.getCacheSize = staticmethod(lambda: 0)
+        geometry = CsvGeometry.getGeometry(self.f_csv)
+        self.assertEqual(geometry['ncols'], 4)
+        # kept in memory only
+        self.assertFalse(os.path.exists(self.cache_dir))
+        self.assertIn(CsvGeometry.getKey(self.f_csv), CsvGeometry._geometries)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+# coding=utf-8
+"""Tests of the native distance engine."""
+
+import unittest
+
+from ..engine.distance_engine import DistanceEngine
+from .utilities import EngineTestCase
+
+
+class DistanceEngineTest(EngineTestCase):
+
+    def test_distance(self):
+        self.runEngine(DistanceEngine, {
+            'treatment': 'distance', 'input_ascii': self.f_input, 'output_asc': self.path('distance.asc'),
+            'distance_from': '{3}'})
+        # chamfer distance of Chloe, the moves weigh 17, 24 and 38 for a cellsize of 17
+        self.assertAscii('distance.asc', [
+            '20.0 20.0 22.352941176470587 28.23529411764706 ',
+            '10.0 10.0 14.11764705882353 22.352941176470587 ',
+            '0.0 0.0 -1.0 14.11764705882353 ',
+            '0.0 0.0 0.0 10.0 '])
+
+
+if __name__ == '__main__':
+    unittest.main()
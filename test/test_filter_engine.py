@@ -0,0 +1,22 @@
+# coding=utf-8
+"""Tests of the native filter engine."""
+
+import unittest
+
+from ..engine.filter_engine import FilterEngine
+from .utilities import HEADER, EngineTestCase
+
+
+class FilterEngineTest(EngineTestCase):
+
+    def test_filter(self):
+        f_filter = self.writeAscii('filter.asc', HEADER, ['0 0 0 0', '5 5 -1 -1', '0 0 0 0', '6 -1 6 -1'])
+        self.runEngine(FilterEngine, {
+            'treatment': 'filter', 'input_ascii': self.f_input, 'ascii_filter': f_filter,
+            'filter_values': '{5;6}', 'output_asc': self.path('filtered.asc')})
+        self.assertAscii('filtered.asc', ['0.0 0.0 0.0 0.0 ', '1.0 1.0 0.0 0.0 ',
+                                          '0.0 0.0 0.0 0.0 ', '3.0 0.0 3.0 0.0 '])
+
+
+if __name__ == '__main__':
+    unittest.main()
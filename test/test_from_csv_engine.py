@@ -0,0 +1,36 @@
+# coding=utf-8
+"""Tests of the native from csv engine."""
+
+import os
+import unittest
+
+from ..engine.from_csv_engine import FromCsvEngine
+from .utilities import EngineTestCase, RecordingProgress
+
+
+class FromCsvEngineTest(EngineTestCase):
+
+    def test_from_csv(self):
+        with open(self.path('points.csv'), 'w') as fd:
+            fd.write('X;Y;a;b\n5.0;35.0;1;x\n25.0;35.0;2;y\n15.0;15.0;3;z\n')
+        self.runEngine(FromCsvEngine, {
+            'treatment': 'from csv', 'input_csv': self.path('points.csv'), 'output_folder': self.folder,
+            'variables': '{a;b}', 'ncols': '4', 'nrows': '4', 'xllcorner': '0.0', 'yllcorner': '0.0',
+            'cellsize': '10.0', 'nodata_value': '-1'})
+        self.assertAscii('points_a.asc', ['1 -1 2 -1 ', '-1 -1 -1 -1 ', '-1 3 -1 -1 ', '-1 -1 -1 -1 '])
+        self.assertAscii('points_b.asc', ['x -1 y -1 ', '-1 -1 -1 -1 ', '-1 z -1 -1 ', '-1 -1 -1 -1 '])
+
+    def test_bad_record(self):
+        with open(self.path('points.csv'), 'w') as fd:
+            fd.write('X;Y;a\n5.0;35.0;1\nabc;35.0;2\n')
+        properties = {
+            'treatment': 'from csv', 'input_csv': self.path('points.csv'), 'output_asc': self.path('points.asc'),
+            'variables': '{a}', 'ncols': '4', 'nrows': '4', 'xllcorner': '0.0', 'yllcorner': '0.0',
+            'cellsize': '10.0', 'nodata_value': '-1'}
+        self.assertIsNone(FromCsvEngine.check(properties))
+        self.assertRaises(ValueError, FromCsvEngine.run, properties, RecordingProgress())
+        self.assertFalse(os.path.exists(self.path('points.asc')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# coding=utf-8
+"""Tests of the native from shapefile treatment: rasterization of the polygons of a shapefile."""
+
+import os
+import unittest
+
+from ..engine.from_shapefile_engine import FromShapefileEngine, Shapes
+from .utilities import DATA_DIR, EngineTestCase
+
+SQUARES_HEADER = ['ncols 4', 'nrows 2', 'xllcorner 0.0', 'yllcorner 0.0', 'cellsize 10.0', 'NODATA_value -1']
+
+
+class FromShapefileEngineTest(EngineTestCase):
+
+    def test_from_shapefile(self):
+        # squares.shp: code 1 on [0,20]x[0,20], code 2 on [20,40]x[0,10]
+        self.runEngine(FromShapefileEngine, {
+            'treatment': 'from shapefile', 'input_shapefile': os.path.join(DATA_DIR, 'squares.shp'),
+            'attribute': 'code', 'cellsizes': '{10.0}', 'output_asc': self.path('squares.asc')})
+        self.assertAscii('squares.asc', ['1 1 -1 -1 ', '1 1 2 2 '], SQUARES_HEADER)
+
+    def test_lookup(self):
+        # the values missing from the lookup table keep their text
+        with open(self.path('lookup.csv'), 'w') as fd:
+            fd.write('code;value\n1;7\n3;7\n')
+        self.runEngine(FromShapefileEngine, {
+            'treatment': 'from shapefile', 'input_shapefile': os.path.join(DATA_DIR, 'squares.shp'),
+            'attribute': 'code', 'lookup_table': self.path('lookup.csv'), 'cellsizes': '{10.0}',
+            'output_asc': self.path('squares.asc')})
+        self.assertAscii('squares.asc', ['7 7 -1 -1 ', '7 7 2 2 '], SQUARES_HEADER)
+
+    def test_join(self):
+        # the values with the same text in the lookup table share the index of their text
+        texts, table = Shapes.join({1: 0, 2: 1, 3: 2, None: 3}, True, {'1': '7', '3': '7'})
+        self.assertEqual(texts, ['7', '2', 'null'])
+        self.assertEqual(list(table), [0, 1, 0, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
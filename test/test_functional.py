@@ -0,0 +1,121 @@
+# coding=utf-8
+"""Tests of the functional windows: frictions, diffusion of Chloe and sliding engine."""
+
+import os
+import unittest
+
+import numpy as np
+
+from ..ChloeCache import ChloeCache
+from ..engine.functional import Friction, FunctionalWindow, FunctionalWindowCache
+from ..engine.raster_io import AsciiGrid
+from ..engine.sliding_engine import SlidingEngine
+from .utilities import EngineTestCase
+
+
+class FunctionalTestCase(EngineTestCase):
+
+    def setUp(self):
+        EngineTestCase.setUp(self)
+        # the cells of class 3 cost three times more to cross
+        self.f_friction = self.path('friction.csv')
+        with open(self.f_friction, 'w') as fd:
+            fd.write('code;friction\n1;1\n2;1\n3;3\n')
+
+
+class FunctionalWindowTest(FunctionalTestCase):
+
+    def test_friction(self):
+        friction = Friction(self.f_friction)
+        self.assertEqual(friction.getFrictions(np.array([1.0, 3.0, -1.0, 4.0]), -1).tolist(), [1.0, 3.0, -1.0, -1.0])
+        self.assertEqual(friction.getUnknown(np.array([1.0, 4.0, -1.0]), -1).tolist(), [4.0])
+
+    def test_masks(self):
+        window = FunctionalWindow(Friction(self.f_friction), 3, 10.0)
+        self.assertEqual((window.distance, window.diameter), (15.0, 3))
+        # distance 15: a move costs 10 (14.1 on a diagonal) between cells of friction 1,
+        # 20 (28.3) to or from a cell of friction 3, the nodata cells are never reached
+        masks = window.getMasks(np.array([[[1, 1, 1], [1, 1, 1], [1, 1, 1]],
+                                          [[1, 3, 1], [1, 1, 3], [-1, 1, 1]],
+                                          [[1, 1, 1], [1, 3, 1], [1, 1, 1]]], dtype=np.float64), -1)
+        self.assertEqual(masks.astype(int).tolist(), [
+            [[1, 1, 1], [1, 1, 1], [1, 1, 1]],
+            [[1, 0, 1], [1, 1, 0], [0, 1, 1]],
+            [[0, 0, 0], [0, 1, 0], [0, 0, 0]]])
+
+
+class FunctionalSlidingTest(FunctionalTestCase):
+
+    def test_sliding(self):
+        self.runEngine(SlidingEngine, {
+            'treatment': 'sliding', 'input_ascii': self.f_input, 'output_folder': self.folder,
+            'window_sizes': '{3}', 'metrics': '{N-valid}', 'shape': 'FUNCTIONAL', 'friction': self.f_friction,
+            'export_csv': 'false', 'export_ascii': 'true'})
+        # the windows of the classes 1 and 2 are their neighbours of class 1 or 2,
+        # the ones of the class 3 are their center only
+        self.assertAscii('in_fn_w3_N-valid_d_1.asc', ['4 6 6 4', '4 6 7 5', '1 1 0 4', '1 1 1 2'])
+
+    def test_unknown_code(self):
+        with open(self.f_friction, 'w') as fd:
+            fd.write('code;friction\n1;1\n2;1\n')
+        self.assertIsNotNone(SlidingEngine.check({
+            'treatment': 'sliding', 'input_ascii': self.f_input, 'output_folder': self.folder,
+            'window_sizes': '{3}', 'metrics': '{N-valid}', 'shape': 'FUNCTIONAL', 'friction': self.f_friction}))
+
+
+class FunctionalWindowCacheTest(FunctionalTestCase):
+
+    def setUp(self):
+        FunctionalTestCase.setUp(self)
+        self.getCacheDir = ChloeCache.__dict__['getCacheDir']
+        self.getCacheSize = ChloeCache.__dict__['getCacheSize']
+        ChloeCache.getCacheDir = staticmethod(lambda: self.path('cache'))
+        ChloeCache.getCacheSize = staticmethod(lambda: 1)
+        self.window = FunctionalWindow(Friction(self.f_friction), 3, 10.0)
+        self.grid = AsciiGrid(self.f_input)
+
+    def tearDown(self):
+        ChloeCache.getCacheDir = self.getCacheDir
+        ChloeCache.getCacheSize = self.getCacheSize
+        FunctionalTestCase.tearDown(self)
+
+    def test_reuse(self):
+        frictions = np.array([[[1, 3, 1], [1, 1, 3], [-1, 1, 1]],
+                              [[1, 1, 1], [1, 3, 1], [1, 1, 1]]], dtype=np.float64)
+        cache = FunctionalWindowCache.open(self.window, self.grid, self.f_friction)
+        masks = cache.getMasks(np.array([5, 9]), frictions, -1)
+        cache.close()
+
+        # another run reads the windows of the cells from the disk, without computing them
+        cache = FunctionalWindowCache.open(self.window, self.grid, self.f_friction)
+        self.window.getMasks = lambda frictions, nodata: self.fail('window computed again')
+        self.assertEqual(cache.getMasks(np.array([5, 9]), frictions, -1).tolist(), masks.tolist())
+        cache.close()
+
+    def test_key(self):
+        key = FunctionalWindowCache.getKey(self.window, self.grid, self.f_friction)
+        with open(self.f_friction, 'w') as fd:
+            fd.write('code;friction\n1;1\n2;2\n3;3\n')
+        self.assertNotEqual(FunctionalWindowCache.getKey(self.window, self.grid, self.f_friction), key)
+        self.assertNotEqual(FunctionalWindowCache.getKey(FunctionalWindow(Friction(self.f_friction), 5, 10.0),
+                                                         self.grid, self.f_friction), key)
+
+    def test_disabled(self):
+        ChloeCache.getCacheSize = staticmethod(lambda: 0)
+        self.assertIsNone(FunctionalWindowCache.open(self.window, self.grid, self.f_friction))
+        self.assertFalse(os.path.isdir(self.path('cache')))
+
+    def test_sliding(self):
+        # the outputs are the same with the windows of the cache
+        properties = {
+            'treatment': 'sliding', 'input_ascii': self.f_input, 'output_folder': self.folder,
+            'window_sizes': '{3}', 'metrics': '{N-valid}', 'shape': 'FUNCTIONAL', 'friction': self.f_friction,
+            'export_csv': 'false', 'export_ascii': 'true'}
+        for run in range(2):
+            self.runEngine(SlidingEngine, properties)
+            self.assertAscii('in_fn_w3_N-valid_d_1.asc', ['4 6 6 4', '4 6 7 5', '1 1 0 4', '1 1 1 2'])
+        self.assertEqual(len(os.listdir(self.path('cache'))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+# coding=utf-8
+"""Tests of the native grid engine."""
+
+import unittest
+
+from ..engine.grid_engine import GridEngine
+from .utilities import EngineTestCase
+
+
+class GridEngineTest(EngineTestCase):
+
+    def test_grid(self):
+        self.runEngine(GridEngine, {
+            'treatment': 'grid', 'input_ascii': self.f_input, 'grid_sizes': '{2}',
+            'metrics': '{N-valid;average;NV_2}', 'output_csv': self.path('grid.csv'),
+            'output_asc': self.path('grid_'), 'export_csv': 'true', 'export_ascii': 'true'})
+        header = ['ncols 2', 'nrows 2', 'xllcorner 0.0', 'yllcorner 0.0', 'cellsize 20.0', 'NODATA_value -1']
+        self.assertAscii('grid_N-valid.asc', ['4 4', '4 3'], header)
+        self.assertAscii('grid_average.asc', ['1 2', '3 2.33333'], header)
+        self.assertAscii('grid_NV_2.asc', ['0 4', '0 2'], header)
+        self.assertText('grid.csv', [
+            'X;Y;N-valid;NV_2;average',
+            '10.0;30.0;4;0;1', '30.0;30.0;4;4;2', '10.0;10.0;4;0;3', '30.0;10.0;3;2;2.33333'])
+
+
+if __name__ == '__main__':
+    unittest.main()
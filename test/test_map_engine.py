@@ -0,0 +1,30 @@
+# coding=utf-8
+"""Tests of the native map engine."""
+
+import unittest
+
+from ..engine.map_engine import MapEngine
+from .utilities import EngineTestCase
+
+
+class MapEngineTest(EngineTestCase):
+
+    def test_map(self):
+        self.runEngine(MapEngine, {
+            'treatment': 'map', 'input_ascii': self.f_input, 'output_csv': self.path('map.csv'),
+            'metrics': '{N-valid;Nclass;SHDI;NV_3}'})
+        # SHDI of the proportions 4/15, 6/15 and 5/15
+        self.assertText('map.csv', ['name;N-valid;NV_3;Nclass;SHDI', 'in.asc;15;5;3;1.08519'])
+
+    def test_couples(self):
+        self.runEngine(MapEngine, {
+            'treatment': 'map', 'input_ascii': self.f_input, 'output_csv': self.path('map.csv'),
+            'metrics': '{NC-total;NC-valid;NC-homo;NC-hete;E-hete;NC_1-2;pNC_1-2}'})
+        # 24 couples of a cell with its left or upper neighbour, 4 with the nodata cell,
+        # 5 of two classes: 1-2 twice, 2-3 once, 1-3 twice
+        self.assertText('map.csv', ['name;E-hete;NC-hete;NC-homo;NC-total;NC-valid;NC_1-2;pNC_1-2',
+                                    'in.asc;50;5;15;24;20;2;0.10000'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,22 @@
+# coding=utf-8
+"""Tests of the native overlay engine."""
+
+import unittest
+
+from ..engine.overlay_engine import OverlayEngine
+from .utilities import HEADER, EngineTestCase
+
+
+class OverlayEngineTest(EngineTestCase):
+
+    def test_overlay(self):
+        f_over = self.writeAscii('over.asc', HEADER, ['0 0 0 0', '5 5 -1 -1', '0 0 0 0', '6 -1 6 -1'])
+        self.runEngine(OverlayEngine, {
+            'treatment': 'overlay', 'overlaying_matrix': self.f_input + ';' + f_over,
+            'output_asc': self.path('overlay.asc')})
+        self.assertAscii('overlay.asc', ['1.0 1.0 2.0 2.0 ', '1.0 1.0 2.0 2.0 ',
+                                         '3.0 3.0 0.0 2.0 ', '3.0 3.0 3.0 2.0 '])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+# coding=utf-8
+"""Tests of the native search and replace engine."""
+
+import unittest
+
+from ..engine.search_and_replace_engine import SearchAndReplaceEngine
+from .utilities import EngineTestCase, RecordingProgress
+
+
+class SearchAndReplaceEngineTest(EngineTestCase):
+
+    def test_search_and_replace(self):
+        self.runEngine(SearchAndReplaceEngine, {
+            'treatment': 'search and replace', 'input_ascii': self.f_input, 'output_asc': self.path('replaced.asc'),
+            'changes': '{(1,5);(3,7.5)}', 'nodata_value': '-1'})
+        # the values replaced are written as doubles, the others as they are read
+        self.assertAscii('replaced.asc', ['5.0 5.0 2 2 ', '5.0 5.0 2 2 ', '7.5 7.5 -1 2 ', '7.5 7.5 7.5 2 '])
+
+    def test_progress(self):
+        header = ['ncols 1', 'nrows 2994', 'xllcorner 0.0', 'yllcorner 0.0', 'cellsize 10.0', 'NODATA_value -1']
+        f_input = self.writeAscii('long.asc', header, ['1'] * 2994)
+        progress = RecordingProgress()
+        SearchAndReplaceEngine.run({
+            'treatment': 'search and replace', 'input_ascii': f_input, 'output_asc': self.path('replaced.asc'),
+            'changes': '{(1,5)}', 'nodata_value': '-1'}, progress)
+        # every 1000 lines, from the bytes of the lines read
+        with open(f_input) as fd:
+            lines = fd.readlines()
+        size = float(sum(len(line) for line in lines))
+        self.assertEqual(progress.percentages, [int(100 * sum(len(line) for line in lines[:count]) / size)
+                                                for count in (1000, 2000, 3000)])
+        self.assertEqual(progress.percentages[-1], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+# coding=utf-8
+"""Tests of the native selected treatment: the metrics of the windows around the selected pixels."""
+
+import os
+import unittest
+
+from ..engine.selected_engine import SelectedEngine
+from .utilities import EngineTestCase
+
+
+class SelectedEngineTest(EngineTestCase):
+
+    def test_pixels(self):
+        with open(self.path('pixels.csv'), 'w') as fd:
+            fd.write('X;Y\n1;1\n3;3\n0;0\n1;1\n')
+        self.runEngine(SelectedEngine, {
+            'treatment': 'selected', 'input_ascii': self.f_input, 'output_folder': self.folder,
+            'pixels': self.path('pixels.csv'), 'window_sizes': '{3}', 'metrics': '{N-valid;sum}',
+            'shape': 'SQUARE', 'export_csv': 'true', 'export_ascii': 'true'})
+        # the pixels are sorted and kept once, their metrics are the ones of the sliding windows
+        self.assertText('in_sq.csv', ['X;Y;N-valid;sum', '5.0;35.0;4;4', '15.0;25.0;8;14', '35.0;5.0;3;7'])
+        self.assertAscii('in_sq_w3_sum.asc', ['4 -1 -1 -1', '-1 14 -1 -1', '-1 -1 -1 -1', '-1 -1 -1 7'])
+        self.assertEqual(sorted(os.listdir(self.path('filters'))),
+                         ['in_square_3_15.0-25.0.asc', 'in_square_3_35.0-5.0.asc', 'in_square_3_5.0-35.0.asc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# coding=utf-8
+"""Tests of the native sliding engine."""
+
+import unittest
+
+from ..engine.sliding_engine import SlidingEngine
+from .utilities import EngineTestCase
+
+
+class SlidingEngineTest(EngineTestCase):
+
+    def test_square(self):
+        self.runEngine(SlidingEngine, {
+            'treatment': 'sliding', 'input_ascii': self.f_input, 'output_folder': self.folder,
+            'window_sizes': '{3}', 'metrics': '{N-valid;sum}', 'shape': 'SQUARE',
+            'export_csv': 'true', 'export_ascii': 'true'})
+        # the windows are cut by the border of the raster and the nodata cell is not valid
+        self.assertAscii('in_sq_w3_N-valid_d_1.asc', ['4 6 6 4', '6 8 8 5', '6 8 8 5', '4 5 5 3'])
+        self.assertAscii('in_sq_w3_sum_d_1.asc', ['4 8 10 8', '10 14 15 10', '14 19 18 11', '12 15 13 7'])
+        self.assertText('in_sq.csv', [
+            'X;Y;N-valid;sum',
+            '5.0;35.0;4;4', '15.0;35.0;6;8', '25.0;35.0;6;10', '35.0;35.0;4;8',
+            '5.0;25.0;6;10', '15.0;25.0;8;14', '25.0;25.0;8;15', '35.0;25.0;5;10',
+            '5.0;15.0;6;14', '15.0;15.0;8;19', '25.0;15.0;8;18', '35.0;15.0;5;11',
+            '5.0;5.0;4;12', '15.0;5.0;5;15', '25.0;5.0;5;13', '35.0;5.0;3;7'])
+
+    def test_nclass(self):
+        self.runEngine(SlidingEngine, {
+            'treatment': 'sliding', 'input_ascii': self.f_input, 'output_folder': self.folder,
+            'window_sizes': '{3}', 'metrics': '{Nclass}', 'shape': 'SQUARE',
+            'export_csv': 'false', 'export_ascii': 'true'})
+        self.assertAscii('in_sq_w3_Nclass_d_1.asc', ['1 2 2 1', '2 3 3 1', '2 3 3 2', '1 1 2 2'])
+
+    def test_couples(self):
+        self.runEngine(SlidingEngine, {
+            'treatment': 'sliding', 'input_ascii': self.f_input, 'output_folder': self.folder,
+            'window_sizes': '{3}', 'metrics': '{NC-total;NC-valid}', 'shape': 'SQUARE',
+            'export_csv': 'false', 'export_ascii': 'true'})
+        # a couple is counted when the neighbour is in the window, even out of the raster:
+        # 12 in the whole windows, 10 = 4 + 6 in the top ones and 6 = 4 + 2 in the left ones
+        self.assertAscii('in_sq_w3_NC-total_d_1.asc', ['8 10 10 6', '10 12 12 7', '10 12 12 7', '6 7 7 4'])
+        # without the couples with the nodata cell or with the outside of the raster
+        self.assertAscii('in_sq_w3_NC-valid_d_1.asc', ['4 7 7 4', '7 10 9 5', '7 9 8 4', '4 5 4 2'])
+
+    def test_circle(self):
+        self.runEngine(SlidingEngine, {
+            'treatment': 'sliding', 'input_ascii': self.f_input, 'output_folder': self.folder,
+            'window_sizes': '{3}', 'metrics': '{N-valid;sum}', 'shape': 'CIRCLE',
+            'export_csv': 'false', 'export_ascii': 'true'})
+        # the disk of diameter 3 is the cell and its 4 neighbours
+        self.assertAscii('in_cr_w3_N-valid_d_1.asc', ['3 4 4 3', '4 5 4 4', '4 4 4 3', '3 4 3 3'])
+        self.assertAscii('in_cr_w3_sum_d_1.asc', ['3 5 7 6', '6 8 7 8', '10 10 10 6', '9 12 8 7'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
 # coding=utf-8
 """Common functionality used by regression tests."""
 
+import os
 import sys
+import shutil
 import logging
+import tempfile
+import unittest
 
 
 LOGGER = logging.getLogger('QGIS')
@@ -59,3 +63,66 @@ def get_qgis_app():
         IFACE = QgisInterface(CANVAS)
 
     return QGIS_APP, CANVAS, IFACE, PARENT
+
+
+class RecordingProgress(object):
+    """Progress object of Processing keeping what a run reports"""
+
+    def __init__(self):
+        self.percentages = []
+        self.infos = []
+        self.commands = []
+        self.console = []
+
+    def setPercentage(self, percentage):
+        self.percentages.append(percentage)
+
+    def setInfo(self, msg):
+        self.infos.append(msg)
+
+    def setCommand(self, cmd):
+        self.commands.append(cmd)
+
+    def setConsoleInfo(self, msg):
+        self.console.append(msg)
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+HEADER = ['ncols 4', 'nrows 4', 'xllcorner 0.0', 'yllcorner 0.0', 'cellsize 10.0', 'NODATA_value -1']
+
+# Input of the engine tests: classes 1, 2 and 3 around a nodata cell
+INPUT = ['1 1 2 2',
+         '1 1 2 2',
+         '3 3 -1 2',
+         '3 3 3 2']
+
+
+class EngineTestCase(unittest.TestCase):
+    """Run a native engine in a temporary folder holding in.asc (INPUT)"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp(prefix='chloe_test')
+        self.f_input = self.writeAscii('in.asc', HEADER, INPUT)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def writeAscii(self, name, header, rows):
+        with open(self.path(name), 'w') as fd:
+            fd.write('\n'.join(header + rows) + '\n')
+        return self.path(name)
+
+    def runEngine(self, engine, properties):
+        self.assertIsNone(engine.check(properties))
+        engine.run(properties, RecordingProgress())
+
+    def assertText(self, name, lines):
+        with open(self.path(name)) as fd:
+            self.assertEqual(fd.read().split('\n'), lines + [''])
+
+    def assertAscii(self, name, rows, header=HEADER):
+        self.assertText(name, header + rows)